@@ -0,0 +1,181 @@
+import hashlib
+import os
+import sqlite3
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+# 資料集版本雜湊的資料表 (_03 建立或更新資料庫時寫入)
+DATASET_VERSION_TABLE = "dataset_version"
+
+# 衍生資料表各型號內容雜湊的資料表 (增量更新時只重新計算有變動的型號)
+DATASET_DIGEST_TABLE = "dataset_digest"
+
+# 快取的命中統計 (同 functools.lru_cache 的 cache_info)
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"])
+
+# get_or_compute 判斷沒有快取用 (快取的值可以是 None)
+_MISSING = object()
+
+
+class LRUCache:
+    """固定大小的 LRU 快取 (超過 maxsize 時移除最久未使用的項目), 記錄命中與未命中次數"""
+
+    def __init__(self, maxsize=128):
+        """
+        參數:
+            maxsize: 最多快取的項目數 (0 表示不快取)
+        """
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """取得快取的值 (會計入命中 / 未命中次數)"""
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """加入快取, 超過大小時移除最久未使用的項目"""
+        if self.maxsize <= 0:
+            return value
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """
+        取得快取的值, 沒有時呼叫 compute() 計算並加入快取
+
+        參數:
+            key: 快取鍵
+            compute: 沒有快取時的計算函式 (不帶參數)
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        """清除所有項目 (命中統計保留)"""
+        self._items.clear()
+
+    def info(self):
+        """命中統計 (CacheInfo)"""
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._items))
+
+
+def reference_digests(name, table):
+    """
+    衍生資料表各型號的內容雜湊 (與資料列順序無關)
+
+    數值欄位一律以 float64 計算, 只含部分型號的計算結果 (增量更新) 與完整資料的結果
+    欄位型別不同時 (例如有無缺失值), 內容相同的型號仍得到相同的雜湊。
+
+    參數:
+        name: 資料表名稱
+        table: 含 ref 欄位的 DataFrame (剛計算完成、寫入資料庫的內容)
+
+    回傳:
+        DataFrame, 欄位為 table_name、ref、digest (每個型號一列)
+    """
+    values = pd.DataFrame({
+        column: series.astype(float) if pd.api.types.is_numeric_dtype(series)
+        else series.astype(object).where(series.notna(), None)
+        for column, series in table.items()
+    })
+    rows = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    refs = table["ref"].astype(str).to_numpy()
+
+    # 依 (型號, 列雜湊) 排序後, 每個型號的列雜湊為連續的一段
+    order = np.lexsort((rows, refs))
+    refs, rows = refs[order], rows[order]
+    starts = np.flatnonzero(np.r_[True, refs[1:] != refs[:-1]]) if len(refs) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(refs)]
+    header = repr(list(table.columns)).encode()
+    return pd.DataFrame({
+        "table_name": name,
+        "ref": pd.Series(refs[starts], dtype=object),
+        "digest": [hashlib.sha256(header + rows[start:end].tobytes()).hexdigest()
+                   for start, end in zip(starts, ends)],
+    })
+
+
+def dataset_version(row_hash, digests=None):
+    """
+    資料集的版本雜湊 (與資料列順序無關, 內容相同的資料集得到相同版本)
+
+    參數:
+        row_hash: 各筆資料的 row_hash (int64 陣列)
+        digests: 衍生資料表各型號的內容雜湊 (reference_digests 的結果, 一併列入版本;
+            預設 None 表示只用 row_hash)
+
+    回傳:
+        16 個字元的十六進位字串
+    """
+    row_hash = np.sort(np.asarray(row_hash, dtype=np.int64))
+    digest = hashlib.sha256(row_hash.tobytes())
+    if digests is not None:
+        for table, ref, ref_digest in sorted(zip(digests["table_name"], digests["ref"], digests["digest"])):
+            digest.update(f"{table}\t{ref}\t{ref_digest}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def write_dataset_version(connection, version):
+    """寫入資料集版本雜湊 (取代原本的版本)"""
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {DATASET_VERSION_TABLE} (version TEXT)")
+    connection.execute(f"DELETE FROM {DATASET_VERSION_TABLE}")
+    connection.execute(f"INSERT INTO {DATASET_VERSION_TABLE} VALUES (?)", (version,))
+
+
+def file_signature(path):
+    """檔案的 (大小, 修改時間) (檔案不存在時為 None), 用來快速判斷檔案是否變動"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_dataset_version(db_path):
+    """
+    讀取資料庫的資料集版本雜湊
+
+    舊版資料庫沒有版本資料表時, 改以檔案大小與修改時間的雜湊作為版本
+    (資料庫有任何變動都視為新版本)。
+
+    參數:
+        db_path: SQLite 檔案路徑
+
+    回傳:
+        版本字串
+    """
+    connection = sqlite3.connect(db_path)
+    try:
+        row = connection.execute(f"SELECT version FROM {DATASET_VERSION_TABLE}").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        connection.close()
+    if row is not None:
+        return row[0]
+    signature = repr(file_signature(db_path)).encode()
+    return "file-" + hashlib.sha256(signature).hexdigest()[:16]
@@ -0,0 +1,363 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# 資料筆數達此數量的型號才擬合 (同 _05 的 MIN_REGRESSION_SAMPLES)
+MIN_FIT_SAMPLES = 10
+
+# 交叉驗證的折數與亂數種子 (每個型號使用相同的分組方式, 結果可重現)
+CV_FOLDS = 5
+CV_SEED = 0
+
+# 交叉驗證最多使用的資料筆數 (超過時固定種子抽樣; 選出的模型仍以全部資料擬合)
+CV_MAX_POINTS = 20_000
+
+# Huber 的調整常數 (常態分布下 95% 效率) 與 IRLS 的最多迭代次數
+HUBER_K = 1.345
+HUBER_MAX_ITER = 50
+
+# Theil-Sen 兩兩配對的最多資料筆數 (超過時固定種子抽樣, 配對數約 8 萬)
+THEIL_SEN_MAX_POINTS = 400
+
+# 分段線性的轉折點候選數 (錶齡的分位數)
+PIECEWISE_KNOTS = 15
+
+# 超過時間預算後只擬合的模型 (最便宜且預測價格一定為正)
+FALLBACK_MODEL = "log_linear"
+
+# 每個程序分到的工作數 (型號大小不一, 切細一點各程序的負載較平均)
+CHUNKS_PER_JOB = 4
+
+
+# ===================================================
+#  模型
+# ===================================================
+
+def _log_price(price):
+    """價格取 log (小於 1 的價格視為 1)"""
+    return np.log(np.maximum(price, 1.0))
+
+
+def _ols(x, y, weights=None):
+    """(加權) 最小平方法直線, x 全部相同時回傳 None"""
+    w = np.ones_like(x) if weights is None else weights
+    total = w.sum()
+    x_mean = (w * x).sum() / total
+    y_mean = (w * y).sum() / total
+    sxx = (w * (x - x_mean) ** 2).sum()
+    if sxx <= 0:
+        return None
+    slope = (w * (x - x_mean) * (y - y_mean)).sum() / sxx
+    return {"intercept": y_mean - slope * x_mean, "slope": slope}
+
+
+def fit_linear(age, price):
+    """價格 = intercept + slope * 錶齡 (原本的線性迴歸)"""
+    return _ols(age, price)
+
+
+def predict_linear(params, age):
+    return params["intercept"] + params["slope"] * age
+
+
+def fit_log_linear(age, price):
+    """log(價格) = intercept + slope * 錶齡 (固定年變化率, 預測價格一定為正)"""
+    return _ols(age, _log_price(price))
+
+
+def predict_log_line(params, age):
+    return np.exp(params["intercept"] + params["slope"] * age)
+
+
+def fit_huber(age, price):
+    """log(價格) 的 Huber 穩健迴歸 (IRLS, 以 MAD 估計尺度), 降低極端價格的影響"""
+    y = _log_price(price)
+    params = _ols(age, y)
+    if params is None:
+        return None
+
+    for _ in range(HUBER_MAX_ITER):
+        residual = y - predict_linear(params, age)
+        scale = np.median(np.abs(residual - np.median(residual))) / 0.6745
+        if scale <= 0:
+            break
+        weights = np.minimum(1.0, HUBER_K / np.maximum(np.abs(residual) / scale, 1e-12))
+        updated = _ols(age, y, weights)
+        if updated is None:
+            break
+        converged = abs(updated["slope"] - params["slope"]) <= 1e-8 * abs(params["slope"]) + 1e-12
+        params = updated
+        if converged:
+            break
+    return params
+
+
+def fit_theil_sen(age, price):
+    """log(價格) 的 Theil-Sen 直線 (兩兩配對斜率的中位數, 截距同 scipy.stats.theilslopes)"""
+    y = _log_price(price)
+    x = age
+    if len(x) > THEIL_SEN_MAX_POINTS:
+        pick = np.random.default_rng(CV_SEED).choice(len(x), THEIL_SEN_MAX_POINTS, replace=False)
+        x, y = x[pick], y[pick]
+
+    i, j = np.triu_indices(len(x), k=1)
+    dx = x[j] - x[i]
+    distinct = dx != 0
+    if not distinct.any():
+        return None
+    slope = np.median((y[j] - y[i])[distinct] / dx[distinct])
+    return {"intercept": np.median(_log_price(price)) - slope * np.median(age), "slope": slope}
+
+
+def fit_piecewise(age, price):
+    """log(價格) 的兩段連續折線 (轉折點取 SSE 最小的錶齡分位數), 例如新錶快速貶值後趨於平穩"""
+    ages, codes = np.unique(age, return_inverse=True)
+    if len(ages) < 3:
+        return None
+
+    # 同錶齡的資料以平均值加權擬合, 係數與逐筆擬合相同
+    counts = np.bincount(codes).astype(float)
+    means = np.bincount(codes, weights=_log_price(price)) / counts
+
+    # 所有候選轉折點一次求解加權正規方程式 (轉折點在內部錶齡, 設計矩陣必為滿秩)
+    knots = np.unique(np.quantile(ages[1:-1], np.linspace(0, 1, PIECEWISE_KNOTS)))
+    design = np.stack(np.broadcast_arrays(
+        np.ones_like(ages), ages, np.maximum(ages - knots[:, None], 0)
+    ), axis=-1)
+    weighted = design * counts[:, None]
+    coef = np.linalg.solve(weighted.transpose(0, 2, 1) @ design,
+                           (weighted.transpose(0, 2, 1) @ means)[..., None])[..., 0]
+    sse = (counts * (means - np.einsum("kaj,kj->ka", design, coef)) ** 2).sum(axis=1)
+
+    best = np.argmin(sse)
+    intercept, slope, slope_after = coef[best]
+    return {"intercept": intercept, "slope": slope, "slope_after": slope_after, "knot": knots[best]}
+
+
+def predict_piecewise(params, age):
+    return np.exp(params["intercept"] + params["slope"] * age
+                  + params["slope_after"] * np.maximum(age - params["knot"], 0))
+
+
+def fit_isotonic(age, price):
+    """
+    log(價格) 的單調 (保序) 迴歸: 各錶齡平均值以 PAVA 合併成單調遞增或遞減的階梯,
+    方向依 log-linear 斜率的正負
+    """
+    ages, codes = np.unique(age, return_inverse=True)
+    if len(ages) < 2:
+        return None
+    y = _log_price(price)
+    weights = np.bincount(codes).astype(float)
+    means = np.bincount(codes, weights=y) / weights
+
+    increasing = fit_log_linear(age, price)["slope"] >= 0
+    values = means if increasing else -means
+
+    # Pool Adjacent Violators: 相鄰違反單調的區塊合併成加權平均
+    block_value, block_weight, block_size = [], [], []
+    for value, weight in zip(values, weights):
+        block_value.append(value)
+        block_weight.append(weight)
+        block_size.append(1)
+        while len(block_value) > 1 and block_value[-2] > block_value[-1]:
+            weight = block_weight[-2] + block_weight[-1]
+            value = (block_value[-2] * block_weight[-2] + block_value[-1] * block_weight[-1]) / weight
+            size = block_size[-2] + block_size[-1]
+            del block_value[-1], block_weight[-1], block_size[-1]
+            block_value[-1], block_weight[-1], block_size[-1] = value, weight, size
+
+    fitted = np.repeat(block_value, block_size)
+    return {"ages": ages.tolist(), "values": (fitted if increasing else -fitted).tolist()}
+
+
+def predict_isotonic(params, age):
+    # 錶齡之間線性內插, 範圍外維持端點的值
+    return np.exp(np.interp(age, params["ages"], params["values"]))
+
+
+# 候選模型: 名稱 -> (fit(age, price) -> params 或 None, predict(params, age) -> 價格)
+# 依序比較, 誤差相同時保留前面 (較簡單) 的模型
+MODELS = {
+    "linear": (fit_linear, predict_linear),
+    "log_linear": (fit_log_linear, predict_log_line),
+    "huber": (fit_huber, predict_log_line),
+    "theil_sen": (fit_theil_sen, predict_log_line),
+    "piecewise": (fit_piecewise, predict_piecewise),
+    "isotonic": (fit_isotonic, predict_isotonic),
+}
+
+
+def predict(model, params, age):
+    """
+    以擬合結果預測價格
+
+    參數:
+        model: MODELS 中的模型名稱
+        params: 模型參數 (dict, 或 depreciation_model 資料表中的 JSON 字串)
+        age: 錶齡 (純量或陣列)
+
+    回傳:
+        預測價格 (同 age 的形狀)
+    """
+    if isinstance(params, str):
+        params = json.loads(params)
+    return MODELS[model][1](params, np.asarray(age, dtype=float))
+
+
+# ===================================================
+#  模型選擇
+# ===================================================
+
+def cv_error(model, age, price, folds=CV_FOLDS, seed=CV_SEED):
+    """
+    K-fold 交叉驗證的預測誤差 (log 價格的平均絕對誤差, 約等於平均百分比誤差)
+
+    參數:
+        model: MODELS 中的模型名稱
+        age: 錶齡陣列
+        price: 價格陣列
+        folds: 折數
+        seed: 分組的亂數種子
+
+    回傳:
+        誤差 (有任何一折無法擬合時為 inf)
+    """
+    fit, model_predict = MODELS[model]
+    fold = np.random.default_rng(seed).permutation(len(age)) % folds
+    log_price = _log_price(price)
+
+    errors = np.empty(len(age))
+    for k in range(folds):
+        test = fold == k
+        params = fit(age[~test], price[~test])
+        if params is None:
+            return np.inf
+        errors[test] = np.abs(_log_price(model_predict(params, age[test])) - log_price[test])
+    return errors.mean()
+
+
+def _json_params(params):
+    """模型參數轉成 JSON (numpy 純量轉為 Python 數值)"""
+    return json.dumps({key: value if isinstance(value, list) else float(value)
+                       for key, value in params.items()})
+
+
+def select_model(age, price, models=None):
+    """
+    比較候選模型的交叉驗證誤差 (最多 CV_MAX_POINTS 筆), 以全部資料重新擬合誤差最小的模型
+
+    參數:
+        age: 錶齡陣列
+        price: 價格陣列
+        models: 候選模型名稱 (預設為 MODELS 全部)
+
+    回傳:
+        dict: model、cv_error、params (JSON 字串)、errors (各模型的誤差 JSON 字串);
+        沒有可擬合的模型時為 None
+    """
+    age = np.asarray(age, dtype=float)
+    price = np.asarray(price, dtype=float)
+
+    sample = slice(None)
+    if len(age) > CV_MAX_POINTS:
+        sample = np.random.default_rng(CV_SEED).choice(len(age), CV_MAX_POINTS, replace=False)
+    errors = {name: cv_error(name, age[sample], price[sample]) for name in (models or MODELS)}
+
+    best = min(errors, key=errors.get)
+    if not np.isfinite(errors[best]):
+        return None
+    params = MODELS[best][0](age, price)
+    return {
+        "model": best,
+        "cv_error": errors[best],
+        "params": _json_params(params),
+        "errors": json.dumps({name: float(error) for name, error in errors.items()}),
+    }
+
+
+# ===================================================
+#  所有型號
+# ===================================================
+
+def _fit_chunk(args):
+    """平行處理用: 擬合一組型號 (超過 deadline 後只擬合 FALLBACK_MODEL)"""
+    refs, offsets, age, price, models, deadline = args
+
+    rows = []
+    for ref, start, end in zip(refs, offsets[:-1], offsets[1:]):
+        candidates = models
+        if deadline is not None and time.time() > deadline:
+            candidates = [FALLBACK_MODEL]
+        result = select_model(age[start:end], price[start:end], candidates)
+        if result is None:
+            continue
+        result.update(ref=ref, n=end - start, n_candidates=len(candidates))
+        rows.append(result)
+    return rows
+
+
+def fit_references(df, models=None, n_jobs=1, time_budget=None):
+    """
+    擬合所有型號的折舊模型並選出各型號誤差最小的模型 (depreciation_model 資料表)
+
+    型號依資料筆數平均分成數組, 以多個程序平行擬合。設定 time_budget 時,
+    超過時間後剩下的型號只擬合 FALLBACK_MODEL, 整體時間約為預算加上最後一組的擬合時間。
+
+    參數:
+        df: 含 reference number、age、price 的資料
+        models: 候選模型名稱 (預設為 MODELS 全部)
+        n_jobs: 平行處理的程序數 (預設 1 表示不平行)
+        time_budget: 時間預算 (秒, 預設 None 表示不限制)
+
+    回傳:
+        depreciation_model 資料表 (依 ref 排序), 欄位為 ref、n、model、cv_error、linear_cv_error、
+        n_candidates (實際比較的模型數)、params (JSON)、errors (各模型誤差 JSON)
+    """
+    models = list(models or MODELS)
+    deadline = None if time_budget is None else time.time() + time_budget
+
+    # 依型號排列, 每個型號的資料為連續區段; 區段內依 (錶齡, 價格) 排序,
+    # 交叉驗證的分組只取決於資料內容, 與資料列順序無關 (增量更新與完整重建結果相同)
+    codes, refs = pd.factorize(df["reference number"])
+    age = df["age"].to_numpy(dtype=float)
+    price = df["price"].to_numpy(dtype=float)
+    order = np.lexsort((price, age, codes))
+    age, price = age[order], price[order]
+    counts = np.bincount(codes, minlength=len(refs))
+    starts = np.cumsum(counts) - counts
+    eligible = np.flatnonzero(counts >= MIN_FIT_SAMPLES)
+
+    # 依資料筆數把型號平均分給各組 (大的型號先分)
+    n_chunks = max(1, min(len(eligible), n_jobs * CHUNKS_PER_JOB if n_jobs > 1 else 1))
+    chunks = [[] for _ in range(n_chunks)]
+    loads = np.zeros(n_chunks)
+    for code in eligible[np.argsort(-counts[eligible], kind="stable")]:
+        chunk = np.argmin(loads)
+        chunks[chunk].append(code)
+        loads[chunk] += counts[code]
+
+    tasks = []
+    for chunk in chunks:
+        chunk = np.sort(np.asarray(chunk, dtype=np.int64))
+        index = np.concatenate([np.arange(starts[c], starts[c] + counts[c]) for c in chunk]) \
+            if len(chunk) else np.array([], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts[chunk])])
+        tasks.append(([refs[c] for c in chunk], offsets, age[index], price[index], models, deadline))
+
+    if n_jobs <= 1 or n_chunks == 1:
+        parts = [_fit_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(_fit_chunk, tasks))
+
+    columns = ["ref", "n", "model", "cv_error", "linear_cv_error", "n_candidates", "params", "errors"]
+    table = pd.DataFrame([row for part in parts for row in part])
+    if table.empty:
+        return pd.DataFrame(columns=columns)
+    table["linear_cv_error"] = [json.loads(errors).get("linear", np.nan) for errors in table["errors"]]
+    table["ref"] = table["ref"].astype(object)
+    return table[columns].sort_values("ref", ignore_index=True)
@@ -0,0 +1,188 @@
+import json
+from bisect import bisect_left
+from collections import Counter
+
+# 型號建議索引的預設儲存路徑
+REFERENCE_INDEX_PATH = "data/reference_index.json"
+
+# n-gram 長度與比對的候選數量
+NGRAM_SIZE = 3
+MAX_CANDIDATES = 50
+
+
+def normalize_reference(ref):
+    """型號正規化 (去除前後空白並轉大寫)"""
+    return str(ref).strip().upper()
+
+
+def reference_ngrams(ref, n=NGRAM_SIZE):
+    """
+    型號的 n-gram 集合 (前後加上邊界符號, 讓開頭與結尾的字元也有權重)
+
+    參數:
+        ref: 正規化後的型號
+        n: n-gram 長度
+    """
+    padded = "^" * (n - 1) + ref + "$" * (n - 1)
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def edit_distance(a, b, max_distance=None):
+    """
+    兩個字串的編輯距離 (插入、刪除、取代與相鄰字元對調各算 1)
+
+    參數:
+        a, b: 字串
+        max_distance: 超過此距離時提早結束並回傳 max_distance + 1
+
+    回傳:
+        編輯距離
+    """
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            # 相鄰字元對調 (例如 LN / NL)
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class ReferenceIndex:
+    """型號建議索引: 前綴查詢 (排序後二分搜尋) 與 n-gram + 編輯距離的相近型號排序"""
+
+    def __init__(self, counts, ngram_size=NGRAM_SIZE, postings=None):
+        """
+        初始化索引
+
+        參數:
+            counts: 型號 -> 資料筆數 (dict 或 Series)
+            ngram_size: n-gram 長度
+            postings: 已建立的 n-gram 倒排索引 (載入時使用, 預設重新建立)
+        """
+        merged = Counter()
+        for ref, count in dict(counts).items():
+            merged[normalize_reference(ref)] += int(count)
+
+        # 依字典順序排列, 同前綴的型號會是連續區段
+        self.references = sorted(merged)
+        self.counts = [merged[ref] for ref in self.references]
+        self.ngram_size = ngram_size
+
+        if postings is None:
+            postings = {}
+            for i, ref in enumerate(self.references):
+                for gram in reference_ngrams(ref, ngram_size):
+                    postings.setdefault(gram, []).append(i)
+        self.postings = postings
+
+    @classmethod
+    def from_database(cls, db_path="data/rolex.db"):
+        """以資料庫中各型號的筆數建立索引"""
+        import sqlite3
+
+        connection = sqlite3.connect(db_path)
+        rows = connection.execute(
+            "SELECT [reference number], COUNT(*) FROM rolex GROUP BY [reference number]"
+        ).fetchall()
+        connection.close()
+        return cls({ref: count for ref, count in rows if ref is not None})
+
+    @classmethod
+    def load(cls, path=REFERENCE_INDEX_PATH):
+        """從 save 儲存的檔案載入索引"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            dict(zip(data["references"], data["counts"])),
+            ngram_size=data["ngram_size"],
+            postings=data["postings"],
+        )
+
+    def save(self, path=REFERENCE_INDEX_PATH):
+        """
+        儲存索引 (JSON)
+
+        參數:
+            path: 檔案路徑
+        """
+        data = {
+            "ngram_size": self.ngram_size,
+            "references": self.references,
+            "counts": self.counts,
+            "postings": self.postings,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        print(f"資料已儲存至 {path}")
+
+    def __contains__(self, ref):
+        ref = normalize_reference(ref)
+        i = bisect_left(self.references, ref)
+        return i < len(self.references) and self.references[i] == ref
+
+    def __len__(self):
+        return len(self.references)
+
+    def with_prefix(self, prefix, limit=None):
+        """
+        列出以 prefix 開頭的所有型號 (例如 "1166" 列出所有 1166xx)
+
+        參數:
+            prefix: 型號前綴
+            limit: 最多回傳筆數 (預設 None 表示全部)
+
+        回傳:
+            (型號, 筆數) 列表, 依字典順序
+        """
+        prefix = normalize_reference(prefix)
+        start = bisect_left(self.references, prefix)
+        # 所有以 prefix 開頭的字串都小於 prefix + 最大字元
+        end = bisect_left(self.references, prefix + "\U0010ffff", lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return list(zip(self.references[start:end], self.counts[start:end]))
+
+    def suggest(self, query, limit=10, max_distance=3):
+        """
+        找出與 query 相近的型號 (例如 116610LV -> 116610LN)
+
+        先以共同 n-gram 數挑出候選型號, 再依編輯距離排序
+
+        參數:
+            query: 輸入的型號
+            limit: 最多回傳筆數
+            max_distance: 最大編輯距離
+
+        回傳:
+            (型號, 編輯距離, 筆數) 列表, 依距離由小到大、筆數由多到少排序
+        """
+        query = normalize_reference(query)
+        shared = Counter()
+        for gram in reference_ngrams(query, self.ngram_size):
+            shared.update(self.postings.get(gram, ()))
+
+        # 以前綴相同的型號補足候選 (查詢字串太短、沒有共同 n-gram 時)
+        candidates = [i for i, _ in shared.most_common(MAX_CANDIDATES)]
+        if len(candidates) < MAX_CANDIDATES:
+            start = bisect_left(self.references, query[:2])
+            for i in range(start, min(start + MAX_CANDIDATES, len(self.references))):
+                if i not in shared:
+                    candidates.append(i)
+
+        matches = []
+        for i in candidates:
+            distance = edit_distance(query, self.references[i], max_distance)
+            if distance <= max_distance:
+                matches.append((self.references[i], distance, self.counts[i]))
+        matches.sort(key=lambda match: (match[1], -match[2], match[0]))
+        return matches[:limit]
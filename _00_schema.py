@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+# 清理後資料集 (data.csv、data_clean.csv、rolex 資料表) 的欄位型別
+SCHEMA = {
+    # 文字欄位: 類別型別 (每筆只存類別編號)
+    "ad name": "category",
+    "model": "category",
+    "reference number": "category",
+    "movement": "category",
+    "case material": "category",
+    "condition": "category",
+    "scope of delivery": "category",
+    "location": "category",
+    "material_group": "category",
+    "country": "category",
+    # 價格
+    "price": "int32",
+    "aditional shipping price": "int32",
+    "ship_total": "int32",
+    # 年份、錶齡與尺寸
+    "year of production": "int16",
+    "age": "int16",
+    "case diameter": "float32",
+    # 配件與編碼欄位
+    "has_box": "int8",
+    "has_papers": "int8",
+    "full_set": "int8",
+    "movement_encoded": "int8",
+    "condition_encoded": "int8",
+    "material_group_encoded": "int8",
+    "country_encoded": "int8",
+}
+
+# 整數欄位含缺失值或非整數時改用的型別
+# (float32 只有 24 位元的尾數, 超過約 1,677 萬的價格與小數價格會被改變, widen_floats 也無法還原)
+MISSING_INT_DTYPE = "float64"
+
+
+def _int_fits(values, dtype):
+    """數值欄位是否沒有缺失值、皆為整數且在 dtype 的範圍內"""
+    if values.isna().any():
+        return False
+    if len(values) == 0:
+        return True
+    if not (values == values.round()).all():
+        return False
+    info = np.iinfo(dtype)
+    return info.min <= values.min() and values.max() <= info.max
+
+
+def schema_dtype(values, dtype):
+    """
+    欄位實際套用的型別
+
+    - category: 一律套用
+    - 整數: 沒有缺失值且皆為範圍內的整數時套用; 否則改用 MISSING_INT_DTYPE (float64, 超出範圍時維持原型別)
+    - 浮點數: 數值欄位才套用
+
+    參數:
+        values: 欄位資料 (Series)
+        dtype: SCHEMA 中宣告的型別
+
+    回傳:
+        要轉換的型別, 不轉換時為 None
+    """
+    if dtype == "category":
+        return None if isinstance(values.dtype, pd.CategoricalDtype) else dtype
+    if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return None
+    if dtype.startswith("int"):
+        if _int_fits(values, dtype):
+            return dtype
+        if values.isna().any() or not (values.dropna() == values.dropna().round()).all():
+            return MISSING_INT_DTYPE
+        return None
+    return dtype
+
+
+def apply_schema(df, schema=None):
+    """
+    套用欄位型別 (清理後降低記憶體用量, 或載入時確保型別一致)
+
+    參數:
+        df: 要轉換的 DataFrame
+        schema: 欄位型別對照 (預設為 SCHEMA), 不在對照中的欄位維持原型別
+
+    回傳:
+        轉換後的新 DataFrame
+    """
+    if schema is None:
+        schema = SCHEMA
+
+    casts = {}
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        target = schema_dtype(df[col], dtype)
+        if target is not None and df[col].dtype != target:
+            casts[col] = target
+
+    return df.astype(casts)
+
+
+def read_dtypes(columns, schema=None):
+    """
+    讀取 CSV 時可直接指定的型別 (只有類別欄位; 整數欄位可能含缺失值, 讀取後再轉換)
+
+    參數:
+        columns: 要讀取的欄位
+        schema: 欄位型別對照 (預設為 SCHEMA)
+
+    回傳:
+        傳給 pd.read_csv 的 dtype dict
+    """
+    if schema is None:
+        schema = SCHEMA
+    return {col: "category" for col in columns if schema.get(col) == "category"}
+
+
+def widen_floats(df):
+    """
+    float32 欄位轉回 float64 (寫入資料庫或計算雜湊前使用)
+
+    以最短十進位表示還原數值, 例如 float32 的 39.7 會還原成 39.7 而不是 39.70000076
+
+    參數:
+        df: DataFrame
+
+    回傳:
+        轉換後的新 DataFrame (沒有 float32 欄位時回傳原資料)
+    """
+    float32_cols = [col for col in df.columns if df[col].dtype == np.float32]
+    if not float32_cols:
+        return df
+
+    df = df.copy()
+    for col in float32_cols:
+        # 只轉換不重複的值
+        codes, uniques = pd.factorize(df[col])
+        exact = np.asarray(np.asarray(uniques, dtype=np.float32).astype(str), dtype=np.float64)
+        df[col] = np.where(codes >= 0, exact[np.maximum(codes, 0)], np.nan)
+    return df
+
+
+def memory_report(df, schema=None):
+    """
+    各欄位套用型別前後的記憶體用量
+
+    參數:
+        df: 原始型別的 DataFrame
+        schema: 欄位型別對照 (預設為 SCHEMA)
+
+    回傳:
+        以欄位為 index 的 DataFrame, 欄位為 dtype_before、bytes_before、dtype_after、bytes_after
+        (最後一列 total 為合計)
+    """
+    compact = apply_schema(df, schema)
+    report = pd.DataFrame({
+        "dtype_before": df.dtypes.astype(str),
+        "bytes_before": df.memory_usage(deep=True, index=False),
+        "dtype_after": compact.dtypes.astype(str),
+        "bytes_after": compact.memory_usage(deep=True, index=False),
+    })
+    report.loc["total"] = ["", report["bytes_before"].sum(), "", report["bytes_after"].sum()]
+    return report
+
+
+def print_memory_report(df, schema=None):
+    """印出 memory_report 的結果與縮減倍數"""
+    report = memory_report(df, schema)
+    shown = report.copy()
+    for col in ["bytes_before", "bytes_after"]:
+        shown[col] = (report[col] / 1024 ** 2).map("{:,.1f} MB".format)
+    print(shown.to_string())
+
+    before, after = report.loc["total", ["bytes_before", "bytes_after"]]
+    print(f"\n{len(df):,} 筆: {before / 1024 ** 2:,.1f} MB → {after / 1024 ** 2:,.1f} MB "
+          f"({before / after:.1f} 倍)")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="資料集套用欄位型別前後的記憶體用量")
+    parser.add_argument("path", nargs="?", default="data/data_clean.csv", help="CSV 或 Parquet 檔案")
+    args = parser.parse_args()
+
+    from _00_storage import load_table
+
+    print_memory_report(load_table(args.path))
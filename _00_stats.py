@@ -0,0 +1,611 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# 同 scipy.stats.linregress 的數值穩定常數
+TINY = 1.0e-20
+
+# 各型號 (age, price) 迴歸的充分統計量欄位
+MOMENT_COLUMNS = ["n", "sum_x", "sum_y", "sum_xy", "sum_xx", "sum_yy"]
+
+# bootstrap 每一批索引矩陣的最多元素數 (重抽樣次數 × 資料筆數, 控制記憶體用量)
+BOOTSTRAP_BLOCK_ELEMENTS = 4_000_000
+
+# 分層抽樣時數值欄位的分位數層數上限
+STRATIFY_BINS = 100
+
+
+def group_moments(codes, x, y, n_groups):
+    """
+    一次計算所有群組的充分統計量 (n, Σx, Σy, Σxy, Σx², Σy²)
+
+    參數:
+        codes: 每筆資料的群組編號 (0 ~ n_groups-1)
+        x: 自變數陣列
+        y: 應變數陣列
+        n_groups: 群組數
+
+    回傳:
+        欄位為 MOMENT_COLUMNS 的 DataFrame (index 為群組編號)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    def group_sum(weights):
+        return np.bincount(codes, weights=weights, minlength=n_groups)
+
+    return pd.DataFrame({
+        "n": np.bincount(codes, minlength=n_groups),
+        "sum_x": group_sum(x),
+        "sum_y": group_sum(y),
+        "sum_xy": group_sum(x * y),
+        "sum_xx": group_sum(x * x),
+        "sum_yy": group_sum(y * y),
+    })
+
+
+def reference_moments(df, x="age", y="price", key="reference number"):
+    """
+    計算每個型號 (x, y) 的充分統計量與不重複 x 的個數
+
+    參數:
+        df: 資料
+        x: 自變數欄位 (預設 age)
+        y: 應變數欄位 (預設 price)
+        key: 分組欄位 (預設 reference number)
+
+    回傳:
+        以型號為 index 的 DataFrame, 欄位為 MOMENT_COLUMNS 加上 n_x (不重複 x 的個數),
+        順序依型號在資料中首次出現的順序
+    """
+    codes, keys = pd.factorize(df[key])
+    moments = group_moments(codes, df[x].to_numpy(), df[y].to_numpy(), len(keys))
+
+    # 不重複的 (型號, x) 組合數 (x 缺失的編號為 -1, 不計入, 否則會算到前一個型號)
+    x_codes, x_values = pd.factorize(df[x])
+    valid = (codes >= 0) & (x_codes >= 0)
+    pairs = np.unique(codes[valid].astype(np.int64) * len(x_values) + x_codes[valid])
+    moments["n_x"] = np.bincount(pairs // len(x_values), minlength=len(keys))
+
+    moments.index = pd.Index(keys, name=key)
+    return moments
+
+
+def linregress(x, y):
+    """
+    單一群組的線性迴歸 (計算方式與 scipy.stats.linregress 相同, 結果逐位元一致)
+
+    參數:
+        x: 自變數陣列
+        y: 應變數陣列
+
+    回傳:
+        (slope, intercept, r_value, p_value, std_err)
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if x.size == 0 or y.size == 0:
+        raise ValueError("Inputs must not be empty.")
+    if np.amax(x) == np.amin(x) and len(x) > 1:
+        raise ValueError("Cannot calculate a linear regression if all x values are identical")
+
+    n = len(x)
+    x_mean = np.mean(x, None)
+    y_mean = np.mean(y, None)
+    ssxm, ssxym, _, ssym = np.cov(x, y, bias=1).flat
+
+    if ssxm == 0.0 or ssym == 0.0:
+        r = np.asarray(np.nan if ssxym == 0 else 0.0)[()]
+    else:
+        r = ssxym / np.sqrt(ssxm * ssym)
+        r = min(max(r, -1.0), 1.0)
+
+    slope = ssxym / ssxm
+    intercept = y_mean - slope * x_mean
+    if n == 2:
+        p_value = 1.0 if y[0] == y[1] else 0.0
+        std_err = 0.0
+    else:
+        # 只用到 t 分配的累積分布函數, 不載入較慢的 scipy.stats (scipy.special 也在這裡才載入)
+        from scipy.special import stdtr
+
+        df = n - 2
+        t = r * np.sqrt(df / ((1.0 - r + TINY) * (1.0 + r + TINY)))
+        p_value = 2 * stdtr(df, -np.abs(t))
+        std_err = np.sqrt((1 - r ** 2) * ssym / ssxm / df)
+    return slope, intercept, r, p_value, std_err
+
+
+def linregress_from_moments(moments):
+    """
+    由充分統計量批次計算所有群組的線性迴歸 (結果同 scipy.stats.linregress)
+
+    參數:
+        moments: 含 MOMENT_COLUMNS 的 DataFrame (每列一個群組)
+
+    回傳:
+        與 moments 同 index 的 DataFrame, 欄位為
+        slope, intercept, r_value, p_value, std_err
+        (x 全部相同的群組 slope 為 NaN)
+    """
+    n = moments["n"].to_numpy(dtype=float)
+    sum_x = moments["sum_x"].to_numpy()
+    sum_y = moments["sum_y"].to_numpy()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = sum_x / n
+        y_mean = sum_y / n
+
+        # 離均差平方和的平均 (同 np.cov(x, y, bias=1))
+        ssxm = (moments["sum_xx"].to_numpy() - sum_x * x_mean) / n
+        ssym = (moments["sum_yy"].to_numpy() - sum_y * y_mean) / n
+        ssxym = (moments["sum_xy"].to_numpy() - sum_x * y_mean) / n
+
+        ssxm = np.maximum(ssxm, 0)
+        ssym = np.maximum(ssym, 0)
+        degenerate = (ssxm == 0) | (ssym == 0)
+        r = np.where(degenerate, np.where(ssxym == 0, np.nan, 0.0), ssxym / np.sqrt(ssxm * ssym))
+        r = np.clip(r, -1.0, 1.0)
+
+        slope = np.where(ssxm > 0, ssxym / ssxm, np.nan)
+        intercept = y_mean - slope * x_mean
+
+        # 自由度 n-2 的 t 檢定 (n == 2 時同 linregress 的特例處理)
+        from scipy.special import stdtr
+
+        df = n - 2
+        t = r * np.sqrt(df / ((1.0 - r + TINY) * (1.0 + r + TINY)))
+        p_value = 2 * stdtr(df, -np.abs(t))
+        std_err = np.sqrt((1 - r ** 2) * ssym / ssxm / df)
+
+        two_points = n == 2
+        p_value[two_points] = np.where(ssym[two_points] == 0, 1.0, 0.0)
+        std_err[two_points] = 0.0
+
+    return pd.DataFrame({
+        "slope": slope,
+        "intercept": intercept,
+        "r_value": r,
+        "p_value": p_value,
+        "std_err": std_err,
+    }, index=moments.index)
+
+
+def dispersion_from_moments(moments):
+    """
+    由充分統計量批次計算所有群組 y 的離散程度
+
+    參數:
+        moments: 含 MOMENT_COLUMNS 的 DataFrame (每列一個群組)
+
+    回傳:
+        與 moments 同 index 的 DataFrame, 欄位為
+        mean, std (ddof=1), cv (std / mean),
+        residual_std (對 x 線性迴歸的殘差標準差, 自由度 n-2; x 全部相同或 n <= 2 時為 NaN)
+    """
+    n = moments["n"].to_numpy(dtype=float)
+    sum_x = moments["sum_x"].to_numpy()
+    sum_y = moments["sum_y"].to_numpy()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sum_y / n
+
+        # 離均差平方和與交叉乘積和
+        sxx = np.maximum(moments["sum_xx"].to_numpy() - sum_x * sum_x / n, 0)
+        syy = np.maximum(moments["sum_yy"].to_numpy() - sum_y * mean, 0)
+        sxy = moments["sum_xy"].to_numpy() - sum_x * mean
+
+        std = np.where(n > 1, np.sqrt(syy / (n - 1)), np.nan)
+        sse = np.where(sxx > 0, np.maximum(syy - sxy * sxy / sxx, 0), np.nan)
+        residual_std = np.where(n > 2, np.sqrt(sse / (n - 2)), np.nan)
+
+    return pd.DataFrame({
+        "mean": mean,
+        "std": std,
+        "cv": std / mean,
+        "residual_std": residual_std,
+    }, index=moments.index)
+
+
+def mean_confidence_interval(mean, std, n, confidence=0.95):
+    """
+    平均值的 t 分配信賴區間 (可批次計算)
+
+    參數:
+        mean: 平均值
+        std: 樣本標準差 (ddof=1)
+        n: 樣本數
+        confidence: 信賴水準
+
+    回傳:
+        (lower, upper); 只有一筆資料時上下界皆為平均值
+    """
+    from scipy.special import stdtrit
+
+    mean = np.asarray(mean, dtype=float)
+    n = np.asarray(n, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = stdtrit(n - 1, 0.5 + confidence / 2)
+        half_width = np.where(n > 1, t * np.asarray(std, dtype=float) / np.sqrt(n), 0.0)
+    return mean - half_width, mean + half_width
+
+
+def bootstrap_linregress(x, y, n_boot=1000, seed=0, block_elements=BOOTSTRAP_BLOCK_ELEMENTS):
+    """
+    線性迴歸的 bootstrap: 重抽樣以 (B, n) 的索引矩陣一次抽出, 換算成各筆被抽中的次數後,
+    B 組 OLS 需要的加總以一次矩陣乘法求出 (不逐次呼叫 linregress)
+
+    參數:
+        x: 自變數陣列 (n,)
+        y: 應變數陣列 (n,), 或共用同一組重抽樣的多個應變數 (k, n)
+        n_boot: 重抽樣次數 B
+        seed: 亂數種子 (或 np.random.Generator)
+        block_elements: 每一批索引矩陣的最多元素數 (不影響結果)
+
+    回傳:
+        (slope, intercept), 形狀為 (B,) 或 (k, B)
+        (重抽樣的 x 全部相同時為 NaN)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    single = y.ndim == 1
+    y = np.atleast_2d(y)
+    n = len(x)
+    rng = np.random.default_rng(seed)
+
+    # 先減去平均值, 加總時數值較穩定 (斜率不變, 截距最後再換算回來)
+    x_mean = x.mean()
+    y_mean = y.mean(axis=1)
+    x = x - x_mean
+    y = y - y_mean[:, None]
+
+    # 每列的特徵 [x, x², y_1, x·y_1, ...]: 重抽樣的加總 = 各筆被抽中次數 × 特徵
+    features = np.column_stack([x, x * x] + [col for values in y for col in (values, x * values)])
+
+    slope = np.empty((len(y), n_boot))
+    intercept = np.empty((len(y), n_boot))
+    step = max(1, block_elements // max(n, 1))
+    for start in range(0, n_boot, step):
+        stop = min(start + step, n_boot)
+        rows = stop - start
+        index = rng.integers(0, n, size=(rows, n))
+        # 各次重抽樣中每筆被抽中的次數 (rows, n), 一次 bincount 求出
+        index += np.arange(rows)[:, None] * n
+        counts = np.bincount(index.ravel(), minlength=rows * n).reshape(rows, n)
+        sums = counts.astype(float) @ features
+        sum_x = sums[:, 0]
+        ssxm = sums[:, 1] - sum_x * sum_x / n
+        for k in range(len(y)):
+            sum_y = sums[:, 2 + 2 * k]
+            ssxym = sums[:, 3 + 2 * k] - sum_x * sum_y / n
+            with np.errstate(divide="ignore", invalid="ignore"):
+                block_slope = np.where(ssxm > 0, ssxym / ssxm, np.nan)
+            slope[k, start:stop] = block_slope
+            intercept[k, start:stop] = (sum_y - block_slope * sum_x) / n + y_mean[k] - block_slope * x_mean
+
+    if single:
+        return slope[0], intercept[0]
+    return slope, intercept
+
+
+def percentile_interval(draws, confidence=0.95, axis=-1):
+    """
+    bootstrap 的百分位信賴區間 (忽略 NaN)
+
+    參數:
+        draws: bootstrap 結果
+        confidence: 信賴水準
+        axis: 重抽樣所在的維度
+
+    回傳:
+        (lower, upper), 全部為 NaN 的位置為 NaN
+    """
+    tail = (1 - confidence) / 2 * 100
+    draws = np.asarray(draws, dtype=float)
+    # 沒有 NaN 時用較快的 np.percentile; 全部為 NaN 時區間為 NaN (不顯示警告)
+    percentile = np.nanpercentile if np.isnan(draws).any() else np.percentile
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lower, upper = percentile(draws, [tail, 100 - tail], axis=axis)
+    return lower, upper
+
+
+def stable_group_order(codes):
+    """
+    依群組編號穩定排序的索引 (同 np.argsort(codes, kind='stable'))
+
+    以「群組編號 * n + 原位置」的單一整數鍵排序, 比一般穩定排序快
+    """
+    n = len(codes)
+    return np.sort(codes.astype(np.int64) * n + np.arange(n)) % n
+
+
+def group_sorted_values(codes, values, n_groups):
+    """
+    把數值依群組排列, 每個群組內由小到大
+
+    參數:
+        codes: 每筆資料的群組編號 (0 ~ n_groups-1)
+        values: 數值陣列 (不可含缺失值)
+        n_groups: 群組數
+
+    回傳:
+        (sorted_values, starts, counts): 排列後的數值, 以及各群組的起始位置與筆數
+    """
+    values = np.asarray(values)
+
+    # 先依群組排列, 再各自排序群組內的數值 (比整體 argsort 數值快, 相同數值互換不影響結果)
+    sorted_values = values[stable_group_order(codes)]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    for start, end in zip(starts[counts > 1], (starts + counts)[counts > 1]):
+        sorted_values[start:end].sort()
+    return sorted_values, starts, counts
+
+
+def quantiles_from_sorted(sorted_values, starts, counts, quantiles=(0.25, 0.75)):
+    """
+    由 group_sorted_values 的結果計算各群組的分位數
+
+    內插方式與 Series.quantile (np.percentile 的 linear 方法) 完全相同,
+    結果逐位元一致。
+
+    參數:
+        sorted_values, starts, counts: group_sorted_values 的結果
+            (每個群組至少要有一筆資料)
+        quantiles: 要計算的分位數
+
+    回傳:
+        每個分位數一個長度為群組數的陣列
+    """
+    last = starts + counts - 1
+
+    results = []
+    for q in quantiles:
+        # Series.quantile 以百分位數 (q * 100) 呼叫 np.percentile, 換算回來的 q 可能差一個位元
+        q = q * 100 / 100
+        # 同 np.percentile 的 linear 方法 (numpy 的 get_virtual_index): 位置為 (n - 1) * q
+        virtual = (counts - 1) * q
+        previous = np.floor(virtual)
+        gamma = virtual - previous
+        previous = starts + previous.astype(np.intp)
+
+        # 超出範圍時取群組最後一筆
+        a = sorted_values[np.minimum(previous, last)]
+        b = sorted_values[np.minimum(previous + 1, last)]
+
+        # 同 numpy 的 _lerp: gamma >= 0.5 時從右端點回推以減少誤差
+        diff = b - a
+        result = a + diff * gamma
+        right = gamma >= 0.5
+        result[right] = (b - diff * (1 - gamma))[right]
+        results.append(result)
+
+    return results
+
+
+def group_quantiles(codes, values, n_groups, quantiles=(0.25, 0.75)):
+    """
+    以排序法一次計算所有群組的分位數 (結果與 Series.quantile 逐位元一致)
+
+    參數:
+        codes: 每筆資料的群組編號 (0 ~ n_groups-1)
+        values: 數值陣列 (不可含缺失值)
+        n_groups: 群組數 (每個群組至少要有一筆資料)
+        quantiles: 要計算的分位數
+
+    回傳:
+        每個分位數一個長度為 n_groups 的陣列
+    """
+    sorted_values, starts, counts = group_sorted_values(codes, values, n_groups)
+    return quantiles_from_sorted(sorted_values, starts, counts, quantiles)
+
+
+def group_box_stats(codes, values, n_groups, whis=1.5, max_fliers=None):
+    """
+    一次排序計算所有群組的箱型圖統計量 (同 matplotlib.cbook.boxplot_stats)
+
+    參數:
+        codes: 每筆資料的群組編號 (0 ~ n_groups-1)
+        values: 數值陣列 (不可含缺失值)
+        n_groups: 群組數
+        whis: 鬚線長度 (IQR 的倍數)
+        max_fliers: 每個群組最多保留的離群點數 (依排序等距取點, 一定包含最小與最大值;
+            預設 None 表示全部)
+
+    回傳:
+        每個群組一個 dict 的列表 (可直接傳給 Axes.bxp), 沒有資料的群組為 None
+    """
+    values = np.asarray(values, dtype=float)
+    sorted_values, starts, counts = group_sorted_values(codes, values, n_groups)
+    nonempty = counts > 0
+    stats = [None] * n_groups
+    if not nonempty.any():
+        return stats
+
+    q1, med, q3 = (np.full(n_groups, np.nan) for _ in range(3))
+    q1[nonempty], med[nonempty], q3[nonempty] = quantiles_from_sorted(
+        sorted_values, starts[nonempty], counts[nonempty], (0.25, 0.5, 0.75)
+    )
+    sums = np.bincount(codes, weights=values, minlength=n_groups)
+
+    for group in np.flatnonzero(nonempty):
+        x = sorted_values[starts[group]:starts[group] + counts[group]]
+        iqr = q3[group] - q1[group]
+
+        # 鬚線: 落在 [q1 - whis*IQR, q3 + whis*IQR] 內的最小與最大值
+        lo = np.searchsorted(x, q1[group] - whis * iqr, side="left")
+        hi = np.searchsorted(x, q3[group] + whis * iqr, side="right")
+        whislo = x[lo] if lo < len(x) and x[lo] <= q1[group] else q1[group]
+        whishi = x[hi - 1] if hi > 0 and x[hi - 1] >= q3[group] else q3[group]
+
+        fliers = np.concatenate([x[:np.searchsorted(x, whislo, side="left")],
+                                 x[np.searchsorted(x, whishi, side="right"):]])
+        if max_fliers is not None and len(fliers) > max_fliers:
+            fliers = fliers[np.unique(np.linspace(0, len(fliers) - 1, max_fliers).round().astype(np.intp))]
+
+        notch = 1.57 * iqr / np.sqrt(counts[group])
+        stats[group] = {
+            "mean": sums[group] / counts[group],
+            "iqr": iqr,
+            "cilo": med[group] - notch,
+            "cihi": med[group] + notch,
+            "whislo": whislo,
+            "whishi": whishi,
+            "fliers": fliers,
+            "q1": q1[group],
+            "med": med[group],
+            "q3": q3[group],
+        }
+    return stats
+
+
+def quantile_bins(values, bins=STRATIFY_BINS):
+    """
+    依分位數把數值分成最多 bins 層 (相同的分位數合併, 缺失值另成一層)
+
+    參數:
+        values: 數值陣列
+        bins: 層數上限
+
+    回傳:
+        各筆資料的層編號 (0 起算的連續整數)
+    """
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    edges = np.array([])
+    if not missing.all():
+        edges = np.unique(np.quantile(values[~missing], np.linspace(0, 1, bins + 1))[1:-1])
+    codes = np.searchsorted(edges, values, side="right")
+    codes[missing] = len(edges) + 1
+    return np.unique(codes, return_inverse=True)[1]
+
+
+def stratified_sample(df, n, by, min_per_group=50, seed=0, bins=STRATIFY_BINS):
+    """
+    依 by 欄位分層抽樣 (各層依比例抽出, 稀少的層至少保留 min_per_group 筆)
+
+    每筆資料以該層的抽樣機率獨立抽出, 只需一次走訪, 實際筆數會在 n 附近。
+    by 為單一數值欄位時以分位數分成最多 bins 層 (quantile_bins),
+    連續的數值不會每個值各成一層。
+
+    參數:
+        df: 資料
+        n: 期望的抽樣筆數 (None 或不小於資料筆數時回傳原資料)
+        by: 分層欄位 (單一欄位或欄位列表)
+        min_per_group: 每層至少保留的期望筆數
+        seed: 亂數種子
+        bins: 數值欄位的分層數上限
+
+    回傳:
+        抽樣後的 DataFrame (維持原本順序)
+    """
+    if n is None or len(df) <= n:
+        return df
+
+    numeric = isinstance(by, str) and pd.api.types.is_numeric_dtype(df[by]) \
+        and not pd.api.types.is_bool_dtype(df[by])
+    if numeric:
+        codes = quantile_bins(df[by].to_numpy(dtype=float), bins)
+    else:
+        codes = df.groupby(by, sort=False, dropna=False).ngroup().to_numpy()
+    counts = np.bincount(codes)
+    quota = np.minimum(counts, np.maximum(min_per_group, n * counts / len(df)))
+
+    rng = np.random.default_rng(seed)
+    keep = rng.random(len(df)) < (quota / counts)[codes]
+    return df[keep]
+
+
+
+def _bin_codes(values, bins):
+    """把數值分到 bins 個等寬區間, 回傳各筆資料的區間編號"""
+    lo, hi = values.min(), values.max()
+    width = (hi - lo) / bins if hi > lo else 1.0
+    return np.minimum(((values - lo) / width).astype(np.intp), bins - 1)
+
+
+def _tricube_kernel(centers, counts, frac):
+    """
+    各區間中心之間的 tricube 權重矩陣
+
+    鄰域半徑為由近到遠累加筆數, 達到 frac * 總筆數時的距離 (同 lowess 的 k 個最近點)
+    """
+    k = int(frac * counts.sum() + 1e-10)
+    rows = np.arange(len(centers))
+    distance = np.abs(centers[:, None] - centers[None, :])
+    order = np.argsort(distance, axis=1, kind="stable")
+    covered = np.cumsum(counts[order], axis=1)
+    radius = distance[rows, order[rows, np.argmax(covered >= k, axis=1)]]
+
+    # 半徑為 0 時只使用距離為 0 的區間
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scaled = np.where(radius[:, None] > 0, distance / radius[:, None], (distance > 0) * 1.0)
+    return np.where(scaled < 1, (1 - scaled ** 3) ** 3, 0.0)
+
+
+def binned_lowess(endog, exog, frac=2.0 / 3.0, it=3, bins=200, y_bins=256):
+    """
+    網格近似的 LOWESS (資料量大時取代 statsmodels 的 lowess)
+
+    先把資料放進 x 分 bins 個、y 分 y_bins 個等寬區間的網格, 只保留各格的
+    充分統計量, 之後的局部迴歸與穩健化疊代都在網格上計算, 計算量與資料筆數無關。
+    每個 x 區間內 x 都相同時 (例如整數的錶齡), it=0 的結果同 lowess;
+    穩健化疊代的殘差以格內 y 的平均計算, 為近似值。
+
+    參數:
+        endog: y 陣列
+        exog: x 陣列
+        frac: 每次局部迴歸使用的資料比例 (同 lowess)
+        it: 穩健化疊代次數 (同 lowess)
+        bins: x 的分箱數
+        y_bins: y 的分箱數 (只影響穩健化疊代的殘差精度)
+
+    回傳:
+        (x 區間數, 2) 的陣列, 第一欄為區間中心 (由小到大), 第二欄為配適值
+        (同 lowess 的輸出格式, 但每個區間只有一列)
+    """
+    x = np.asarray(exog, dtype=float)
+    y = np.asarray(endog, dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+
+    # 各格的充分統計量, 以及每格所屬的 x 區間
+    cell_codes = _bin_codes(x, bins) * y_bins + _bin_codes(y, y_bins)
+    cells = group_moments(cell_codes, x, y, bins * y_bins)
+    cells = cells[cells["n"] > 0]
+    _, cell_bin = np.unique(cells.index.to_numpy() // y_bins, return_inverse=True)
+    cell = {col: cells[col].to_numpy(dtype=float) for col in MOMENT_COLUMNS}
+    cell_mean = cell["sum_y"] / cell["n"]
+
+    counts = np.bincount(cell_bin, weights=cell["n"])
+    centers = np.bincount(cell_bin, weights=cell["sum_x"]) / counts
+    kernel = _tricube_kernel(centers, counts, frac)
+
+    robust = np.ones(len(cell_mean))
+    for iteration in range(it + 1):
+        # 穩健權重乘上各格的統計量後, 再以 tricube 權重做加權最小平方
+        sums = {col: kernel @ np.bincount(cell_bin, weights=cell[col] * robust, minlength=len(centers))
+                for col in MOMENT_COLUMNS}
+        s, sx, sy = sums["n"], sums["sum_x"], sums["sum_y"]
+        denominator = s * sums["sum_xx"] - sx * sx
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(denominator > 1e-12 * s * sums["sum_xx"],
+                             (s * sums["sum_xy"] - sx * sy) / denominator, 0.0)
+            fitted = (sy - slope * sx) / s + slope * centers
+        if iteration == it:
+            break
+
+        # bisquare 穩健權重: 殘差以 6 倍的殘差中位數為單位 (同 lowess)
+        residual = np.abs(cell_mean - fitted[cell_bin])
+        order = np.argsort(residual)
+        half = np.searchsorted(np.cumsum(cell["n"][order]), cell["n"].sum() / 2)
+        median = residual[order[half]]
+        if median == 0:
+            scaled = (residual > 0) * 1.0
+        else:
+            scaled = np.minimum(residual / (6.0 * median), 1.0)
+        robust = (1 - scaled ** 2) ** 2
+
+    return np.column_stack([centers, fitted])
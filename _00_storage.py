@@ -0,0 +1,130 @@
+import pandas as pd
+
+from _00_schema import SCHEMA, apply_schema, read_dtypes
+
+
+def is_parquet(path):
+    """依副檔名判斷是否為 Parquet 檔案"""
+    return str(path).lower().endswith((".parquet", ".pq"))
+
+
+def _parquet_index_columns(path):
+    """回傳 Parquet 檔案中已儲存的 index 欄位名稱"""
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_schema(path).pandas_metadata or {}
+    return [c for c in metadata.get("index_columns", []) if isinstance(c, str)]
+
+
+def read_columns(path):
+    """
+    讀取檔案的欄位名稱 (不載入資料)
+
+    參數:
+        path: CSV 或 Parquet 檔案路徑
+
+    回傳:
+        欄位名稱列表 (Parquet 不含已儲存的 index)
+    """
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        index_cols = _parquet_index_columns(path)
+        return [name for name in pq.read_schema(path).names if name not in index_cols]
+
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+# 套用欄位型別讀取 CSV 時每次解析的筆數 (限制解析時的記憶體高峰)
+CSV_CHUNK_ROWS = 200_000
+
+
+def _read_csv_typed(path, columns, index_col, schema):
+    """
+    分段讀取 CSV 並逐段套用欄位型別, 最後合併各段的類別
+
+    參數:
+        path: CSV 檔案路徑
+        columns: 只讀取的欄位
+        index_col: 同 pd.read_csv
+        schema: 欄位型別對照
+
+    回傳:
+        套用型別後的 DataFrame
+    """
+    from pandas.api.types import union_categoricals
+
+    # 類別欄位讀取時直接建立, 不產生大量的字串物件
+    dtype = read_dtypes(read_columns(path) if columns is None else columns, schema)
+    chunks = [
+        apply_schema(chunk, schema)
+        for chunk in pd.read_csv(path, usecols=columns, index_col=index_col, dtype=dtype,
+                                 chunksize=CSV_CHUNK_ROWS)
+    ]
+    if not chunks:
+        return pd.read_csv(path, usecols=columns, index_col=index_col, dtype=dtype)
+    if len(chunks) == 1:
+        return chunks[0]
+
+    # 各段的類別不同, 直接合併會變回字串; 先合併類別 (與一次讀取相同的排序)
+    cat_cols = [col for col in chunks[0].columns
+                if all(isinstance(chunk[col].dtype, pd.CategoricalDtype) for chunk in chunks)]
+    for col in cat_cols:
+        merged = union_categoricals([chunk[col] for chunk in chunks], sort_categories=True)
+        for chunk in chunks:
+            chunk[col] = pd.Categorical(chunk[col], categories=merged.categories)
+
+    return pd.concat(chunks)
+
+
+def load_table(path, columns=None, index_col=None, schema=None):
+    """
+    讀取中間檔案 (依副檔名自動選擇 CSV 或 Parquet)
+
+    參數:
+        path: 檔案路徑
+        columns: 只讀取的欄位 (預設 None 表示全部)
+        index_col: 設為 0 時以第一個欄位作為 index (同 pd.read_csv)
+        schema: 載入時套用的欄位型別 (例如 _00_schema.SCHEMA; 預設 None 表示維持讀取的型別)
+
+    回傳:
+        DataFrame
+    """
+    # 已儲存 index 的 Parquet 檔案會自動還原 index
+    use_first_col = index_col is not None
+    if use_first_col and is_parquet(path) and _parquet_index_columns(path):
+        use_first_col = False
+
+    # index 欄位必須包含在讀取的欄位中
+    if use_first_col and columns is not None:
+        first_col = read_columns(path)[0]
+        if first_col not in columns:
+            columns = [first_col] + list(columns)
+
+    if not is_parquet(path):
+        if schema is not None:
+            df = _read_csv_typed(path, columns, index_col, schema)
+        else:
+            df = pd.read_csv(path, usecols=columns, index_col=index_col)
+    else:
+        df = pd.read_parquet(path, columns=columns)
+        if use_first_col:
+            df = df.set_index(df.columns[0])
+
+    return df if schema is None else apply_schema(df, schema)
+
+
+def save_table(df, path, index=False):
+    """
+    儲存中間檔案 (依副檔名自動選擇 CSV 或 Parquet)
+
+    參數:
+        df: 要儲存的 DataFrame
+        path: 檔案路徑
+        index: 是否一併儲存 index
+    """
+    if is_parquet(path):
+        # index=True 時實際寫出 index 值, 讀取時才能還原
+        apply_schema(df, SCHEMA).to_parquet(path, index=index)
+    else:
+        df.to_csv(path, index=index)
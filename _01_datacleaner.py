@@ -1,6 +1,64 @@
 import pandas as pd
 import numpy as np
 import re
+from _00_schema import apply_schema
+from _00_storage import is_parquet, load_table, save_table
+
+# 錶殼尺寸解析用的編譯後正則 (與 clean_case_size 的逐筆邏輯等價)
+# clean_case_size 會把非 [0-9x.,] 字元換成空白後再從字首比對數字,
+# 因此等同於「去除前後空白後, 字首必須是 ASCII 數字」
+CASE_SIZE_PATTERN = re.compile(r'^\s*([0-9]+[.,]?[0-9]*)')
+
+# 合理的生產年份範圍
+MIN_PRODUCTION_YEAR = 1905
+MAX_PRODUCTION_YEAR = 2023
+
+# 配件描述 → 是否有錶盒 / 證書
+SCOPE_MAPPING = {
+    'Original box, original papers': {'has_box': True, 'has_papers': True},
+    'No original box, no original papers': {'has_box': False, 'has_papers': False},
+    'Original box, no original papers': {'has_box': True, 'has_papers': False},
+    'Original papers, no original box': {'has_box': False, 'has_papers': True}
+}
+FULL_SET_SCOPE = 'Original box, original papers'
+
+
+def fit_category_vocabulary(category_pct, threshold=0.01):
+    """
+    找出比例達門檻而需保留的類別
+    
+    參數:
+        category_pct: 各類別比例 (value_counts(normalize=True) 的結果)
+        threshold: 百分比門檻 (預設 1%)
+        
+    回傳:
+        保留的類別列表 (依比例由高到低)
+    """
+    return category_pct.index[category_pct >= threshold].tolist()
+
+
+def collapse_rare_categories(series, vocabulary, other="Other"):
+    """
+    以類別型別一次性將不在 vocabulary 中的值改為 other
+    
+    參數:
+        series: 原始類別欄位
+        vocabulary: 保留的類別列表 (fit_category_vocabulary 的結果)
+        other: 稀有值的替代名稱 (預設 "Other")
+        
+    回傳:
+        分組後的 Series (缺失值維持缺失)
+    """
+    codes = pd.Categorical(series, categories=vocabulary).codes
+    
+    # 不在 vocabulary 中的值 (code 為 -1) 對應到最後一個標籤 other
+    labels = np.array(list(vocabulary) + [other], dtype=object)
+    codes = np.where(codes < 0, len(vocabulary), codes)
+    
+    result = pd.Series(labels[codes], index=series.index, dtype=object)
+    result[series.isna()] = np.nan
+    return result
+
 
 class RolexDataCleaner:
     """用來清理和處理 Rolex 手錶資料的類別"""
@@ -16,10 +74,14 @@ class RolexDataCleaner:
         self.csv_path = csv_path
         self.data_year = data_year
         self.df = None
+        # 稀有值分組所保留的類別, 可用於新資料
+        self.vocabularies = {}
+        # calculate_total_price 使用的運費上限, 可用於新資料
+        self.max_shipping = None
     
     def load_data(self):
-        """讀取 CSV 檔案"""
-        self.df = pd.read_csv(self.csv_path)
+        """讀取 CSV 或 Parquet 檔案"""
+        self.df = load_table(self.csv_path)
         return self
     
     def clean_case_size(self, val):
@@ -62,47 +124,71 @@ class RolexDataCleaner:
     def clean_year_of_production(self):
         """清理生產年份並計算錶齡"""
         # 不合理的年份設為 NaN
-        mask = (self.df["year of production"] > 2023) | (self.df["year of production"] < 1905)
+        mask = (
+            (self.df["year of production"] > MAX_PRODUCTION_YEAR)
+            | (self.df["year of production"] < MIN_PRODUCTION_YEAR)
+        )
         self.df.loc[mask, "year of production"] = np.nan
         
         # 計算錶齡
         self.df["age"] = self.data_year - self.df["year of production"]
         return self
     
+    def parse_case_sizes(self, series):
+        """
+        向量化清理錶殼尺寸 (結果與逐筆 clean_case_size 相同)
+        
+        參數:
+            series: 原始尺寸欄位
+            
+        回傳:
+            清理後的 float Series (無法解析或超出範圍為 np.nan)
+        """
+        result = pd.Series(np.nan, index=series.index, dtype=float)
+        valid = series.notna()
+        if not valid.any():
+            return result
+        
+        # 原始尺寸字串重複率高, 只需解析不重複的值
+        codes, uniques = pd.factorize(series[valid])
+        
+        # 一次性以正則批次擷取字首數字
+        num = pd.Series(uniques, dtype=object).astype(str).str.extract(
+            CASE_SIZE_PATTERN, expand=False
+        )
+        values = num.str.replace(',', '.', regex=False).astype(float).to_numpy()
+        
+        # 合理範圍檢查 (14mm~60mm 正常)
+        values[(values < 14) | (values > 60)] = np.nan
+        
+        result[valid] = values[codes]
+        return result
+    
     def clean_case_diameter(self):
         """清理錶殼直徑"""
-        self.df["case diameter"] = self.df["case diameter"].apply(self.clean_case_size)
+        self.df["case diameter"] = self.parse_case_sizes(self.df["case diameter"])
         return self
     
-    def group_case_material(self, threshold=0.01):
+    def group_case_material(self, threshold=0.01, vocabulary=None):
         """
         將稀有材質分組為 Other
         
         參數:
             threshold: 百分比門檻 (預設 1%)
+            vocabulary: 既有的保留材質列表 (新資料或分塊處理時使用, 此時忽略 threshold)
         """
-        case_material_pct = self.df["case material"].value_counts(normalize=True)
-
-        
-        # 找出低於門檻的材質
-        rare_materials = [m for m, pct in case_material_pct.items() if pct < threshold]
+        if vocabulary is None:
+            case_material_pct = self.df["case material"].value_counts(normalize=True)
+            vocabulary = fit_category_vocabulary(case_material_pct, threshold)
+        self.vocabularies["material_group"] = vocabulary
         
         # 分組
-        self.df["material_group"] = self.df["case material"].apply(
-            lambda x: "Other" if x in rare_materials else x
-        )
+        self.df["material_group"] = collapse_rare_categories(self.df["case material"], vocabulary)
         return self
     
     def process_scope_of_delivery(self):
         """處理配件資訊 (has_box, has_papers, full_set)"""
-        scope_mapping = {
-            'Original box, original papers': {'has_box': True, 'has_papers': True},
-            'No original box, no original papers': {'has_box': False, 'has_papers': False},
-            'Original box, no original papers': {'has_box': True, 'has_papers': False},
-            'Original papers, no original box': {'has_box': False, 'has_papers': True}
-        }
-        
-        for scope, mapping in scope_mapping.items():
+        for scope, mapping in SCOPE_MAPPING.items():
             mask = self.df["scope of delivery"] == scope
             self.df.loc[mask, "has_box"] = mapping["has_box"]
             self.df.loc[mask, "has_papers"] = mapping["has_papers"]
@@ -111,7 +197,7 @@ class RolexDataCleaner:
         self.df["has_box"] = self.df["has_box"].astype(int)
         self.df["has_papers"] = self.df["has_papers"].astype(int)
         self.df["full_set"] = (
-            self.df["scope of delivery"] == "Original box, original papers"
+            self.df["scope of delivery"] == FULL_SET_SCOPE
         ).astype(int)
         
         return self
@@ -124,35 +210,50 @@ class RolexDataCleaner:
             max_shipping: 最大運費限制 (預設 12000)
         """
         # 過濾不合理的運費
+        self.max_shipping = max_shipping
         self.df = self.df[self.df["aditional shipping price"] <= max_shipping]
         
         # 計算總價
         self.df["ship_total"] = self.df["price"] + self.df["aditional shipping price"]
         return self
     
-    def group_location(self, threshold=0.01):
+    @staticmethod
+    def extract_country(location):
+        """從 location 欄位提取國家"""
+        return location.str.split(",").str[0].str.strip()
+    
+    def group_location(self, threshold=0.01, vocabulary=None):
         """
         將稀有國家分組為 Other
         
         參數:
             threshold: 百分比門檻 (預設 1%)
+            vocabulary: 既有的保留國家列表 (新資料或分塊處理時使用, 此時忽略 threshold)
         """
         # 提取國家
-        self.df["country"] = self.df["location"].str.split(",").str[0].str.strip()
+        country = self.extract_country(self.df["location"])
         
         # 計算百分比
-        country_pct = self.df['country'].value_counts(normalize=True)
+        if vocabulary is None:
+            country_pct = country.value_counts(normalize=True)
+            vocabulary = fit_category_vocabulary(country_pct, threshold)
+        self.vocabularies["country"] = vocabulary
         
         # 將稀有國家設為 Other
-        for country, pct in country_pct.items():
-            if pct < threshold:
-                mask = self.df["country"] == country
-                self.df.loc[mask, "country"] = "Other"
-        
+        self.df["country"] = collapse_rare_categories(country, vocabulary)
         return self
     
-    def clean_all(self):
-        """執行所有清理步驟"""
+    def clean_all(self, chunksize=None, output_path=None):
+        """
+        執行所有清理步驟
+        
+        參數:
+            chunksize: 每次處理的筆數 (預設 None 表示一次載入全部)
+            output_path: 分塊處理時的輸出檔案路徑 (chunksize 有值時必填)
+        """
+        if chunksize is not None:
+            return self.clean_all_chunked(output_path, chunksize)
+        
         self.load_data()
         self.clean_year_of_production()
         self.clean_case_diameter()
@@ -160,6 +261,99 @@ class RolexDataCleaner:
         self.process_scope_of_delivery()
         self.calculate_total_price()
         self.group_location()
+        self.downcast()
+        return self
+    
+    def downcast(self):
+        """清理完成後套用 _00_schema.SCHEMA 的欄位型別 (類別、int8、int32 等), 降低記憶體用量"""
+        self.df = apply_schema(self.df)
+        return self
+    
+    def scan_frequencies(self, chunksize, max_shipping=12000):
+        """
+        第一輪掃描: 分塊統計全體材質與國家的比例, 並推斷各欄位的共同型別
+        
+        參數:
+            chunksize: 每次讀取的筆數
+            max_shipping: 最大運費限制 (需與 calculate_total_price 相同)
+            
+        回傳:
+            (case_material_pct, country_pct, dtypes)
+        """
+        material_counts = pd.Series(dtype="int64")
+        country_counts = pd.Series(dtype="int64")
+        chunk_dtypes = {}
+        
+        for chunk in pd.read_csv(self.csv_path, chunksize=chunksize):
+            material_counts = material_counts.add(
+                chunk["case material"].value_counts(), fill_value=0
+            )
+            
+            # 國家比例是在運費過濾之後計算的
+            shipped = chunk[chunk["aditional shipping price"] <= max_shipping]
+            country_counts = country_counts.add(
+                self.extract_country(shipped["location"]).value_counts(), fill_value=0
+            )
+            
+            for col, dtype in chunk.dtypes.items():
+                chunk_dtypes.setdefault(col, set()).add(dtype)
+        
+        # 各分塊型別不一致時, 統一成一次載入時會推斷出的型別
+        dtypes = {}
+        for col, kinds in chunk_dtypes.items():
+            if len(kinds) == 1:
+                dtypes[col] = kinds.pop()
+            elif all(pd.api.types.is_numeric_dtype(k) and not pd.api.types.is_bool_dtype(k)
+                     for k in kinds):
+                dtypes[col] = "float64"
+            else:
+                dtypes[col] = "object"
+        
+        material_counts = material_counts.astype("int64")
+        country_counts = country_counts.astype("int64")
+        case_material_pct = material_counts / material_counts.sum()
+        country_pct = country_counts / country_counts.sum()
+        
+        return case_material_pct, country_pct, dtypes
+    
+    def clean_all_chunked(self, output_path, chunksize=100_000):
+        """
+        分塊串流執行所有清理步驟, 適用於無法一次載入記憶體的大型檔案
+        
+        先掃描一次全體材質與國家的比例, 第二輪再逐塊清理並寫出,
+        因此稀有值分組結果與一次載入時相同。
+        
+        參數:
+            output_path: 輸出檔案路徑
+            chunksize: 每次處理的筆數 (預設 100,000)
+        """
+        if output_path is None:
+            raise ValueError("分塊處理需要指定 output_path")
+        if is_parquet(output_path):
+            raise ValueError("分塊處理目前只支援 CSV 輸出")
+        
+        case_material_pct, country_pct, dtypes = self.scan_frequencies(chunksize)
+        material_vocab = fit_category_vocabulary(case_material_pct)
+        country_vocab = fit_category_vocabulary(country_pct)
+        
+        header = True
+        for chunk in pd.read_csv(self.csv_path, chunksize=chunksize, dtype=dtypes):
+            self.df = chunk
+            self.clean_year_of_production()
+            self.clean_case_diameter()
+            self.group_case_material(vocabulary=material_vocab)
+            self.process_scope_of_delivery()
+            self.calculate_total_price()
+            self.group_location(vocabulary=country_vocab)
+            # 與 clean_all 相同套用欄位型別 (例如運費寫出為整數)
+            self.downcast()
+            
+            self.df.to_csv(output_path, index=False, mode="w" if header else "a", header=header)
+            header = False
+        
+        # 資料已寫入檔案, 不保留在記憶體中
+        self.df = None
+        print(f"資料已儲存至 {output_path}")
         return self
     
     def get_data(self):
@@ -171,9 +365,9 @@ class RolexDataCleaner:
         儲存清理後的資料
         
         參數:
-            output_path: 輸出檔案路徑
+            output_path: 輸出檔案路徑 (副檔名為 .parquet 時存成 Parquet)
         """
-        self.df.to_csv(output_path, index=False)
+        save_table(self.df, output_path, index=False)
         print(f"資料已儲存至 {output_path}")
         return self
 
@@ -195,6 +389,7 @@ if __name__ == "__main__":
     cleaner.process_scope_of_delivery()
     cleaner.calculate_total_price(max_shipping=12000)
     cleaner.group_location(threshold=0.01)
+    cleaner.downcast()  # 套用欄位型別, 降低記憶體用量
     
     # 取得清理後的資料
     df_cleaned = cleaner.get_data()
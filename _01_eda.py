@@ -1,85 +1,266 @@
-import pandas as pd
-import seaborn as sns
+import argparse
+import colorsys
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")  # 只輸出圖檔, 不開視窗 (平行處理時也不需要顯示器)
 import matplotlib.pyplot as plt
-import re
 import numpy as np
-import statsmodels.api as sm
+import pandas as pd
+import seaborn as sns
+
+from _00_stats import binned_lowess, group_box_stats, stratified_sample
+from _00_storage import load_table
+
+DATA_PATH = "data/data.csv"
+PLOT_DIR = "plot"
+
+# 散布圖最多畫出的點數 (依 x 分層抽樣), None 表示畫出全部
+SCATTER_SAMPLE_SIZE = 100_000
+# LOWESS 超過此筆數時改用網格近似 (binned_lowess)
+LOWESS_MAX_ROWS = 100_000
+# 箱型圖每個類別最多畫出的離群點數 (依排序等距取點, 包含最小與最大值)
+MAX_FLIERS = 1000
+
+
+def smooth(xy, x, frac, lowess_sample_size=None, lowess_max_rows=LOWESS_MAX_ROWS, seed=0):
+    """
+    log1p(price) 對 x 的 LOWESS 曲線
+
+    參數:
+        xy: 含 x 與 price 且沒有缺失值的資料
+        x: 自變數欄位
+        frac: LOWESS 的資料比例
+        lowess_sample_size: 先依 x 分層抽樣的筆數 (預設 None 表示使用全部資料)
+        lowess_max_rows: 超過此筆數時改用網格近似
+        seed: 亂數種子
+
+    回傳:
+        (點數, 2) 的陣列: x 與配適的 log1p(price)
+    """
+    xy = stratified_sample(xy, lowess_sample_size, x, seed=seed)
+    if len(xy) > lowess_max_rows:
+        return binned_lowess(np.log1p(xy['price']), xy[x], frac=frac)
+
+    import statsmodels.api as sm
+
+    return sm.nonparametric.lowess(np.log1p(xy['price']), xy[x], frac=frac)
+
+
+def category_order(values):
+    """類別的顯示順序 (同 seaborn: 類別型別依類別順序, 數值由小到大, 其餘依出現順序)"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return list(values.cat.categories)
+    order = pd.unique(values.dropna())
+    if pd.api.types.is_numeric_dtype(values):
+        order = np.sort(order)
+    return list(order)
+
+
+def box_stats(df, x, y, max_fliers=MAX_FLIERS):
+    """
+    依 x 分組計算 y 的箱型圖統計量 (一次分組排序, 不保留原始資料)
+
+    參數:
+        df: 資料
+        x: 類別欄位
+        y: 數值欄位
+        max_fliers: 每個類別最多保留的離群點數
+
+    回傳:
+        (類別順序, 各類別的統計量 dict, 沒有資料的類別為 None)
+    """
+    order = category_order(df[x])
+    valid = df[y].notna()
+    codes = pd.Categorical(df.loc[valid, x], categories=order).codes
+    has_group = codes >= 0
+    stats = group_box_stats(codes[has_group], df.loc[valid, y].to_numpy()[has_group], len(order),
+                            max_fliers=max_fliers)
+    return order, stats
+
+
+def boxplot(df, x, y, ax, max_fliers=MAX_FLIERS):
+    """
+    以 Axes.bxp 畫出箱型圖 (外觀同 sns.boxplot, 記憶體與繪圖時間只和類別數有關)
+
+    參數:
+        df: 資料
+        x: 類別欄位
+        y: 數值欄位
+        ax: matplotlib Axes
+        max_fliers: 每個類別最多畫出的離群點數
+    """
+    order, stats = box_stats(df, x, y, max_fliers)
+    positions = [i for i, stat in enumerate(stats) if stat is not None]
 
+    # 同 seaborn 的預設顏色: 降低飽和度的主色與對應的灰色線條
+    color = sns.desaturate("C0", .75)
+    gray = colorsys.rgb_to_hls(*matplotlib.colors.to_rgb(color))[1] * .6
+    linecolor = (gray, gray, gray)
 
+    ax.bxp(
+        [stats[i] for i in positions],
+        positions=positions,
+        widths=.8,
+        capwidths=.4,
+        patch_artist=True,
+        manage_ticks=False,
+        boxprops={"facecolor": color, "edgecolor": linecolor},
+        medianprops={"color": linecolor, "solid_capstyle": "butt"},
+        whiskerprops={"color": linecolor, "solid_capstyle": "butt"},
+        flierprops={"markeredgecolor": linecolor},
+        capprops={"color": linecolor},
+    )
+    ax.set_xticks(range(len(order)), [str(label) for label in order])
+    ax.set_xlim(-.5, len(order) - .5)
+    ax.xaxis.grid(False)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
 
-df= pd.read_csv("data/data.csv",index_col=0)
 
 # price VS log_price
-fig, axes = plt.subplots(1,2, figsize=(15,8))
-axes[0].hist(df['price'])
-axes[0].set_title("price")
-axes[1].hist(np.log1p(df['price']))
-axes[1].set_title("log1p(price)")
-fig.savefig("plot/01_price_vs_pricelog.png")
+def plot_price_vs_pricelog(df, path):
+    fig, axes = plt.subplots(1,2, figsize=(15,8))
+    axes[0].hist(df['price'])
+    axes[0].set_title("price")
+    axes[1].hist(np.log1p(df['price']))
+    axes[1].set_title("log1p(price)")
+    fig.savefig(path)
+    plt.close(fig)
+
 
 # Price by Age / Price by Case diameter
-fig, axes = plt.subplots(1,2, figsize=(15,8))
-axes[0].scatter(df['age'], df['price'], s=5, alpha=0.15)
-lowess = sm.nonparametric.lowess
-xy = df[['age','price']].dropna()
-fit = lowess(np.log1p(xy['price']), xy['age'], frac=0.2)    
-axes[0].plot(fit[:,0], np.expm1(fit[:,1]), color="red")
-axes[0].set_yscale('log')
-axes[0].set_xlabel('age'); axes[0].set_ylabel('price')
-axes[0].set_title("Price by Age")
-
-axes[1].scatter(df['case diameter'], df['price'], s=5, alpha=0.15)
-xy = df[['case diameter','price']].dropna()
-fit = lowess(np.log1p(xy['price']), xy['case diameter'], frac=0.25)
-axes[1].plot(fit[:,0], np.expm1(fit[:,1]), color="red")
-axes[1].set_yscale('log')
-axes[1].set_xlabel('case diameter'); axes[1].set_ylabel('price')
-axes[1].set_title("Price by Case diameter")
-plt.tight_layout()
-fig.savefig("plot/01_Price_by_Age_Case_diameter.png")
+def plot_price_by_age_case_diameter(df, path, sample_size=SCATTER_SAMPLE_SIZE, seed=0, **lowess_options):
+    fig, axes = plt.subplots(1,2, figsize=(15,8))
+    for ax, x, frac, title in [(axes[0], 'age', 0.2, "Price by Age"),
+                               (axes[1], 'case diameter', 0.25, "Price by Case diameter")]:
+        xy = df[[x,'price']].dropna()
+        points = stratified_sample(xy, sample_size, x, seed=seed)
+        ax.scatter(points[x], points['price'], s=5, alpha=0.15)
+        fit = smooth(xy, x, frac, seed=seed, **lowess_options)
+        ax.plot(fit[:,0], np.expm1(fit[:,1]), color="red")
+        ax.set_yscale('log')
+        ax.set_xlabel(x); ax.set_ylabel('price')
+        ax.set_title(title)
+    plt.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
 
 # Price by Movement / Price by Condition
-fig, axes = plt.subplots(1,2, figsize=(15,8))
-sns.boxplot(data=df, x="movement", y="price",ax=axes[0])
-axes[0].set_yscale("log")
-axes[0].set_title("Price by Movement")
+def plot_price_by_movement_condition(df, path):
+    fig, axes = plt.subplots(1,2, figsize=(15,8))
+    boxplot(df, "movement", "price", ax=axes[0])
+    axes[0].set_yscale("log")
+    axes[0].set_title("Price by Movement")
+
+    boxplot(df, "condition", "price", ax=axes[1])
+    axes[1].set_yscale("log")
+    axes[1].set_title("Price by Condition")
+    fig.savefig(path)
+    plt.close(fig)
 
-sns.boxplot(data=df, x="condition", y="price",ax=axes[1])
-axes[1].set_yscale("log")
-axes[1].set_title("Price by Condition")
-fig.savefig("plot/01_Price_by_Movement_Condition.png")
 
 # Price by Material
-plt.figure(figsize=(12,8))
-sns.boxplot(data=df, x="material_group", y="price")
-plt.yscale("log")
-plt.title("Price by Material")
-plt.savefig("plot/01_Price_by_Material_group.png")
+def plot_price_by_material_group(df, path):
+    fig, ax = plt.subplots(figsize=(12,8))
+    boxplot(df, "material_group", "price", ax=ax)
+    ax.set_yscale("log")
+    ax.set_title("Price by Material")
+    fig.savefig(path)
+    plt.close(fig)
+
 
 # Price by Country
-plt.figure(figsize=(15,8))
-sns.boxplot(data=df, x="country", y="price")
-plt.yscale("log")
-plt.xticks(rotation=45)
-plt.title("Price by Country")
-plt.savefig("plot/01_Price_by_country.png")
+def plot_price_by_country(df, path):
+    fig, ax = plt.subplots(figsize=(15,8))
+    boxplot(df, "country", "price", ax=ax)
+    ax.set_yscale("log")
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.set_title("Price by Country")
+    fig.savefig(path)
+    plt.close(fig)
+
 
 # Price by Box / Price by Papers / Price by Full Set
-fig, ax = plt.subplots(1, 3, figsize=(15, 5))
-sns.boxplot(data=df, x='has_box', y='price', ax=ax[0])
-ax[0].set_yscale('log')
-ax[0].set_title('Price by Box')
+def plot_price_by_accessories(df, path):
+    fig, ax = plt.subplots(1, 3, figsize=(15, 5))
+    boxplot(df, 'has_box', 'price', ax=ax[0])
+    ax[0].set_yscale('log')
+    ax[0].set_title('Price by Box')
+
+    boxplot(df, 'has_papers', 'price', ax=ax[1])
+    ax[1].set_yscale('log')
+    ax[1].set_title('Price by Papers')
+
+    boxplot(df, 'full_set', 'price', ax=ax[2])
+    ax[2].set_yscale('log')
+    ax[2].set_title('Price by Full Set')
+    plt.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+# 檔名 -> (繪圖函式, 需要的欄位, 是否使用抽樣設定)
+FIGURES = {
+    "01_price_vs_pricelog.png": (plot_price_vs_pricelog, ['price'], False),
+    "01_Price_by_Age_Case_diameter.png": (plot_price_by_age_case_diameter, ['price', 'age', 'case diameter'], True),
+    "01_Price_by_Movement_Condition.png": (plot_price_by_movement_condition, ['price', 'movement', 'condition'], False),
+    "01_Price_by_Material_group.png": (plot_price_by_material_group, ['price', 'material_group'], False),
+    "01_Price_by_country.png": (plot_price_by_country, ['price', 'country'], False),
+    "01_Price_by_Accessories.png": (plot_price_by_accessories, ['price', 'has_box', 'has_papers', 'full_set'], False),
+}
 
-sns.boxplot(data=df, x='has_papers', y='price', ax=ax[1])
-ax[1].set_yscale('log')
-ax[1].set_title('Price by Papers')
 
-sns.boxplot(data=df, x='full_set', y='price', ax=ax[2])
-ax[2].set_yscale('log')
-ax[2].set_title('Price by Full Set')
-plt.tight_layout()
-plt.savefig("plot/01_Price_by_Accessories.png")
+def _figure_task(args):
+    """平行處理用: 讀取一組圖需要的欄位並輸出圖檔"""
+    data_path, plot_dir, names, options = args
+    columns = sorted({col for name in names for col in FIGURES[name][1]})
+    df = load_table(data_path, columns=columns)
 
+    paths = []
+    for name in names:
+        function, _, sampled = FIGURES[name]
+        path = os.path.join(plot_dir, name)
+        function(df, path, **(options if sampled else {}))
+        paths.append(path)
+    return paths
+
+
+def run_eda(data_path=DATA_PATH, plot_dir=PLOT_DIR, n_jobs=1, names=None, **options):
+    """
+    輸出所有 EDA 圖檔
+
+    參數:
+        data_path: 清理後的資料 (CSV 或 Parquet)
+        plot_dir: 輸出資料夾
+        n_jobs: 平行處理的程序數 (預設 1 表示不平行); 各程序只讀取自己的圖需要的欄位
+        names: 要輸出的圖檔名 (預設 None 表示 FIGURES 全部)
+        **options: 散布圖與 LOWESS 的抽樣設定
+            (sample_size, lowess_sample_size, lowess_max_rows, seed)
+
+    回傳:
+        輸出的檔案路徑列表
+    """
+    os.makedirs(plot_dir, exist_ok=True)
+    names = list(FIGURES) if names is None else list(names)
+
+    # 散布圖 + LOWESS 最花時間, 先分配
+    n_chunks = max(1, min(n_jobs, len(names)))
+    names.sort(key=lambda name: not FIGURES[name][2])
+    tasks = [(data_path, plot_dir, names[chunk::n_chunks], options) for chunk in range(n_chunks)]
+
+    if n_chunks == 1:
+        parts = [_figure_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_chunks) as pool:
+            parts = list(pool.map(_figure_task, tasks))
+    paths = [path for part in parts for path in part]
+
+    for path in paths:
+        print(f"圖檔已儲存至 {path}")
+    return paths
 
 
 # temp
@@ -124,4 +305,29 @@ sns.boxplot( x="condition",y="price",
             palette=["m", "g"],
             data=df,log_scale=True
             )
-"""
\ No newline at end of file
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EDA 圖檔")
+    parser.add_argument("--data", default=DATA_PATH, help="清理後的資料 (CSV 或 Parquet)")
+    parser.add_argument("--plot-dir", default=PLOT_DIR, help="輸出資料夾")
+    parser.add_argument("--jobs", type=int, default=1, help="平行處理的程序數")
+    parser.add_argument("--sample-size", type=int, default=SCATTER_SAMPLE_SIZE,
+                        help="散布圖最多畫出的點數 (0 表示畫出全部)")
+    parser.add_argument("--lowess-sample-size", type=int, default=0,
+                        help="LOWESS 先分層抽樣的筆數 (0 表示使用全部資料)")
+    parser.add_argument("--lowess-max-rows", type=int, default=LOWESS_MAX_ROWS,
+                        help="超過此筆數時 LOWESS 改用網格近似")
+    parser.add_argument("--seed", type=int, default=0, help="抽樣的亂數種子")
+    args = parser.parse_args()
+
+    run_eda(
+        args.data,
+        args.plot_dir,
+        n_jobs=args.jobs,
+        sample_size=args.sample_size or None,
+        lowess_sample_size=args.lowess_sample_size or None,
+        lowess_max_rows=args.lowess_max_rows,
+        seed=args.seed,
+    )
@@ -1,5 +1,143 @@
+import json
 import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.preprocessing import LabelEncoder
+from _00_schema import SCHEMA, apply_schema, widen_floats
+from _00_stats import group_quantiles, stable_group_order
+from _00_storage import load_table, read_columns, save_table
+from _01_datacleaner import (
+    FULL_SET_SCOPE,
+    MAX_PRODUCTION_YEAR,
+    MIN_PRODUCTION_YEAR,
+    SCOPE_MAPPING,
+    RolexDataCleaner,
+)
+
+# 載入時不需要的欄位
+DROP_COLUMNS = [
+    'ad name', 
+    'case material', 
+    'year of production', 
+    'scope of delivery',
+    'location'
+]
+
+
+# 分層補值: 欄位 → 統計方式, 以及依序使用的分組鍵
+IMPUTE_SPEC = {
+    'age': 'median',
+    'case diameter': 'median',
+    'movement': 'mode',
+    'material_group': 'mode',
+}
+IMPUTE_KEYS = ['reference number', 'model']
+
+# 轉為整數的價格欄位
+PRICE_COLUMNS = ["price", "aditional shipping price", "ship_total"]
+
+
+def group_mode(codes, values, n_groups):
+    """
+    以計數方式計算各群組的眾數 (同 agg(lambda x: x.mode()[0]))
+    
+    參數:
+        codes: 每筆資料的群組編號 (-1 表示群組鍵缺失)
+        values: 要計算眾數的欄位 (缺失值不計)
+        n_groups: 群組數
+        
+    回傳:
+        長度為 n_groups 的 object 陣列 (沒有資料的群組為 np.nan)
+    """
+    # 值依排序編號, 同次數時取編號最小者即為 mode()[0]
+    value_codes, uniques = pd.factorize(values, sort=True)
+    valid = (codes >= 0) & (value_codes >= 0)
+    
+    # 一次計算所有 (群組, 值) 組合的次數
+    pairs, counts = np.unique(
+        codes[valid].astype(np.int64) * len(uniques) + value_codes[valid],
+        return_counts=True,
+    )
+    pair_group, pair_value = np.divmod(pairs, len(uniques))
+    
+    # 依群組、次數 (多到少)、值編號排序, 各群組第一筆即為眾數
+    order = np.lexsort((pair_value, -counts, pair_group))
+    first = order[np.r_[True, pair_group[order][1:] != pair_group[order][:-1]]]
+    
+    result = np.full(n_groups, np.nan, dtype=object)
+    result[pair_group[first]] = np.asarray(uniques, dtype=object)[pair_value[first]]
+    return result
+
+
+def group_statistics(df, key, spec):
+    """
+    以單次分組計算各群組的補值統計值
+    
+    參數:
+        df: 資料
+        key: 分組欄位
+        spec: 欄位 → 統計方式 ('median' 或 'mode')
+        
+    回傳:
+        (codes, stats): 每筆資料的群組編號, 以及欄位 → 以 key 為 index 的統計值 Series
+        (Series 的順序與群組編號一致, 沒有資料的群組為 np.nan)
+    """
+    # 分組鍵只編碼一次, 之後都以整數編號計算
+    codes, keys = pd.factorize(df[key])
+    stats = {}
+    
+    # 所有中位數欄位一次分組計算 (缺失值不計)
+    median_cols = [col for col, stat in spec.items() if stat == 'median']
+    if median_cols:
+        medians = df[median_cols].groupby(codes).median().reindex(range(len(keys)))
+        stats.update({col: pd.Series(medians[col].to_numpy(), index=keys) for col in median_cols})
+    
+    for col, stat in spec.items():
+        if stat == 'mode':
+            stats[col] = pd.Series(group_mode(codes, df[col], len(keys)), index=keys)
+        elif stat != 'median':
+            raise ValueError(f"不支援的統計方式: {stat}")
+    
+    return codes, stats
+
+
+def _group_quantiles_task(args):
+    """平行處理用: 計算一段群組的分位數"""
+    return group_quantiles(*args)
+
+
+def group_quartiles(codes, values, n_groups, n_jobs=1):
+    """
+    計算所有群組的 Q1 與 Q3, 可選擇多核心平行處理
+    
+    參數:
+        codes: 每筆資料的群組編號 (0 ~ n_groups-1)
+        values: 數值陣列 (不可含缺失值)
+        n_groups: 群組數
+        n_jobs: 平行處理的程序數 (預設 1 表示不平行)
+        
+    回傳:
+        (q1, q3) 兩個長度為 n_groups 的陣列
+    """
+    if n_jobs <= 1 or n_groups < n_jobs:
+        return tuple(group_quantiles(codes, values, n_groups))
+    
+    # 依資料筆數把群組切成連續的區段, 讓每個程序的工作量相近
+    counts = np.bincount(codes, minlength=n_groups)
+    cuts = np.searchsorted(np.cumsum(counts), np.linspace(0, len(codes), n_jobs + 1)[1:-1])
+    bounds = np.unique(np.concatenate(([0], cuts, [n_groups])))
+    
+    tasks = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        in_block = (codes >= lo) & (codes < hi)
+        tasks.append((codes[in_block] - lo, values[in_block], hi - lo))
+    
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        parts = list(pool.map(_group_quantiles_task, tasks))
+    
+    q1 = np.concatenate([part[0] for part in parts])
+    q3 = np.concatenate([part[1] for part in parts])
+    return q1, q3
 
 class DataPreprocessor:
     """用來預處理和清理資料的類別"""
@@ -9,24 +147,25 @@ class DataPreprocessor:
         初始化預處理器
         
         參數:
-            csv_path: CSV 檔案路徑
+            csv_path: CSV 或 Parquet 檔案路徑
         """
         self.csv_path = csv_path
         self.df = None
         self.label_encoders = {}
         
+        # fit 後的狀態 (供 save_state 保存)
+        self.outlier_bounds = None
+        self.impute_maps = {}
+        self.condition_mode = None
+        
     def load_data(self):
         """讀取並進行初步清理"""
-        df = pd.read_csv(self.csv_path, index_col=0)
+        # 只讀取需要的欄位 (不需要的欄位不載入)
+        columns = [c for c in read_columns(self.csv_path) if c not in DROP_COLUMNS]
+        df = load_table(self.csv_path, columns=columns, index_col=0, schema=SCHEMA)
         
-        # 移除不需要的欄位
-        df = df.drop([
-            'ad name', 
-            'case material', 
-            'year of production', 
-            'scope of delivery',
-            'location'
-        ], axis=1)
+        # 補值的中位數以 float64 計算 (float32 欄位以原本的十進位值還原)
+        df = widen_floats(df)
         
         # 移除關鍵欄位的空值
         df = df.dropna(subset=['reference number', 'price'])
@@ -34,125 +173,104 @@ class DataPreprocessor:
         self.df = df
         return self
     
-    def remove_outliers(self, iqr_multiplier=1.5):
-        """根據 reference number 分組移除價格異常值"""
-        def filter_group(group):
-            Q1 = group['price'].quantile(0.25)
-            Q3 = group['price'].quantile(0.75)
-            IQR = Q3 - Q1
-            
-            lower_bound = Q1 - iqr_multiplier * IQR
-            upper_bound = Q3 + iqr_multiplier * IQR
-            
-            return group[(group['price'] >= lower_bound) & (group['price'] <= upper_bound)]
+    def remove_outliers(self, iqr_multiplier=1.5, n_jobs=1):
+        """
+        根據 reference number 分組移除價格異常值
         
-        self.df = self.df.groupby(
-            ['reference number']
-        ).apply(filter_group).reset_index(drop=True)
+        一次排序計算所有型號的 Q1/Q3, 再以單一遮罩過濾,
+        保留的資料與排列順序與逐群組 apply 相同 (依型號排序, 型號內維持原順序)。
         
-        return self
-    
-    def impute_age(self):
-        """補值：age（錶齡）"""
-        # 先用 reference number 的中位數補值
-        ref_age_map = self.df[self.df['age'].notna()].groupby(
-            ['reference number']
-        )['age'].median()
-        self.df["age"] = self.df["age"].fillna(self.df["reference number"].map(ref_age_map))
-        
-        # 如果還有缺失，用 model 的中位數補值
-        if self.df["age"].isna().any():
-            model_age_map = self.df[self.df['age'].notna()].groupby(
-                ['model']
-            )['age'].median()
-            self.df["age"] = self.df["age"].fillna(self.df["model"].map(model_age_map))
+        參數:
+            iqr_multiplier: IQR 倍數 (預設 1.5)
+            n_jobs: 計算分位數的平行程序數 (預設 1, 資料量極大時可調高)
+        """
+        codes, refs = pd.factorize(self.df['reference number'], sort=True)
+        prices = self.df['price'].to_numpy()
         
-        self.df["age"] = self.df["age"].astype(int)
-        return self
-    
-    def impute_case_diameter(self):
-        """補值：case diameter（錶殼直徑）"""
-        # 先用 reference number 的中位數補值
-        ref_size_map = self.df[self.df['case diameter'].notna()].groupby(
-            ['reference number']
-        )['case diameter'].median()
-        self.df["case diameter"] = self.df["case diameter"].fillna(
-            self.df["reference number"].map(ref_size_map)
+        Q1, Q3 = group_quartiles(codes, prices, len(refs), n_jobs=n_jobs)
+        IQR = Q3 - Q1
+        
+        lower_bound = Q1 - iqr_multiplier * IQR
+        upper_bound = Q3 + iqr_multiplier * IQR
+        self.outlier_bounds = pd.DataFrame(
+            {'lower_bound': lower_bound, 'upper_bound': upper_bound}, index=refs
         )
         
-        # 如果還有缺失，用 model 的中位數補值
-        if self.df["case diameter"].isna().any():
-            model_size_map = self.df[self.df['case diameter'].notna()].groupby(
-                ['model']
-            )['case diameter'].median()
-            self.df["case diameter"] = self.df["case diameter"].fillna(
-                self.df["model"].map(model_size_map)
-            )
+        keep = (prices >= lower_bound[codes]) & (prices <= upper_bound[codes])
+        
+        # 依型號排序 (穩定排序保留型號內的原順序)
+        rows = np.flatnonzero(keep)
+        rows = rows[stable_group_order(codes[rows])]
+        self.df = self.df.iloc[rows].reset_index(drop=True)
         
         return self
     
-    def impute_movement(self):
-        """補值：movement（機芯）"""
-        # 先用 reference number 的眾數補值
-        ref_mvmt_map = self.df[self.df['movement'].notna()].groupby(
-            ['reference number']
-        )['movement'].agg(lambda x: x.mode()[0])
-        self.df["movement"] = self.df["movement"].fillna(
-            self.df["reference number"].map(ref_mvmt_map)
-        )
+    def impute_hierarchical(self, spec=None, keys=None):
+        """
+        依分組鍵的順序逐層補值
         
-        # 如果還有缺失，用 model 的眾數補值
-        if self.df["movement"].isna().any():
-            model_mvmt_map = self.df[self.df['movement'].notna()].groupby(
-                ['model']
-            )['movement'].agg(lambda x: x.mode()[0])
-            self.df["movement"] = self.df["movement"].fillna(
-                self.df["model"].map(model_mvmt_map)
-            )
+        每一層以單次分組計算所有欄位的統計值, 補完後才計算下一層,
+        因此下一層的統計值會包含上一層已補上的值。
         
-        return self
-    
-    def impute_material_group(self):
-        """補值：material_group（材質分組）"""
-        # 先用 reference number 的眾數補值
-        ref_mat_map = self.df[self.df['material_group'].notna()].groupby(
-            ['reference number']
-        )['material_group'].agg(lambda x: x.mode()[0])
-        self.df["material_group"] = self.df["material_group"].fillna(
-            self.df["reference number"].map(ref_mat_map)
-        )
+        參數:
+            spec: 欄位 → 統計方式 ('median' 或 'mode') 的對照 (預設 IMPUTE_SPEC)
+            keys: 分組鍵的順序 (預設 IMPUTE_KEYS, 可再加上其他層級)
+        """
+        if spec is None:
+            spec = IMPUTE_SPEC
+        if keys is None:
+            keys = IMPUTE_KEYS
         
-        # 如果還有缺失，用 model 的眾數補值
-        if self.df["material_group"].isna().any():
-            model_mat_map = self.df[self.df['material_group'].notna()].groupby(
-                ['model']
-            )['material_group'].agg(lambda x: x.mode()[0])
-            self.df["material_group"] = self.df["material_group"].fillna(
-                self.df["model"].map(model_mat_map)
-            )
+        for key in keys:
+            # 已經沒有缺失的欄位不再計算
+            pending = {col: stat for col, stat in spec.items() if self.df[col].isna().any()}
+            if not pending:
+                break
+            
+            codes, stats = group_statistics(self.df, key, pending)
+            for col, value_map in stats.items():
+                self.impute_maps.setdefault(key, {})[col] = value_map.dropna()
+                
+                # 最後補一個 NaN, 群組鍵缺失 (編號 -1) 的資料會取到它
+                fill = np.append(value_map.to_numpy(), np.nan)[codes]
+                self.df[col] = self.df[col].fillna(pd.Series(fill, index=self.df.index))
         
         return self
     
+    def impute_age(self):
+        """補值：age（錶齡）, reference number 中位數 → model 中位數"""
+        self.impute_hierarchical({'age': 'median'})
+        self.df["age"] = self.df["age"].astype(int)
+        return self
+    
+    def impute_case_diameter(self):
+        """補值：case diameter（錶殼直徑）, reference number 中位數 → model 中位數"""
+        return self.impute_hierarchical({'case diameter': 'median'})
+    
+    def impute_movement(self):
+        """補值：movement（機芯）, reference number 眾數 → model 眾數"""
+        return self.impute_hierarchical({'movement': 'mode'})
+    
+    def impute_material_group(self):
+        """補值：material_group（材質分組）, reference number 眾數 → model 眾數"""
+        return self.impute_hierarchical({'material_group': 'mode'})
+    
     def impute_condition(self):
         """補值：condition（狀況）"""
         # 用全體眾數補值
-        self.df["condition"] = self.df["condition"].fillna(
-            self.df["condition"].mode()[0]
-        )
+        self.condition_mode = self.df["condition"].mode()[0]
+        self.df["condition"] = self.df["condition"].fillna(self.condition_mode)
         return self
     
     def convert_price_to_int(self):
         """轉換價格欄位為整數"""
-        price_cols = ["price", "aditional shipping price", "ship_total"]
-        self.df[price_cols] = self.df[price_cols].astype(int)
+        self.df[PRICE_COLUMNS] = self.df[PRICE_COLUMNS].astype(int)
         return self
     
     def impute_all(self):
         """執行所有補值步驟"""
-        self.impute_age()
-        self.impute_case_diameter()
-        self.impute_movement()
-        self.impute_material_group()
+        self.impute_hierarchical()
+        self.df["age"] = self.df["age"].astype(int)
         self.impute_condition()
         self.convert_price_to_int()
         return self
@@ -167,10 +285,10 @@ class DataPreprocessor:
         if columns is None:
             columns = ['movement', 'condition', 'material_group', 'country']
         
-        le = LabelEncoder()
-        
         for col in columns:
             if col in self.df.columns:
+                # 每個欄位各自一個編碼器
+                le = LabelEncoder()
                 self.df[col + "_encoded"] = le.fit_transform(self.df[col])
                 self.label_encoders[col] = le
         
@@ -182,24 +300,240 @@ class DataPreprocessor:
         self.remove_outliers()
         self.impute_all()
         self.encode_categorical()
+        self.downcast()
+        return self
+    
+    def downcast(self):
+        """預處理完成後套用 _00_schema.SCHEMA 的欄位型別, 降低記憶體用量"""
+        self.df = apply_schema(self.df)
         return self
     
     def get_data(self):
         """取得處理後的資料"""
         return self.df
     
+    def export_state(self, vocabularies=None, data_year=2023, max_shipping=None):
+        """
+        匯出 fit 後的狀態 (只含基本型別, 可直接存成 JSON)
+        
+        參數:
+            vocabularies: RolexDataCleaner.vocabularies (稀有值分組保留的類別)
+            data_year: 計算錶齡的年份 (需與清理時相同)
+            max_shipping: RolexDataCleaner.max_shipping (清理時的運費上限, None 表示不檢查)
+            
+        回傳:
+            狀態 dict
+        """
+        impute_maps = {
+            key: {
+                col: {str(k): _to_python(v) for k, v in value_map.items()}
+                for col, value_map in maps.items()
+            }
+            for key, maps in self.impute_maps.items()
+        }
+        
+        outlier_bounds = {}
+        if self.outlier_bounds is not None:
+            outlier_bounds = {
+                str(ref): [float(row.lower_bound), float(row.upper_bound)]
+                for ref, row in self.outlier_bounds.iterrows()
+            }
+        
+        return {
+            'data_year': data_year,
+            'max_shipping': _to_python(max_shipping),
+            'vocabularies': {col: list(vocab) for col, vocab in (vocabularies or {}).items()},
+            'outlier_bounds': outlier_bounds,
+            'impute_keys': list(self.impute_maps),
+            'impute_maps': impute_maps,
+            'condition_mode': _to_python(self.condition_mode),
+            'label_encoders': {
+                col: [_to_python(c) for c in le.classes_]
+                for col, le in self.label_encoders.items()
+            },
+        }
+    
+    def save_state(self, output_path="data/preprocess_state.json", vocabularies=None, data_year=2023,
+                   max_shipping=None):
+        """
+        儲存 fit 後的狀態, 供 ListingTransformer 轉換新資料
+        
+        參數:
+            output_path: 輸出檔案路徑
+            vocabularies: RolexDataCleaner.vocabularies (稀有值分組保留的類別)
+            data_year: 計算錶齡的年份 (需與清理時相同)
+            max_shipping: RolexDataCleaner.max_shipping (清理時的運費上限)
+        """
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(self.export_state(vocabularies, data_year, max_shipping), f, ensure_ascii=False)
+        print(f"狀態已儲存至 {output_path}")
+        return self
+    
     def save_data(self, output_path="data/data_clean.csv"):
         """
         儲存處理後的資料
         
         參數:
-            output_path: 輸出檔案路徑
+            output_path: 輸出檔案路徑 (副檔名為 .parquet 時存成 Parquet)
         """
-        self.df.to_csv(output_path)
+        save_table(self.df, output_path, index=True)
         print(f"資料已儲存至 {output_path}")
         return self
 
 
+def _to_python(value):
+    """numpy 純量轉成 Python 基本型別"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _is_missing(value):
+    """單一值是否為缺失值"""
+    return value is None or (isinstance(value, float) and value != value)
+
+
+class ListingTransformer:
+    """以 fit 後的狀態轉換單筆或少量刊登資料, 不需載入完整資料集"""
+    
+    def __init__(self, state):
+        """
+        初始化轉換器
+        
+        參數:
+            state: DataPreprocessor.export_state 的結果
+        """
+        self.state = state
+        self.data_year = state['data_year']
+        # 舊版狀態檔沒有運費上限, 不檢查
+        self.max_shipping = state.get('max_shipping')
+        self.vocabularies = {col: set(vocab) for col, vocab in state['vocabularies'].items()}
+        self.outlier_bounds = state['outlier_bounds']
+        self.impute_keys = state['impute_keys']
+        self.impute_maps = state['impute_maps']
+        self.condition_mode = state['condition_mode']
+        self.encoders = {
+            col: {value: code for code, value in enumerate(classes)}
+            for col, classes in state['label_encoders'].items()
+        }
+        self._cleaner = RolexDataCleaner(None, data_year=self.data_year)
+    
+    @classmethod
+    def load(cls, path="data/preprocess_state.json"):
+        """從 save_state 儲存的檔案建立轉換器"""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+    
+    def _group(self, col, value):
+        """套用稀有值分組 (沒有保存分組類別時維持原值)"""
+        if _is_missing(value) or col not in self.vocabularies:
+            return value
+        return value if value in self.vocabularies[col] else "Other"
+    
+    def transform(self, listing):
+        """
+        轉換單筆原始刊登資料 (欄位同 rolex_scaper_clean.csv)
+        
+        與 process_all 相同的步驟, 但清理與預處理時會移除的資料只標記不移除
+        (需要移除時用 transform_batch(..., drop_excluded=True)):
+        運費超過上限或缺失標記在 over_max_shipping, 價格超出 IQR 範圍標記在 is_outlier。
+        價格缺失時 ship_total 為 NaN, is_outlier 為 False。
+        
+        參數:
+            listing: 原始欄位的 dict
+            
+        回傳:
+            預處理後欄位的 dict, 另含 over_max_shipping 與 is_outlier
+        """
+        row = {
+            'model': listing.get('model'),
+            'reference number': listing.get('reference number'),
+            'price': listing.get('price'),
+            'aditional shipping price': listing.get('aditional shipping price'),
+            'movement': listing.get('movement'),
+            'condition': listing.get('condition'),
+        }
+        
+        # 清理: 錶齡、錶殼尺寸、材質與國家分組、配件
+        year = listing.get('year of production')
+        if _is_missing(year) or not MIN_PRODUCTION_YEAR <= year <= MAX_PRODUCTION_YEAR:
+            row['age'] = np.nan
+        else:
+            row['age'] = self.data_year - year
+        row['case diameter'] = self._cleaner.clean_case_size(listing.get('case diameter'))
+        row['material_group'] = self._group('material_group', listing.get('case material'))
+        
+        scope = listing.get('scope of delivery')
+        mapping = SCOPE_MAPPING.get(scope)
+        row['has_box'] = int(mapping['has_box']) if mapping else np.nan
+        row['has_papers'] = int(mapping['has_papers']) if mapping else np.nan
+        row['full_set'] = int(scope == FULL_SET_SCOPE)
+        
+        # 運費: 同 calculate_total_price 的過濾條件 (缺失的運費也會被過濾)
+        shipping = row['aditional shipping price']
+        row['over_max_shipping'] = (
+            self.max_shipping is not None
+            and (_is_missing(shipping) or not shipping <= self.max_shipping)
+        )
+        if _is_missing(row['price']) or _is_missing(shipping):
+            row['ship_total'] = np.nan
+        else:
+            row['ship_total'] = row['price'] + shipping
+        
+        location = listing.get('location')
+        country = location.split(",")[0].strip() if isinstance(location, str) else location
+        row['country'] = self._group('country', country)
+        
+        # 異常值: 只標記, 不移除
+        bounds = self.outlier_bounds.get(str(row['reference number']))
+        row['is_outlier'] = (
+            bounds is not None and not _is_missing(row['price'])
+            and not bounds[0] <= row['price'] <= bounds[1]
+        )
+        
+        # 分層補值
+        for key in self.impute_keys:
+            key_value = str(row[key])
+            for col, value_map in self.impute_maps[key].items():
+                if _is_missing(row[col]):
+                    row[col] = value_map.get(key_value, row[col])
+        if not _is_missing(row['age']):
+            row['age'] = int(row['age'])
+        if _is_missing(row['condition']):
+            row['condition'] = self.condition_mode
+        
+        # 價格轉為整數 (同 convert_price_to_int)
+        for col in PRICE_COLUMNS:
+            if not _is_missing(row[col]):
+                row[col] = int(row[col])
+        
+        # 編碼 (未出現過的類別為 -1)
+        for col, codes in self.encoders.items():
+            row[col + "_encoded"] = codes.get(row[col], -1)
+        
+        return row
+    
+    def transform_batch(self, listings, drop_excluded=False):
+        """
+        轉換多筆原始刊登資料
+        
+        參數:
+            listings: dict 的列表, 或原始欄位的 DataFrame
+            drop_excluded: 是否移除清理與預處理時會被移除的資料
+                (缺少型號或價格、運費超過上限、價格異常值; 預設 False 表示只標記)
+            
+        回傳:
+            預處理後的 DataFrame
+        """
+        if isinstance(listings, pd.DataFrame):
+            listings = listings.to_dict("records")
+        df = pd.DataFrame([self.transform(listing) for listing in listings])
+        if drop_excluded and len(df):
+            excluded = (df['reference number'].isna() | df['price'].isna()
+                        | df['over_max_shipping'] | df['is_outlier'])
+            df = df[~excluded].reset_index(drop=True)
+            df[PRICE_COLUMNS] = df[PRICE_COLUMNS].astype(int)
+        return df
+
+
 # 使用範例
 if __name__ == "__main__":
     # 方法 1: 一次執行所有步驟
@@ -213,6 +547,7 @@ if __name__ == "__main__":
     preprocessor.remove_outliers(iqr_multiplier=1.5)  # 可調整 IQR 倍數
     preprocessor.impute_all()
     preprocessor.encode_categorical(['movement', 'condition', 'material_group', 'country'])
+    preprocessor.downcast()  # 套用欄位型別, 降低記憶體用量
     df_clean = preprocessor.get_data()
     
     # 或直接儲存
@@ -1,60 +1,316 @@
+import argparse
+from functools import partial
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-import matplotlib
-from scipy import stats
 import sqlite3
+import zlib
+from _00_cache import DATASET_DIGEST_TABLE, dataset_version, reference_digests, write_dataset_version
+from _00_depreciation import fit_references
+from _00_reference_index import ReferenceIndex
+from _00_schema import SCHEMA, widen_floats
+from _00_storage import load_table
+from _00_stats import (
+    bootstrap_linregress,
+    dispersion_from_moments,
+    group_sorted_values,
+    linregress_from_moments,
+    mean_confidence_interval,
+    percentile_interval,
+    quantiles_from_sorted,
+    reference_moments,
+)
 
-matplotlib.rc("font", family="Microsoft JhengHei")  # Windows 範例
-matplotlib.rc("axes", unicode_minus=False)
+# 預處理後的資料 (副檔名為 .parquet 時以 Parquet 讀取)
+DATA_PATH = "data/data_clean.csv"
+DB_PATH = "data/rolex.db"
 
-df= pd.read_csv("data/data_clean.csv",index_col=0)
+# 價格正常範圍: Q1 - 1.5*IQR ~ Q3 + 1.5*IQR
+IQR_MULTIPLIER = 1.5
 
-ref_depreciation = {}
+# 錶齡價格曲線平均價格的信賴水準
+CURVE_CONFIDENCE = 0.95
 
-for ref in df['reference number'].unique():
-    ref_data = df[df['reference number'] == ref]
-    if len(ref_data) >10 and len(ref_data["age"].unique())>1:
-        slope, intercept, r_value, p_value, std_err = stats.linregress(ref_data['age'], ref_data['price'])
-        r_squared= r_value**2
-        if p_value<0.05 and r_squared> 0.3:
-            ref_depreciation[ref] = {
-                'slope': slope,  # 負值表示衰減程度
-                'r_squared':r_squared,
-                'avg_price': ref_data['price'].mean(),
-                "p_value" : p_value,
-                "n":len(ref_data)
-            }
+# 折舊模型擬合的時間預算 (秒), 超過後剩下的型號只擬合 log-linear
+# (預設 None 表示不限制; 設定時選出的模型與機器速度有關)
+DEPRECIATION_TIME_BUDGET = None
 
-r_rate_df= pd.DataFrame(ref_depreciation).T
-r_rate_df = r_rate_df.reset_index().rename(columns={'index': 'ref'})
-r_rate_df.sort_values(by="slope",ascending=False,inplace=True)
+# 波動度: 錶齡分組的寬度 (年) 與納入比較的最少筆數
+AGE_BUCKET_YEARS = 5
+MIN_BUCKET_COUNT = 3
 
-r_rate_df["年貶值率"]= r_rate_df["slope"]*-1
-r_rate_df["年升值率"]= r_rate_df["slope"]
+# 保值率 bootstrap: 重抽樣次數、信賴水準與最少筆數 (同 _05 的 MIN_REGRESSION_SAMPLES)
+BOOTSTRAP_SAMPLES = 1000
+BOOTSTRAP_CONFIDENCE = 0.95
+MIN_BOOTSTRAP_SAMPLES = 10
 
-depreciation_10= r_rate_df.nsmallest(10,"slope").reset_index(drop=True)
-appreciation_10=r_rate_df.nlargest(10,"slope").reset_index(drop=True)
+# ===================================================
+#  保值率計算
+# ===================================================
+
+def compute_retention_rates(df):
+    """
+    計算各型號的保值率 (age vs price 線性迴歸)
+
+    參數:
+        df: 含 reference number、age、price 的資料
+
+    回傳:
+        value_retention_rate 資料表 (依 slope 由大到小排序)
+    """
+    # 一次計算所有型號的 (age, price) 充分統計量, 再批次求出線性迴歸
+    moments = reference_moments(df)
+    fit = linregress_from_moments(moments)
+    fit["r_squared"] = fit["r_value"]**2
+
+    eligible = (moments["n"] > 10) & (moments["n_x"] > 1)
+    significant = eligible & (fit["p_value"] < 0.05) & (fit["r_squared"] > 0.3)
+
+    r_rate_df = pd.DataFrame({
+        'slope': fit["slope"],  # 負值表示衰減程度
+        'r_squared': fit["r_squared"],
+        'avg_price': moments["sum_y"] / moments["n"],
+        "p_value": fit["p_value"],
+        "n": moments["n"].astype(float),
+    })[significant]
+    r_rate_df = r_rate_df.reset_index().rename(columns={'reference number': 'ref'})
+    r_rate_df.sort_values(by="slope",ascending=False,inplace=True)
+
+    r_rate_df["年貶值率"]= r_rate_df["slope"]*-1
+    r_rate_df["年升值率"]= r_rate_df["slope"]
+    return r_rate_df
 
 # ===================================================
-#  SQL
+#  型號價格統計
 # ===================================================
 
-connection= sqlite3.connect("data/rolex.db")
-df.to_sql("rolex",con=connection,if_exists="replace",index=False)
-r_rate_df.to_sql("value_retention_rate",con=connection,if_exists="replace",index=False)
+def compute_reference_stats(df):
+    """
+    計算各型號的價格統計量與排序後的價格 (reference_stats 資料表)
+
+    參數:
+        df: 含 reference number、price 的資料
+
+    回傳:
+        reference_stats 資料表, 欄位為 ref、count、mean、median、std、min、max、
+        q1、q3、lower_bound、upper_bound、prices (由小到大的 float64 價格陣列, BLOB)
+    """
+    codes, refs = pd.factorize(df["reference number"])
+    price = df["price"].to_numpy(dtype=float)
+
+    # 一次排序所有型號的價格, 分位數同 Series.quantile
+    sorted_prices, starts, counts = group_sorted_values(codes, price, len(refs))
+    q1, median, q3 = quantiles_from_sorted(sorted_prices, starts, counts, (0.25, 0.5, 0.75))
+
+    mean = np.bincount(codes, weights=price, minlength=len(refs)) / counts
+    squared_dev = np.bincount(codes, weights=(price - mean[codes])**2, minlength=len(refs))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.where(counts > 1, np.sqrt(squared_dev / (counts - 1)), np.nan)
+
+    iqr = q3 - q1
+    ends = starts + counts
+    return pd.DataFrame({
+        "ref": refs,
+        "count": counts,
+        "mean": mean,
+        "median": median,
+        "std": std,
+        "min": sorted_prices[starts],
+        "max": sorted_prices[ends - 1],
+        "q1": q1,
+        "q3": q3,
+        "lower_bound": q1 - IQR_MULTIPLIER * iqr,
+        "upper_bound": q3 + IQR_MULTIPLIER * iqr,
+        "prices": [sorted_prices[a:b].tobytes() for a, b in zip(starts, ends)],
+    })
+
+# ===================================================
+#  錶齡價格曲線
+# ===================================================
+
+def compute_age_price_curve(df, confidence=CURVE_CONFIDENCE):
+    """
+    計算各型號每個錶齡的平均價格與信賴區間 (ref_age_price_curve 資料表)
+
+    參數:
+        df: 含 reference number、age、price 的資料
+        confidence: 平均價格信賴區間的信賴水準
+
+    回傳:
+        ref_age_price_curve 資料表 (依 ref、age 排序), 欄位為 ref、age、count、mean、std、
+        ci_lower、ci_upper (t 分配信賴區間; 只有一筆資料時上下界皆為 mean)
+    """
+    curve = (
+        df.groupby(["reference number", "age"], observed=True)["price"]
+        .agg(["count", "mean", "std"])
+        .reset_index()
+        .rename(columns={"reference number": "ref"})
+    )
+    curve["ref"] = curve["ref"].astype(object)
+    curve["ci_lower"], curve["ci_upper"] = mean_confidence_interval(
+        curve["mean"], curve["std"], curve["count"], confidence
+    )
+    return curve
+
+# ===================================================
+#  價格波動度
+# ===================================================
+
+def compute_volatility(df, bucket_years=AGE_BUCKET_YEARS, min_bucket_count=MIN_BUCKET_COUNT):
+    """
+    計算各型號的價格波動度 (reference_volatility 資料表)
+
+    - cv: 價格標準差 / 平均價格
+    - residual_std / residual_cv: 扣除錶齡線性趨勢後的殘差標準差 (及其除以平均價格)
+    - bucket_range / bucket_range_ratio: 各錶齡分組平均價格的最大差距 (及其除以平均價格),
+      只比較筆數達 min_bucket_count 的分組, 不足兩組時為 NaN
+
+    參數:
+        df: 含 reference number、age、price 的資料
+        bucket_years: 錶齡分組的寬度 (年)
+        min_bucket_count: 錶齡分組納入比較的最少筆數
+
+    回傳:
+        reference_volatility 資料表 (資料筆數大於 10 的型號, 依 cv 由大到小排序)
+    """
+    # 一次計算所有型號的 (age, price) 充分統計量
+    moments = reference_moments(df)
+    dispersion = dispersion_from_moments(moments)
+
+    # 所有 (型號, 錶齡分組) 的平均價格 (筆數不足的分組為 NaN)
+    codes = pd.factorize(df["reference number"])[0].astype(np.int64)
+    buckets = (df["age"].to_numpy(dtype=float) // bucket_years).astype(np.int64)
+    width = buckets.max() + 1 if len(buckets) else 1
+    size = len(moments) * width
+    counts = np.bincount(codes * width + buckets, minlength=size).reshape(-1, width)
+    sums = np.bincount(codes * width + buckets, weights=df["price"].to_numpy(dtype=float),
+                       minlength=size).reshape(-1, width)
+    used = counts >= min_bucket_count
+    bucket_mean = np.divide(sums, counts, out=np.full(sums.shape, np.nan), where=used)
+
+    # fmax / fmin 忽略 NaN
+    n_buckets = used.sum(axis=1)
+    bucket_range = np.where(
+        n_buckets > 1, np.fmax.reduce(bucket_mean, axis=1) - np.fmin.reduce(bucket_mean, axis=1), np.nan
+    )
+
+    volatility = pd.DataFrame({
+        "n": moments["n"].to_numpy(),
+        "mean_price": dispersion["mean"].to_numpy(),
+        "std": dispersion["std"].to_numpy(),
+        "cv": dispersion["cv"].to_numpy(),
+        "residual_std": dispersion["residual_std"].to_numpy(),
+        "residual_cv": (dispersion["residual_std"] / dispersion["mean"]).to_numpy(),
+        "bucket_range": bucket_range,
+        "bucket_range_ratio": bucket_range / dispersion["mean"].to_numpy(),
+        "n_buckets": n_buckets,
+    }, index=moments.index)[moments["n"].to_numpy() > 10]
+
+    volatility = volatility.reset_index().rename(columns={"reference number": "ref"})
+    volatility["ref"] = volatility["ref"].astype(object)
+    return volatility.sort_values(by="cv", ascending=False, ignore_index=True)
+
+# ===================================================
+#  保值率 bootstrap
+# ===================================================
+
+def compute_retention_bootstrap(df, n_boot=BOOTSTRAP_SAMPLES, confidence=BOOTSTRAP_CONFIDENCE):
+    """
+    計算各型號錶齡迴歸的 bootstrap 結果 (retention_bootstrap 資料表)
+
+    每個型號的 B 次重抽樣共用一個索引矩陣, 同時求出 price ~ age (linear) 與
+    log(price) ~ age (log_linear) 的斜率與截距; 結果存成 BLOB,
+    查詢時直接代入錶齡取百分位區間, 不需要重新抽樣。
+    亂數種子由型號名稱決定, 資料排序後再抽樣, 增量更新與完整重建的結果相同。
+
+    參數:
+        df: 含 reference number、age、price 的資料
+        n_boot: 重抽樣次數 B
+        confidence: 斜率區間的信賴水準
+
+    回傳:
+        retention_bootstrap 資料表 (資料筆數至少 MIN_BOOTSTRAP_SAMPLES 的型號), 欄位為 ref、n、n_boot、
+        slope_lower、slope_upper、log_slope_lower、log_slope_upper、
+        draws ((4, B) 的 float32 陣列 [slope, intercept, log_slope, log_intercept], BLOB)
+    """
+    codes, refs = pd.factorize(df["reference number"])
+    age = df["age"].to_numpy(dtype=float)
+    price = df["price"].to_numpy(dtype=float)
+
+    # 依 (型號, 錶齡, 價格) 排序, 結果與資料順序無關
+    order = np.lexsort((price, age, codes))
+    counts = np.bincount(codes, minlength=len(refs))
+    ends = np.cumsum(counts)
+
+    rows = []
+    for ref, count, end in zip(refs, counts, ends):
+        if count < MIN_BOOTSTRAP_SAMPLES:
+            continue
+        index = order[end - count:end]
+        x, y = age[index], price[index]
+        # log 價格同 log_linear 折舊模型 (小於 1 的價格視為 1)
+        seed = zlib.crc32(str(ref).encode())
+        slope, intercept = bootstrap_linregress(x, np.vstack([y, np.log(np.maximum(y, 1.0))]), n_boot, seed)
+        rows.append((ref, count, slope[0], slope[1], np.vstack([slope[0], intercept[0], slope[1], intercept[1]])))
+
+    columns = ["ref", "n", "n_boot", "slope_lower", "slope_upper", "log_slope_lower", "log_slope_upper", "draws"]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+
+    ref, n, slope, log_slope, draws = zip(*rows)
+    slope_lower, slope_upper = percentile_interval(np.array(slope), confidence)
+    log_slope_lower, log_slope_upper = percentile_interval(np.array(log_slope), confidence)
+    return pd.DataFrame({
+        "ref": pd.Series(ref, dtype=object),
+        "n": np.array(n),
+        "n_boot": n_boot,
+        "slope_lower": slope_lower,
+        "slope_upper": slope_upper,
+        "log_slope_lower": log_slope_lower,
+        "log_slope_upper": log_slope_upper,
+        "draws": [d.astype(np.float32).tobytes() for d in draws],
+    })[columns]
+
+# ===================================================
+#  Listing ID
+# ===================================================
+
+def add_listing_ids(df):
+    """
+    加上 listing_id 與 row_hash 欄位
+
+    row_hash 為整筆資料內容的雜湊值; 資料沒有 listing_id 欄位時,
+    以 row_hash 加上重複出現的序號 (完全相同的資料第幾次出現) 作為 listing_id,
+    因此內容不變的資料每次計算的 ID 都相同。
+
+    參數:
+        df: 預處理後的資料
+
+    回傳:
+        加上欄位後的新 DataFrame
+    """
+    data_cols = [c for c in df.columns if c not in ("listing_id", "row_hash")]
+    df = df.reset_index(drop=True)
+
+    # SQLite 的 INTEGER 為有號 64 位元
+    row_hash = pd.util.hash_pandas_object(df[data_cols], index=False).to_numpy().view(np.int64)
+    df["row_hash"] = row_hash
+
+    if "listing_id" not in df.columns:
+        occurrence = df["row_hash"].groupby(row_hash, sort=False).cumcount().to_numpy()
+        df["listing_id"] = row_hash + occurrence
+    return df
+
+# ===================================================
+#  SQL
+# ===================================================
 
-cur= connection.cursor()
 drop_view_sql="""Drop VIEW IF EXISTS top10_depreciation_data ;
                  Drop VIEW IF EXISTS top10_appreciation_data ;
                  Drop VIEW IF EXISTS price_analysis ;
                  """
 
 create_d_view_sql="""
-Create VIEW top10_depreciation_data AS 
+Create VIEW top10_depreciation_data AS
 SELECT  DISTINCT rolex.[reference number],
         rolex.model,
         value_retention_rate.avg_price,
@@ -66,7 +322,7 @@ ORDER BY 年貶值率 DESC
 LIMIT 10
 """
 create_a_view_sql="""
-Create VIEW top10_appreciation_data AS 
+Create VIEW top10_appreciation_data AS
 SELECT  DISTINCT rolex.[reference number],
         rolex.model,
         value_retention_rate.avg_price,
@@ -89,9 +345,282 @@ SELECT [reference number],
     FROM rolex ;
 """
 
-cur.executescript(drop_view_sql)
-cur.execute(create_d_view_sql)
-cur.execute(create_a_view_sql)
-cur.execute(create_price_analysis_sql)
+create_listing_index_sql = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_rolex_listing_id ON rolex(listing_id)
+"""
+
+# 依型號查詢用的索引 (price_analysis 單一型號查詢、top10 Views 的 JOIN)
+# 兩個 rolex 索引成本相同時 SQLite 選擇較晚建立的, 因此較窄的 idx_rolex_ref 放在後面:
+# 只以型號篩選或計數時用 idx_rolex_ref, 需要依錶齡排序時用 idx_rolex_ref_age
+create_lookup_index_sql = f"""
+CREATE INDEX IF NOT EXISTS idx_rolex_ref_age ON rolex([reference number], age);
+CREATE INDEX IF NOT EXISTS idx_rolex_ref ON rolex([reference number]);
+CREATE INDEX IF NOT EXISTS idx_retention_ref_slope ON value_retention_rate(ref, slope);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_reference_stats_ref ON reference_stats(ref);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_curve_ref_age ON ref_age_price_curve(ref, age);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_volatility_ref ON reference_volatility(ref);
+-- 波動度排名 (ORDER BY ... DESC LIMIT k 直接由索引取得前 k 名)
+CREATE INDEX IF NOT EXISTS idx_volatility_cv ON reference_volatility(cv);
+CREATE INDEX IF NOT EXISTS idx_volatility_residual_cv ON reference_volatility(residual_cv);
+CREATE INDEX IF NOT EXISTS idx_volatility_bucket_range_ratio ON reference_volatility(bucket_range_ratio);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_depreciation_model_ref ON depreciation_model(ref);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_retention_bootstrap_ref ON retention_bootstrap(ref);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_dataset_digest_ref ON {DATASET_DIGEST_TABLE}(ref, table_name);
+"""
+
+
+def reference_tables(n_jobs=1, time_budget=DEPRECIATION_TIME_BUDGET):
+    """
+    依型號重新計算的彙總資料表
+
+    參數:
+        n_jobs: 折舊模型平行擬合的程序數
+        time_budget: 折舊模型擬合的時間預算 (秒, None 表示不限制)
+
+    回傳:
+        資料表名稱 -> 計算函式 (參數為含 reference number、age、price 的資料)
+    """
+    return {
+        "reference_stats": compute_reference_stats,
+        "ref_age_price_curve": compute_age_price_curve,
+        "reference_volatility": compute_volatility,
+        "depreciation_model": partial(fit_references, n_jobs=n_jobs, time_budget=time_budget),
+        "retention_bootstrap": compute_retention_bootstrap,
+    }
+
+
+# 計算衍生資料表的欄位與排序 (完整重建與增量更新依相同順序加總, 浮點數結果逐位元一致)
+REFERENCE_DATA_COLUMNS = ["reference number", "age", "price"]
+
+
+def reference_data(df):
+    """衍生資料表的輸入: REFERENCE_DATA_COLUMNS 並依 (型號, 錶齡, 價格) 排序"""
+    return df[REFERENCE_DATA_COLUMNS].sort_values(REFERENCE_DATA_COLUMNS, kind="stable", ignore_index=True)
+
+
+def derived_tables(connection):
+    """
+    讀取由 rolex 計算的衍生資料表 (value_retention_rate 與 reference_tables)
+
+    只在舊版資料庫沒有各型號的內容雜湊 (dataset_digest) 時讀取一次; 之後建立或更新資料庫時
+    直接以剛計算完成的資料表求出雜湊。
+
+    參數:
+        connection: SQLite 連線
+
+    回傳:
+        資料表名稱 -> DataFrame
+    """
+    return {
+        table: pd.read_sql(f"SELECT * FROM {table}", connection)
+        for table in ["value_retention_rate", *reference_tables()]
+    }
+
+
+def build_database(df, db_path=DB_PATH, n_jobs=1, time_budget=DEPRECIATION_TIME_BUDGET):
+    """
+    完整重建資料庫 (rolex、value_retention_rate、reference_stats、ref_age_price_curve、
+    reference_volatility、depreciation_model、retention_bootstrap、Views 與 dataset_version)
+
+    參數:
+        df: 預處理後的資料
+        db_path: SQLite 檔案路徑
+        n_jobs: 折舊模型平行擬合的程序數
+        time_budget: 折舊模型擬合的時間預算 (秒, None 表示不限制)
+    """
+    # float32 欄位還原成原本的十進位值再寫入 (row_hash 也與 float64 資料相同)
+    df = add_listing_ids(widen_floats(df))
+    ref_data = reference_data(df)
+    r_rate_df = compute_retention_rates(ref_data)
+
+    connection= sqlite3.connect(db_path)
+    df.to_sql("rolex",con=connection,if_exists="replace",index=False)
+    r_rate_df.to_sql("value_retention_rate",con=connection,if_exists="replace",index=False)
+    digests = [reference_digests("value_retention_rate", r_rate_df)]
+    for table, compute in reference_tables(n_jobs, time_budget).items():
+        result = compute(ref_data)
+        result.to_sql(table,con=connection,if_exists="replace",index=False)
+        digests.append(reference_digests(table, result))
+    digests = pd.concat(digests, ignore_index=True)
+    digests.to_sql(DATASET_DIGEST_TABLE,con=connection,if_exists="replace",index=False)
+
+    cur= connection.cursor()
+    cur.execute(create_listing_index_sql)
+    cur.executescript(create_lookup_index_sql)
+    cur.executescript(drop_view_sql)
+    cur.execute(create_d_view_sql)
+    cur.execute(create_a_view_sql)
+    cur.execute(create_price_analysis_sql)
+
+    # 最後才寫入版本, _05 的快取看到新版本時資料庫已建立完成
+    # (衍生資料表的內容也列入版本, 例如折舊模型的選擇改變時版本也會改變)
+    with connection:
+        write_dataset_version(connection, dataset_version(df["row_hash"], digests))
+
+    cur.close()
+    connection.close()
+
+
+def _param(value):
+    """numpy 純量轉成 sqlite3 可接受的 Python 型別"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _rows(df):
+    """DataFrame 轉成 executemany 用的 tuple 列表 (缺失值為 None)"""
+    values = df.astype(object).where(df.notna(), None)
+    return list(values.itertuples(index=False, name=None))
+
+
+def _table_exists(connection, table):
+    """資料庫中是否有此資料表"""
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def _replace_refs(connection, table, df):
+    """以 df 取代資料表中 changed_refs 型號的資料"""
+    columns = [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+    connection.execute(f"DELETE FROM {table} WHERE ref IN (SELECT ref FROM changed_refs)")
+    connection.executemany(
+        f"INSERT INTO {table} ({', '.join(f'[{c}]' for c in columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))})",
+        _rows(df[columns]),
+    )
+
+
+def update_database(df, db_path=DB_PATH, n_jobs=1, time_budget=DEPRECIATION_TIME_BUDGET):
+    """
+    增量更新資料庫: 只寫入新增/變更的資料、刪除消失的資料,
+    並只重新計算資料有變動的型號的保值率、價格統計、錶齡價格曲線、波動度、折舊模型與 bootstrap 結果,
+    最後寫入資料集版本雜湊 (dataset_version)
+
+    資料庫尚未建立 (或是舊版沒有 listing_id) 時改為完整重建。
+
+    參數:
+        df: 最新的完整預處理資料
+        db_path: SQLite 檔案路徑
+        n_jobs: 折舊模型平行擬合的程序數
+        time_budget: 折舊模型擬合的時間預算 (秒, None 表示不限制)
+
+    回傳:
+        (upserted, deleted, refreshed_refs) 筆數
+    """
+    connection = sqlite3.connect(db_path)
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(rolex)")]
+    indexes = [row[1] for row in connection.execute("PRAGMA index_list(rolex)")]
+    if "listing_id" not in columns or "idx_rolex_listing_id" not in indexes:
+        connection.close()
+        build_database(df, db_path, n_jobs, time_budget)
+        return len(df), 0, df["reference number"].nunique()
+
+    df = add_listing_ids(widen_floats(df))
+    existing = pd.read_sql(
+        "SELECT listing_id, row_hash FROM rolex", connection
+    ).set_index("listing_id")["row_hash"]
+
+    # 新增或內容變更的資料, 以及已不存在的資料
+    known_hash = df["listing_id"].map(existing)
+    changed = df[known_hash.isna() | (known_hash != df["row_hash"])]
+    deleted = existing.index.difference(pd.Index(df["listing_id"]))
+    stale = existing.index.intersection(changed["listing_id"]).append(deleted)
+
+    placeholders = ", ".join("?" * len(columns))
+    column_sql = ", ".join(f"[{c}]" for c in columns)
+
+    with connection:
+        # 受影響的型號: 變更後的型號, 以及被取代/刪除資料原本的型號
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS stale_ids (listing_id PRIMARY KEY)")
+        connection.execute("DELETE FROM stale_ids")
+        connection.executemany("INSERT INTO stale_ids VALUES (?)", [(_param(i),) for i in stale])
+        old_refs = [row[0] for row in connection.execute(
+            """
+            SELECT DISTINCT [reference number] FROM rolex
+            WHERE listing_id IN (SELECT listing_id FROM stale_ids)
+            """
+        )]
+        affected = pd.Index(changed["reference number"].astype(object)).append(
+            pd.Index(old_refs, dtype=object)).unique()
+
+        connection.executemany(
+            f"INSERT OR REPLACE INTO rolex ({column_sql}) VALUES ({placeholders})",
+            _rows(changed[columns]),
+        )
+        connection.executemany(
+            "DELETE FROM rolex WHERE listing_id = ?", [(_param(i),) for i in deleted]
+        )
+
+        # 只重新計算受影響型號的保值率
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS changed_refs (ref TEXT PRIMARY KEY)")
+        connection.execute("DELETE FROM changed_refs")
+        connection.executemany("INSERT INTO changed_refs VALUES (?)", [(r,) for r in affected])
+
+        ref_data = reference_data(pd.read_sql(
+            """
+            SELECT [reference number], age, price FROM rolex
+            WHERE [reference number] IN (SELECT ref FROM changed_refs)
+            """,
+            connection,
+        ))
+        r_rate_df = compute_retention_rates(ref_data)
+        _replace_refs(connection, "value_retention_rate", r_rate_df)
+        digests = [reference_digests("value_retention_rate", r_rate_df)]
+
+        # 舊版資料庫沒有的彙總資料表以完整資料建立
+        all_data = None
+        created = []
+        for table, compute in reference_tables(n_jobs, time_budget).items():
+            if _table_exists(connection, table):
+                result = compute(ref_data)
+                _replace_refs(connection, table, result)
+            else:
+                if all_data is None:
+                    all_data = reference_data(
+                        pd.read_sql("SELECT [reference number], age, price FROM rolex", connection))
+                result = compute(all_data)
+                result.to_sql(table, con=connection, index=False)
+                created.append(table)
+            digests.append(reference_digests(table, result))
+
+        # 各型號的內容雜湊只取代有變動的型號 (完整建立的資料表取代整張表);
+        # 舊版資料庫沒有雜湊時讀取全部衍生資料表計算一次
+        if _table_exists(connection, DATASET_DIGEST_TABLE):
+            connection.execute(f"DELETE FROM {DATASET_DIGEST_TABLE} WHERE ref IN (SELECT ref FROM changed_refs)")
+            connection.executemany(f"DELETE FROM {DATASET_DIGEST_TABLE} WHERE table_name = ?",
+                                   [(table,) for table in created])
+            pd.concat(digests, ignore_index=True).to_sql(DATASET_DIGEST_TABLE, con=connection,
+                                                        if_exists="append", index=False)
+        else:
+            pd.concat([reference_digests(table, result) for table, result in derived_tables(connection).items()],
+                      ignore_index=True).to_sql(DATASET_DIGEST_TABLE, con=connection, index=False)
+
+        # 與資料變更在同一個交易內寫入 (內容相同時版本與完整重建相同)
+        digests = pd.read_sql(f"SELECT table_name, ref, digest FROM {DATASET_DIGEST_TABLE}", connection)
+        write_dataset_version(connection, dataset_version(df["row_hash"], digests))
+
+    # 舊版資料庫沒有查詢索引時補上
+    connection.executescript(create_lookup_index_sql)
+    connection.close()
+    return len(changed), len(deleted), len(affected)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="建立 Rolex SQLite 資料庫")
+    parser.add_argument("--incremental", action="store_true",
+                        help="只更新有變動的資料與型號 (預設為完整重建)")
+    parser.add_argument("--jobs", type=int, default=1, help="折舊模型平行擬合的程序數")
+    parser.add_argument("--time-budget", type=float, default=DEPRECIATION_TIME_BUDGET,
+                        help="折舊模型擬合的時間預算 (秒), 超過後剩下的型號只擬合 log-linear (預設不限制)")
+    args = parser.parse_args()
+
+    df= load_table(DATA_PATH,index_col=0,schema=SCHEMA)
+
+    if args.incremental:
+        upserted, deleted, refreshed = update_database(df, n_jobs=args.jobs, time_budget=args.time_budget)
+        print(f"新增/更新 {upserted} 筆, 刪除 {deleted} 筆, 重新計算 {refreshed} 個型號")
+    else:
+        build_database(df, n_jobs=args.jobs, time_budget=args.time_budget)
 
-cur.close()
\ No newline at end of file
+    # 型號建議索引 (_05 查無型號時使用)
+    ReferenceIndex.from_database(DB_PATH).save()
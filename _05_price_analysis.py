@@ -1,379 +1,1670 @@
+import argparse
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime
-import matplotlib
-from scipy import stats
 import sqlite3
+from _00_cache import LRUCache, file_signature, read_dataset_version
+from _00_depreciation import predict
+from _00_reference_index import REFERENCE_INDEX_PATH, ReferenceIndex
+from _00_schema import apply_schema
+from _00_stats import linregress, linregress_from_moments, percentile_interval, reference_moments
+from _00_storage import load_table, save_table
+
+DB_PATH = "data/rolex.db"
+
+# 錶齡的計算基準年份
+CURRENT_YEAR = 2022
+
+CONDITION_ORDER = ['New', 'Unworn', 'Very good', 'Good', 'Fair', 'Poor', 'Incomplete']
+AGE_BINS = [0, 2, 5, 10, 20, 100]
+AGE_LABELS = ['<2年', '2-5年', '5-10年', '10-20年', '>20年']
+
+IQR_MULTIPLIER = 1.5
+MIN_REGRESSION_SAMPLES = 10
+SIMILAR_TRADES = 5
+
+# 相似交易的特徵權重: 距離為各特徵標準化後差異平方的加權和
+# (價格、錶齡以同型號的標準差標準化, 狀況依 CONDITION_ORDER 轉為 0~1)
+COMPARABLE_WEIGHTS = {
+    'price': 1.0,
+    'age': 0.5,
+    'condition': 0.5,
+    'has_box': 0.25,
+    'has_papers': 0.25,
+}
+
+# 批次評估的報價檔欄位
+OFFER_COLUMNS = ['reference number', 'seller_price', 'year']
+
+# 型號條件一次查詢的數量 (低於 SQLite 的參數上限)
+QUERY_CHUNK_SIZE = 500
+
+# 保值率預測 bootstrap 區間的信賴水準 (重抽樣結果由 _03 預先計算)
+BOOTSTRAP_CONFIDENCE = 0.95
+
+# PriceAnalyzer 的快取大小: 型號市場摘要 (統計量、條件/錶齡細分、迴歸) 與報價評估結果
+REFERENCE_CACHE_SIZE = 256
+QUOTE_CACHE_SIZE = 10_000
 
-# 設定中文字體
-plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']  # 繁體中文字體
-plt.rcParams['axes.unicode_minus'] = False  # 解決負號顯示問題
 # =====================================
-# Step 1: 載入資料
+# 資料載入
 # =====================================
-print("="*60)
-print("Rolex Reference Number 價格分析系統")
-print("="*60)
 
-print("\nStep 1: 載入資料")
-connection=sqlite3.connect("data/rolex.db")
-df= pd.read_sql("""
-SELECT * FROM price_analysis
-                """,con=connection)
+def load_market_data(db_path=DB_PATH, refs=None):
+    """
+    讀取 price_analysis 市場資料
+
+    參數:
+        db_path: SQLite 檔案路徑
+        refs: 只讀取的型號列表 (預設 None 表示全部)
+
+    回傳:
+        price_analysis 的 DataFrame (套用 _00_schema.SCHEMA 的欄位型別)
+    """
+    connection = sqlite3.connect(db_path)
+    if refs is None:
+        df = pd.read_sql("SELECT * FROM price_analysis", con=connection)
+    else:
+        refs = list(refs)
+        chunks = []
+        for start in range(0, max(len(refs), 1), QUERY_CHUNK_SIZE):
+            chunk = refs[start:start + QUERY_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            # 依型號、錶齡排序 (由 idx_rolex_ref_age 直接取得, 不需另外排序)
+            chunks.append(pd.read_sql(f"""
+            SELECT * FROM price_analysis
+            WHERE [reference number] IN ({placeholders})
+            ORDER BY [reference number], age
+                        """, con=connection, params=chunk))
+        df = pd.concat(chunks, ignore_index=True)
+    connection.close()
+    return apply_schema(df)
+
+
+def _load_reference_table(db_path, table, columns, refs=None):
+    """
+    讀取依型號彙總的資料表 (型號條件分批查詢)
+
+    參數:
+        db_path: SQLite 檔案路徑
+        table: 資料表名稱 (含 ref 欄位)
+        columns: 要讀取的欄位
+        refs: 只讀取的型號列表 (預設 None 表示全部)
+
+    回傳:
+        以型號為 index 的 DataFrame (舊版資料庫沒有這張表時為空的 DataFrame)
+    """
+    connection = sqlite3.connect(db_path)
+    exists = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    if not exists:
+        connection.close()
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='ref'))
+
+    query = f"SELECT ref, {', '.join(columns)} FROM {table}"
+    if refs is None:
+        df = pd.read_sql(query, con=connection)
+    else:
+        refs = list(refs)
+        chunks = []
+        for start in range(0, max(len(refs), 1), QUERY_CHUNK_SIZE):
+            chunk = refs[start:start + QUERY_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            chunks.append(pd.read_sql(f"{query} WHERE ref IN ({placeholders})",
+                                      con=connection, params=chunk))
+        df = pd.concat(chunks, ignore_index=True)
+    connection.close()
+    return df.set_index('ref')[columns]
+
+
+def load_depreciation_models(db_path=DB_PATH, refs=None):
+    """
+    讀取各型號的最佳折舊模型 (depreciation_model 資料表)
+
+    參數:
+        db_path: SQLite 檔案路徑
+        refs: 只讀取的型號列表 (預設 None 表示全部)
+
+    回傳:
+        以型號為 index 的 DataFrame, 欄位為 model、cv_error、params
+        (舊版資料庫沒有這張表時為空的 DataFrame)
+    """
+    return _load_reference_table(db_path, 'depreciation_model', ['model', 'cv_error', 'params'], refs)
+
+
+def load_retention_bootstrap(db_path=DB_PATH, refs=None):
+    """
+    讀取各型號預先計算的 bootstrap 結果 (retention_bootstrap 資料表)
+
+    參數:
+        db_path: SQLite 檔案路徑
+        refs: 只讀取的型號列表 (預設 None 表示全部)
+
+    回傳:
+        dict, 型號 -> (4, B) 陣列 [slope, intercept, log_slope, log_intercept]
+        (舊版資料庫沒有這張表時為空的 dict)
+    """
+    df = _load_reference_table(db_path, 'retention_bootstrap', ['n_boot', 'draws'], refs)
+    return {
+        ref: np.frombuffer(draws, dtype=np.float32).reshape(4, n_boot).astype(float)
+        for ref, n_boot, draws in zip(df.index, df['n_boot'], df['draws'])
+    }
+
+
+def bootstrap_intervals(draws, watch_age, model=None, confidence=BOOTSTRAP_CONFIDENCE):
+    """
+    以預先計算的 bootstrap 結果求出保值率預測的百分位信賴區間 (不重新抽樣)
+
+    - slope: 線性迴歸的每年價格變化
+    - price_5y / retention_5y: 5年後的價格與保值率; model 為 log_linear 時用 log(價格) 迴歸,
+      為 linear 或 None 時用線性迴歸, 其他模型沒有 bootstrap 結果, 區間為 NaN
+
+    參數:
+        draws: load_retention_bootstrap 的 (4, B) 陣列
+        watch_age: 錶齡 (純量或陣列)
+        model: 最佳折舊模型名稱
+        confidence: 信賴水準
+
+    回傳:
+        dict, slope、price_5y、retention_5y 各為 (lower, upper), 形狀同 watch_age
+    """
+    watch_age = np.asarray(watch_age, dtype=float)
+    age = watch_age[..., None]
+    slope, intercept, log_slope, log_intercept = draws
+
+    lower, upper = percentile_interval(slope, confidence)
+    intervals = {'slope': (np.full(watch_age.shape, lower), np.full(watch_age.shape, upper))}
+
+    # 每組重抽樣代入錶齡, 形狀為 (錶齡數, B)
+    if model == 'log_linear':
+        price_5y = np.exp(log_intercept + log_slope * (age + 5))
+        # 5年保值率與錶齡無關
+        retention_5y = np.broadcast_to(np.exp(log_slope * 5) * 100, price_5y.shape)
+    elif model in (None, 'linear'):
+        price_now = intercept + slope * age
+        price_5y = intercept + slope * (age + 5)
+        retention_5y = np.divide(price_5y, price_now, out=np.full(price_5y.shape, np.nan),
+                                 where=price_now > 0) * 100
+    else:
+        nan = np.full(watch_age.shape, np.nan)
+        intervals.update(price_5y=(nan, nan), retention_5y=(nan, nan))
+        return intervals
+
+    intervals['price_5y'] = percentile_interval(price_5y, confidence)
+    intervals['retention_5y'] = percentile_interval(retention_5y, confidence)
+    return intervals
 
-print(f"總資料筆數: {len(df)}")
-print(f"不重複的 Reference Number: {df['reference number'].nunique()}")
 
 # =====================================
-# Step 2: 輸入要查詢的 Reference Number
+# 評估規則
 # =====================================
-print("\nStep 2: 輸入查詢資訊")
-
-# 使用者輸入
-target_ref = input("請輸入 Reference Number (例如: 116610LN): ").upper()
-seller_price = float(input("請輸入賣家報價 (USD): "))
-watch_age= 2022-int(input("請輸入手錶年分: "))
-print(f"\n查詢 Ref: {target_ref}")
-print(f"賣家報價: ${seller_price:,.0f}")
-print(f"手錶年齡:{watch_age}")
+
+# 評級 (低於 Q1 / 低於中位數 / 低於 Q3 / 其他): (評級, 建議, 分數)
+RATINGS = [
+    ("價格較低 (低於市場25%)", "相對市場行情，此價格屬於較低區間", 90),
+    ("價格偏低 (低於中位數)", "價格低於市場中位數，屬於相對合理的範圍", 70),
+    ("市場中上水平", "價格略高於平均，屬於市場常見範圍", 50),
+    ("價格較高 (高於市場75%)", "價格屬於市場較高區間，建議參考更多資料", 30),
+]
+
+
+def rate_price(seller_price, q1, median, q3):
+    """
+    依四分位數評估賣家報價
+
+    參數:
+        seller_price: 賣家報價
+        q1, median, q3: 同款手錶的價格四分位數
+
+    回傳:
+        (rating, advice, score)
+    """
+    if seller_price < q1:
+        return RATINGS[0]
+    elif seller_price < median:
+        return RATINGS[1]
+    elif seller_price < q3:
+        return RATINGS[2]
+    else:
+        return RATINGS[3]
+
+
+def iqr_verdict(seller_price, lower_bound, upper_bound):
+    """依 IQR 正常範圍判定報價: 'low' / 'normal' / 'high'"""
+    if seller_price < lower_bound:
+        return 'low'
+    elif seller_price > upper_bound:
+        return 'high'
+    return 'normal'
+
+
+def model_quality(r_squared):
+    """依 R² 回傳迴歸模型品質 (優秀/良好/一般/較弱)"""
+    if r_squared > 0.60:
+        return "優秀"
+    elif r_squared > 0.40:
+        return "良好"
+    elif r_squared > 0.25:
+        return "一般"
+    return "較弱"
+
+
+class ReferenceStatsIndex:
+    """reference_stats 資料表的記憶體索引 (型號 -> 價格統計量與排序後的價格)"""
+
+    STATS_COLUMNS = ['mean', 'median', 'std', 'min', 'max', 'q1', 'q3']
+    # reference_stats 資料表中 ref 以外的欄位
+    TABLE_COLUMNS = ['count', *STATS_COLUMNS, 'lower_bound', 'upper_bound', 'prices']
+
+    def __init__(self, table):
+        """
+        初始化索引
+
+        參數:
+            table: reference_stats 資料表 (DataFrame)
+        """
+        self._entries = {}
+        for row in table.to_dict('records'):
+            self._entries[row['ref']] = {
+                'count': int(row['count']),
+                'stats': {col: row[col] for col in self.STATS_COLUMNS},
+                'bounds': (row['lower_bound'], row['upper_bound']),
+                'prices': np.frombuffer(row['prices'], dtype=np.float64),
+            }
+
+    @classmethod
+    def from_database(cls, db_path=DB_PATH, refs=None):
+        """
+        從 SQLite 資料庫載入 reference_stats (舊版資料庫沒有這張表時為空的索引)
+
+        參數:
+            db_path: SQLite 檔案路徑
+            refs: 只載入的型號列表 (預設 None 表示全部)
+        """
+        return cls(_load_reference_table(db_path, 'reference_stats', cls.TABLE_COLUMNS, refs).reset_index())
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        由市場資料計算 (與 _03 建立 reference_stats 的計算相同)
+
+        參數:
+            data: 含 reference number、price 的資料
+        """
+        from _03_create_database import compute_reference_stats
+
+        return cls(compute_reference_stats(data))
+
+    def __contains__(self, ref):
+        return ref in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, ref):
+        """
+        取得型號的統計資料
+
+        回傳:
+            dict, 含 count、stats、bounds、prices (由小到大)
+        """
+        try:
+            return self._entries[ref]
+        except KeyError:
+            raise KeyError(f"找不到 Reference Number: {ref}") from None
+
+    def frame(self, refs):
+        """
+        多個型號的統計量
+
+        參數:
+            refs: 型號列表
+
+        回傳:
+            以型號為 index 的 DataFrame, 欄位為 count、STATS_COLUMNS、lower_bound、upper_bound
+        """
+        entries = [self.lookup(ref) for ref in refs]
+        lower_bound, upper_bound = zip(*(entry['bounds'] for entry in entries)) if entries else ((), ())
+        return pd.DataFrame({
+            'count': [entry['count'] for entry in entries],
+            **{col: [entry['stats'][col] for entry in entries] for col in self.STATS_COLUMNS},
+            'lower_bound': lower_bound,
+            'upper_bound': upper_bound,
+        }, index=pd.Index(refs, name='reference number'))
+
+    def percentile(self, ref, seller_price):
+        """市場百分位: 比賣家報價便宜的比例 (%)"""
+        prices = self.lookup(ref)['prices']
+        return np.searchsorted(prices, seller_price, side='left') / len(prices) * 100
+
+    def evaluate(self, ref, seller_price):
+        """
+        只以統計資料評估報價 (Step 4、5、8, 不需載入原始資料)
+
+        參數:
+            ref: Reference Number
+            seller_price: 賣家報價 (USD)
+
+        回傳:
+            dict, 含 count、stats、percentile、rating、advice、score、outlier
+        """
+        entry = self.lookup(ref)
+        seller_price = float(seller_price)
+        price_stats = entry['stats']
+        prices = entry['prices']
+        lower_bound, upper_bound = entry['bounds']
+        rating, advice, score = rate_price(
+            seller_price, price_stats['q1'], price_stats['median'], price_stats['q3']
+        )
+        # 超出正常範圍的筆數也以二分搜尋計算
+        outlier_count = (np.searchsorted(prices, lower_bound, side='left')
+                         + len(prices) - np.searchsorted(prices, upper_bound, side='right'))
+        return {
+            'ref': ref,
+            'seller_price': seller_price,
+            'count': entry['count'],
+            'stats': price_stats,
+            'percentile': np.searchsorted(prices, seller_price, side='left') / len(prices) * 100,
+            'rating': rating,
+            'advice': advice,
+            'score': score,
+            'outlier': {
+                'lower_bound': lower_bound,
+                'upper_bound': upper_bound,
+                'outlier_count': int(outlier_count),
+                'verdict': iqr_verdict(seller_price, lower_bound, upper_bound),
+            },
+        }
+
+
+# 狀況的順序值 (New = 0 ~ Incomplete = 1, 未知的狀況視為中間值 0.5)
+CONDITION_RANK = {condition: i / (len(CONDITION_ORDER) - 1) for i, condition in enumerate(CONDITION_ORDER)}
+
+
+def encode_condition(values):
+    """狀況陣列轉為 CONDITION_RANK 的順序值"""
+    return pd.Series(values, dtype=object).map(CONDITION_RANK).fillna(0.5).to_numpy(dtype=float)
+
+
+class ComparableIndex:
+    """同一型號的相似交易搜尋 (依使用的特徵組合建立 KD-tree)"""
+
+    def __init__(self, data, weights=None):
+        """
+        初始化搜尋索引
+
+        參數:
+            data: 同一型號的市場資料
+            weights: 特徵權重 (未指定的特徵使用 COMPARABLE_WEIGHTS)
+        """
+        self.weights = {**COMPARABLE_WEIGHTS, **(weights or {})}
+        self.size = len(data)
+
+        features = {
+            'price': data['price'].to_numpy(dtype=float),
+            'age': data['age'].to_numpy(dtype=float),
+            'condition': encode_condition(data['condition']),
+            'has_box': data['has_box'].to_numpy(dtype=float),
+            'has_papers': data['has_papers'].to_numpy(dtype=float),
+        }
+        self._features = {}
+        self._scales = {}
+        for name, values in features.items():
+            # 缺失值以平均數代替
+            values = np.where(np.isnan(values), np.nanmean(values), values)
+            scale = 1.0
+            if name in ('price', 'age'):
+                scale = np.std(values) if len(values) > 1 and np.std(values) > 0 else 1.0
+            self._features[name] = values
+            self._scales[name] = scale
+        self._trees = {}
+
+    def active(self, listing):
+        """查詢使用的特徵: 有提供值且權重大於 0"""
+        return tuple(
+            name for name in self._features
+            if listing.get(name) is not None and self.weights.get(name, 0) > 0
+        )
+
+    def _tree(self, names):
+        """取得特徵組合的 KD-tree (第一次使用時建立並快取)"""
+        tree = self._trees.get(names)
+        if tree is None:
+            points = np.column_stack([self._features[name] * self.factor(name) for name in names])
+            from scipy.spatial import cKDTree
+
+            tree = self._trees[names] = cKDTree(points)
+        return tree
+
+    def factor(self, name):
+        """特徵的座標縮放: sqrt(權重) / 標準化尺度"""
+        return np.sqrt(self.weights[name]) / self._scales[name]
+
+    def query(self, listing, k=SIMILAR_TRADES):
+        """
+        找出最相似的 k 筆交易
+
+        參數:
+            listing: 特徵 dict (price、age、condition、has_box、has_papers;
+                值為 None 的特徵不列入距離計算)
+            k: 回傳筆數
+
+        回傳:
+            (rows, distances): 資料中的列位置與距離 (由近到遠)
+        """
+        names = self.active(listing)
+        k = min(k, self.size)
+        if not names or k == 0:
+            return np.arange(k), np.zeros(k)
+
+        values = {name: listing[name] for name in names}
+        if 'condition' in values:
+            values['condition'] = CONDITION_RANK.get(values['condition'], 0.5)
+        point = [float(values[name]) * self.factor(name) for name in names]
+
+        distances, rows = self._tree(names).query(point, k=k)
+        return np.atleast_1d(rows), np.atleast_1d(distances)
+
+
+class PriceAnalyzer:
+    """
+    載入一次市場資料後, 重複評估賣家報價的價格分析引擎
+
+    兩層 LRU 快取, 鍵都包含資料集版本雜湊:
+    - reference_cache: 型號的市場摘要 (統計量、條件/錶齡細分、迴歸、相似交易索引)
+    - quote_cache: (型號, 報價, 年份) 的評估結果
+    從資料庫建立時, 每次評估前檢查資料庫是否重建 (版本改變時重新載入並清除快取)。
+    """
+
+    def __init__(self, data, comparable_weights=None, depreciation=None, bootstrap=None,
+                 reference_stats=None, version=None, reference_cache_size=REFERENCE_CACHE_SIZE,
+                 quote_cache_size=QUOTE_CACHE_SIZE):
+        """
+        初始化分析引擎
+
+        參數:
+            data: price_analysis 市場資料 (DataFrame)
+            comparable_weights: 相似交易的特徵權重 (預設 COMPARABLE_WEIGHTS)
+            depreciation: load_depreciation_models 的結果 (預設 None 表示只用線性迴歸預測)
+            bootstrap: load_retention_bootstrap 的結果 (預設 None 表示不計算信賴區間)
+            reference_stats: 價格統計量的 ReferenceStatsIndex (預設 None, 或缺少 data 中的型號時,
+                第一次使用時由 data 計算)
+            version: 資料集版本雜湊 (快取鍵的一部分)
+            reference_cache_size: 最多快取的型號市場摘要數
+            quote_cache_size: 最多快取的報價評估結果數 (0 表示不快取)
+        """
+        self.comparable_weights = comparable_weights
+        self.version = version
+        self.reference_cache = LRUCache(reference_cache_size)
+        self.quote_cache = LRUCache(quote_cache_size)
+        # 從資料庫建立時才會設定 (refresh 使用)
+        self.db_path = None
+        self._refs = None
+        self._db_signature = None
+        self._load(data, depreciation, bootstrap, reference_stats)
+
+    def _load(self, data, depreciation, bootstrap, reference_stats=None):
+        """載入市場資料 (依型號排序), 並重設所有型號一起計算的快取"""
+        data = data.reset_index(drop=True)
+        codes, refs = pd.factorize(data['reference number'])
+
+        # 依型號排序 (同型號維持原順序), 每個型號的資料為連續區段
+        order = np.argsort(codes, kind='stable')
+        self.data = data.take(order).reset_index(drop=True)
+        counts = np.bincount(codes, minlength=len(refs))
+        ends = np.cumsum(counts)
+        self._slices = {
+            ref: (end - count, end) for ref, count, end in zip(refs, counts, ends)
+        }
+        self.counts = pd.Series(counts, index=refs).sort_values(ascending=False, kind='stable')
+        if depreciation is None:
+            depreciation = pd.DataFrame(columns=['model', 'cv_error', 'params'])
+        self.depreciation = depreciation
+        self.bootstrap = {} if bootstrap is None else bootstrap
+        if reference_stats is not None and not all(ref in reference_stats for ref in refs):
+            reference_stats = None
+        self._reference_stats = reference_stats
+        self._summary = None
+
+    @classmethod
+    def from_database(cls, db_path=DB_PATH, refs=None, comparable_weights=None,
+                      reference_cache_size=REFERENCE_CACHE_SIZE, quote_cache_size=QUOTE_CACHE_SIZE):
+        """
+        從 SQLite 資料庫建立分析引擎
+
+        參數:
+            db_path: SQLite 檔案路徑
+            refs: 只載入的型號列表 (預設 None 表示全部)
+            comparable_weights: 相似交易的特徵權重
+            reference_cache_size, quote_cache_size: 兩層快取的大小
+        """
+        # 先記錄檔案狀態再讀取, 讀取期間資料庫被重建時下次評估會重新檢查
+        signature = file_signature(db_path)
+        analyzer = cls(load_market_data(db_path, refs), comparable_weights,
+                       load_depreciation_models(db_path, refs), load_retention_bootstrap(db_path, refs),
+                       ReferenceStatsIndex.from_database(db_path, refs),
+                       version=read_dataset_version(db_path), reference_cache_size=reference_cache_size,
+                       quote_cache_size=quote_cache_size)
+        analyzer.db_path = db_path
+        analyzer._refs = None if refs is None else list(refs)
+        analyzer._db_signature = signature
+        return analyzer
+
+    def refresh(self):
+        """
+        資料庫重建或更新後 (資料集版本改變) 重新載入市場資料並清除快取
+
+        評估前會自動呼叫; 資料庫檔案沒有變動時只比較檔案大小與修改時間。
+        (不是從資料庫建立的分析引擎不會重新載入)
+
+        回傳:
+            是否重新載入
+        """
+        if self.db_path is None:
+            return False
+        signature = file_signature(self.db_path)
+        if signature == self._db_signature:
+            return False
+        self._db_signature = signature
+        version = read_dataset_version(self.db_path)
+        if version == self.version:
+            return False
+
+        self._load(load_market_data(self.db_path, self._refs),
+                   load_depreciation_models(self.db_path, self._refs),
+                   load_retention_bootstrap(self.db_path, self._refs),
+                   ReferenceStatsIndex.from_database(self.db_path, self._refs))
+        self.version = version
+        self.reference_cache.clear()
+        self.quote_cache.clear()
+        return True
+
+    def cache_info(self):
+        """
+        兩層快取的命中統計
+
+        回傳:
+            dict, reference (型號市場摘要) 與 quote (報價評估結果) 的 CacheInfo
+            (hits、misses、evictions、maxsize、currsize)
+        """
+        return {'reference': self.reference_cache.info(), 'quote': self.quote_cache.info()}
+
+    def __contains__(self, ref):
+        return ref in self._slices
+
+    @property
+    def references(self):
+        """所有型號"""
+        return list(self._slices)
+
+    def popular_references(self, n=10):
+        """資料筆數最多的 n 個型號 (型號 -> 筆數)"""
+        return self.counts.head(n)
+
+    def market(self, ref):
+        """
+        取得型號的市場摘要 (與賣家報價無關的部分, 第一次使用時計算並存入 reference_cache)
+
+        參數:
+            ref: Reference Number
+
+        回傳:
+            dict, 含 data (同款資料)、columns (各欄位陣列)、prices (排序後價格)、stats、
+            condition_analysis、full_set、age_analysis、regression
+            (之後另含 comparable_index 相似交易索引、retention_by_age 各錶齡的保值率預測)
+        """
+        self.refresh()
+        if ref not in self._slices:
+            raise KeyError(f"找不到 Reference Number: {ref}")
+        return self.reference_cache.get_or_compute((self.version, ref), lambda: self._build_market(ref))
+
+    def _build_market(self, ref):
+        """
+        計算型號的市場摘要
+
+        價格統計量與排序後的價格直接取自 reference_stats;
+        同款資料只用於條件/配件/錶齡細分、相似交易與迴歸。
+        """
+        start, end = self._slices[ref]
+        same_ref = self.data.iloc[start:end].reset_index(drop=True)
+        price = same_ref['price']
+        entry = self.reference_stats.lookup(ref)
+
+        # 資料依價格排序的列位置 (同價格維持原順序), 與 reference_stats 的排序後價格一一對應, 供相似交易查詢
+        order = np.argsort(price.to_numpy(), kind='stable')
+
+        # 條件、配件、年份細分
+        condition_analysis = None
+        if 'condition' in same_ref.columns:
+            condition_analysis = same_ref.groupby('condition', observed=True)['price'].agg([
+                'count', 'mean', 'median', 'min', 'max'
+            ]).round(0).reindex(CONDITION_ORDER)
+
+        full_set = None
+        if 'full_set' in same_ref.columns:
+            full_set = {
+                'yes': price[same_ref['full_set'] == 1].mean(),
+                'no': price[same_ref['full_set'] == 0].mean(),
+            }
+
+        age_analysis = None
+        if 'age' in same_ref.columns:
+            age_groups = pd.cut(same_ref['age'], bins=AGE_BINS, labels=AGE_LABELS)
+            age_analysis = same_ref.groupby(age_groups, observed=False)['price'].agg(['mean', 'count'])
+
+        # 錶齡 vs 價格線性迴歸 (錶齡全部相同時無法迴歸, 同 _03 的 compute_retention_rates)
+        regression = None
+        if len(same_ref) >= MIN_REGRESSION_SAMPLES and same_ref['age'].nunique() > 1:
+            slope, intercept, r_value, p_value, std_err = linregress(
+                same_ref['age'],
+                price
+            )
+            regression = {
+                'n': len(same_ref),
+                'slope': slope,
+                'intercept': intercept,
+                'r_squared': r_value ** 2,
+                'p_value': p_value,
+                'significant': p_value < 0.05,
+                'quality': model_quality(r_value ** 2),
+                'annual_rate': (slope / intercept) * 100,
+                'min_age': same_ref['age'].min(),
+                'max_age': same_ref['age'].max(),
+            }
+
+        return {
+            'ref': ref,
+            'data': same_ref,
+            'columns': {col: same_ref[col].to_numpy() for col in same_ref.columns},
+            'prices': entry['prices'],
+            'order': order,
+            'stats': entry['stats'],
+            'condition_analysis': condition_analysis,
+            'full_set': full_set,
+            'age_analysis': age_analysis,
+            'regression': regression,
+        }
+
+    @property
+    def reference_stats(self):
+        """價格統計量的 ReferenceStatsIndex (沒有從資料庫載入時, 第一次使用時由市場資料計算)"""
+        if self._reference_stats is None:
+            self._reference_stats = ReferenceStatsIndex.from_data(self.data)
+        return self._reference_stats
+
+    def reference_summary(self):
+        """
+        一次計算所有型號的價格統計與迴歸 (批次評估用, 第一次使用時計算並快取)
+
+        回傳:
+            以型號為 index 的 DataFrame, 欄位為 count、mean、median、q1、q3、
+            lower_bound、upper_bound、slope、intercept、r_squared、p_value、max_age
+            (資料少於 MIN_REGRESSION_SAMPLES 筆或錶齡全部相同的型號迴歸欄位為 NaN)
+        """
+        if self._summary is None:
+            key = self.data['reference number']
+            # 價格統計量取自 reference_stats
+            summary = self.reference_stats.frame(self.references)[
+                ['count', 'mean', 'median', 'q1', 'q3', 'lower_bound', 'upper_bound']
+            ]
+
+            # 所有型號的錶齡 vs 價格迴歸一次批次計算
+            moments = reference_moments(self.data).reindex(summary.index)
+            fit = linregress_from_moments(moments)
+            fit['r_squared'] = fit['r_value'] ** 2
+            fit = fit[['slope', 'intercept', 'r_squared', 'p_value']]
+            fitted = (summary['count'] >= MIN_REGRESSION_SAMPLES) & (moments['n_x'] > 1)
+            summary = summary.join(fit.where(fitted))
+            summary['max_age'] = self.data['age'].groupby(key, sort=False, observed=True).max()
+            self._summary = summary
+        return self._summary
+
+    def sorted_prices(self, ref):
+        """
+        型號排序後的價格陣列 (取自 reference_stats)
+
+        參數:
+            ref: Reference Number
+        """
+        return self.reference_stats.lookup(ref)['prices']
+
+    def analyze_batch(self, offers):
+        """
+        批次評估多筆賣家報價 (依型號分組, 每個型號只做一次向量化查詢)
+
+        參數:
+            offers: 含 OFFER_COLUMNS (reference number、seller_price、year) 的 DataFrame
+
+        回傳:
+            每筆報價一列的 DataFrame (原欄位加上評估結果; 找不到型號的報價 found 為 False)
+        """
+        self.refresh()
+        offers = offers.reset_index(drop=True)
+        refs = offers['reference number']
+        seller_price = offers['seller_price'].to_numpy(dtype=float)
+        watch_age = CURRENT_YEAR - offers['year'].to_numpy(dtype=float)
+
+        summary = self.reference_summary().reindex(refs)
+        found = summary['count'].notna().to_numpy()
+        # 報價缺失的列不評估 (searchsorted 會把 NaN 排在最後, np.select 會落到 default)
+        evaluated = found & np.isfinite(seller_price)
+
+        # 市場百分位: 每個型號一次 searchsorted
+        percentile = np.full(len(offers), np.nan)
+        codes, uniques = pd.factorize(refs)
+        order = np.argsort(codes, kind='stable')
+        order = order[codes[order] >= 0]
+        ends = np.cumsum(np.bincount(codes[order], minlength=len(uniques)))
+        groups = np.split(order, ends[:-1])
+        for ref, rows in zip(uniques, groups):
+            if ref not in self._slices:
+                continue
+            prices = self.sorted_prices(ref)
+            percentile[rows] = np.searchsorted(prices, seller_price[rows], side='left') / len(prices) * 100
+        percentile[~evaluated] = np.nan
+
+        # 評級 (Q1 / 中位數 / Q3)
+        q1 = summary['q1'].to_numpy()
+        median = summary['median'].to_numpy()
+        q3 = summary['q3'].to_numpy()
+        bucket = np.select([seller_price < q1, seller_price < median, seller_price < q3], [0, 1, 2], default=3)
+        rating = np.array([r[0] for r in RATINGS], dtype=object)[bucket]
+        score = np.array([r[2] for r in RATINGS], dtype=float)[bucket]
+        score[~evaluated] = np.nan
+        rating[~evaluated] = None
+
+        # IQR 異常值判定
+        verdict = np.select(
+            [seller_price < summary['lower_bound'].to_numpy(), seller_price > summary['upper_bound'].to_numpy()],
+            ['low', 'high'],
+            default='normal',
+        ).astype(object)
+        verdict[~evaluated] = None
+
+        # 保值率預測 (同 analyze: 截距為正才預測)
+        slope = summary['slope'].to_numpy()
+        intercept = summary['intercept'].to_numpy()
+        forecast = (intercept > 0) & np.isfinite(watch_age)
+        price_now = np.where(forecast, slope * watch_age + intercept, np.nan)
+        price_5y = np.where(forecast, slope * (watch_age + 5) + intercept, np.nan)
+
+        # 有最佳折舊模型 (非線性迴歸) 的型號改用該模型預測
+        model = np.full(len(offers), None, dtype=object)
+        for ref, rows in zip(uniques, groups):
+            if ref not in self.depreciation.index:
+                continue
+            best = self.depreciation.loc[ref]
+            model[rows] = best['model']
+            if best['model'] == 'linear':
+                continue
+            rows = rows[np.isfinite(watch_age[rows])]
+            forecast[rows] = True
+            price_now[rows] = predict(best['model'], best['params'], watch_age[rows])
+            price_5y[rows] = predict(best['model'], best['params'], watch_age[rows] + 5)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 目前與 5 年後的預測價格皆為正時才計算 (同 analyze)
+            retention_5y = np.where((price_now > 0) & (price_5y > 0), price_5y / price_now * 100, np.nan)
+        extrapolated = pd.array(summary['max_age'].to_numpy() < watch_age + 5, dtype='boolean')
+        extrapolated[~forecast] = pd.NA
+
+        # bootstrap 信賴區間: 每個型號只代入不重複的錶齡
+        bounds = {name: np.full((2, len(offers)), np.nan) for name in ['slope', 'price_5y', 'retention_5y']}
+        for ref, rows in zip(uniques, groups):
+            if ref not in self.bootstrap:
+                continue
+            ages, inverse = np.unique(watch_age[rows], return_inverse=True)
+            intervals = bootstrap_intervals(self.bootstrap[ref], ages, model[rows[0]])
+            for name, (lower, upper) in intervals.items():
+                bounds[name][:, rows] = lower[inverse], upper[inverse]
+        # 沒有預測值的報價不顯示預測區間
+        bounds['price_5y'][:, np.isnan(price_5y)] = np.nan
+        bounds['retention_5y'][:, np.isnan(retention_5y)] = np.nan
+
+        result = pd.DataFrame({
+            'found': found,
+            'count': summary['count'].fillna(0).astype(int).to_numpy(),
+            'mean': summary['mean'].to_numpy(),
+            'median': median,
+            'q1': q1,
+            'q3': q3,
+            'percentile': percentile,
+            'diff_pct_median': (seller_price - median) / median * 100,
+            'rating': rating,
+            'score': score,
+            'lower_bound': summary['lower_bound'].to_numpy(),
+            'upper_bound': summary['upper_bound'].to_numpy(),
+            'verdict': verdict,
+            'slope': slope,
+            'slope_lower': bounds['slope'][0],
+            'slope_upper': bounds['slope'][1],
+            'model': model,
+            'r_squared': summary['r_squared'].to_numpy(),
+            'p_value': summary['p_value'].to_numpy(),
+            'price_now': price_now,
+            'price_5y': price_5y,
+            'retention_5y': retention_5y,
+            'price_5y_lower': bounds['price_5y'][0],
+            'price_5y_upper': bounds['price_5y'][1],
+            'retention_5y_lower': bounds['retention_5y'][0],
+            'retention_5y_upper': bounds['retention_5y'][1],
+            'extrapolated': extrapolated,
+        })
+        return pd.concat([offers, result], axis=1)
+
+    def comparables(self, ref, seller_price, year, condition=None, has_box=None,
+                    has_papers=None, k=SIMILAR_TRADES):
+        """
+        依價格、錶齡、狀況與配件找出最相似的 k 筆交易
+
+        參數:
+            ref: Reference Number
+            seller_price: 賣家報價 (USD)
+            year: 手錶年份 (None 表示不比較錶齡)
+            condition: 狀況 (None 表示不比較)
+            has_box, has_papers: 是否有錶盒 / 保證書 (1/0, None 表示不比較)
+            k: 回傳筆數
+
+        回傳:
+            欄位 dict 的列表 (由近到遠), 另含 price_diff 與 distance
+            (錶齡、狀況與配件都不比較時只依價格差排序, 同 _similar_trades)
+        """
+        return self._comparables(self.market(ref), seller_price, year, condition, has_box, has_papers, k)
+
+    def _comparables(self, market, seller_price, year, condition=None, has_box=None,
+                     has_papers=None, k=SIMILAR_TRADES):
+        """comparables 的實作 (傳入已取得的市場摘要)"""
+        # 相似交易索引與市場摘要一起快取 (一起被移出 reference_cache)
+        index = market.get('comparable_index')
+        if index is None:
+            index = market['comparable_index'] = ComparableIndex(market['data'], self.comparable_weights)
+
+        seller_price = float(seller_price)
+        listing = {
+            'price': seller_price,
+            'age': None if year is None else CURRENT_YEAR - int(year),
+            'condition': condition,
+            'has_box': has_box,
+            'has_papers': has_papers,
+        }
+        if set(index.active(listing)) <= {'price'}:
+            # 沒有其他特徵時不需要 KD-tree, 在排序後的價格上二分搜尋
+            rows = self._similar_trades(market, seller_price, k)
+            distances = np.abs(market['columns']['price'][rows] - seller_price) * index.factor('price')
+        else:
+            rows, distances = index.query(listing, k=k)
+
+        trades = self._records(market, rows)
+        for trade, distance in zip(trades, distances):
+            trade['price_diff'] = abs(trade['price'] - seller_price)
+            trade['distance'] = float(distance)
+        return trades
+
+    def _records(self, market, rows):
+        """同款資料中指定列位置的欄位 dict 列表"""
+        columns = market['columns']
+        return [
+            dict(zip(columns, values))
+            for values in zip(*(values[rows].tolist() for values in columns.values()))
+        ]
+
+    def _similar_trades(self, market, seller_price, k=SIMILAR_TRADES):
+        """
+        找出價格最接近賣家報價的 k 筆交易 (同 nsmallest, 差異相同時依原順序)
+
+        回傳:
+            同款資料中的列位置
+        """
+        prices = market['prices']
+        k = min(k, len(prices))
+        pos = np.searchsorted(prices, seller_price)
+
+        # 最接近的 k 筆一定落在插入位置前後 k 筆內, 先求第 k 小的差異
+        window = np.abs(prices[max(pos - k, 0):pos + k] - seller_price)
+        kth_diff = np.partition(window, k - 1)[k - 1]
+
+        # 差異不超過第 k 小差異的所有資料 (處理同價格的情況)
+        margin = kth_diff * (1 + 1e-9) + 1e-9
+        lo = np.searchsorted(prices, seller_price - margin, side='left')
+        hi = np.searchsorted(prices, seller_price + margin, side='right')
+        diffs = np.abs(prices[lo:hi] - seller_price)
+        rows = market['order'][lo:hi]
+        keep = diffs <= kth_diff
+        rows, diffs = rows[keep], diffs[keep]
+        return rows[np.lexsort((rows, diffs))[:k]]
+
+    def analyze(self, ref, seller_price, year, condition=None, has_box=None, has_papers=None):
+        """
+        評估一筆賣家報價 (相同條件的結果存入 quote_cache, 回傳同一個 dict, 請勿修改)
+
+        參數:
+            ref: Reference Number
+            seller_price: 賣家報價 (USD)
+            year: 手錶年份
+            condition: 手錶狀況 (None 表示不比較)
+            has_box: 是否附錶盒 (None 表示不比較)
+            has_papers: 是否附保證書 (None 表示不比較)
+
+        回傳:
+            dict, 含 stats、percentile、rating、score、similar_trades (同 comparables 的結果)、
+            outlier (價格範圍與判定)、retention (保值率預測, 資料不足時為 None;
+            有最佳折舊模型時 model 為模型名稱, price_now / price_5y 為該模型的預測;
+            intervals 為 slope、price_5y、retention_5y 的 bootstrap 信賴區間, 沒有重抽樣結果時為 None)
+        """
+        self.refresh()
+        key = (self.version, ref, float(seller_price), int(year), condition, has_box, has_papers)
+        result = self.quote_cache.get(key)
+        if result is None:
+            result = self.quote_cache.put(
+                key, self._analyze(ref, seller_price, year, condition, has_box, has_papers))
+        return result
+
+    def _analyze(self, ref, seller_price, year, condition=None, has_box=None, has_papers=None):
+        """評估一筆賣家報價 (不使用 quote_cache)"""
+        market = self.market(ref)
+        watch_age = CURRENT_YEAR - int(year)
+
+        # 統計量、市場百分位、評級與 IQR 判定 (Step 4、5、8) 只查詢 reference_stats
+        evaluation = self.reference_stats.evaluate(ref, seller_price)
+        seller_price = evaluation['seller_price']
+        price_stats = evaluation['stats']
+        diff_from_mean = seller_price - price_stats['mean']
+        diff_from_median = seller_price - price_stats['median']
+
+        # 相似交易 (每筆為欄位 dict, 另含 price_diff 與 distance)
+        similar_trades = self._comparables(market, seller_price, year, condition, has_box, has_papers)
+
+        # 保值率預測只與錶齡有關, 依錶齡快取在市場摘要中
+        retentions = market.setdefault('retention_by_age', {})
+        if watch_age not in retentions:
+            retentions[watch_age] = self._retention(ref, market, watch_age)
+        retention = retentions[watch_age]
+
+        return {
+            'ref': ref,
+            'seller_price': seller_price,
+            'watch_age': watch_age,
+            'count': evaluation['count'],
+            'stats': price_stats,
+            'percentile': evaluation['percentile'],
+            'diff_from_mean': diff_from_mean,
+            'diff_from_median': diff_from_median,
+            'diff_pct_mean': (diff_from_mean / price_stats['mean']) * 100,
+            'diff_pct_median': (diff_from_median / price_stats['median']) * 100,
+            'rating': evaluation['rating'],
+            'advice': evaluation['advice'],
+            'score': evaluation['score'],
+            'similar_trades': similar_trades,
+            'outlier': evaluation['outlier'],
+            'retention': retention,
+        }
+
+    def _retention(self, ref, market, watch_age):
+        """型號在指定錶齡的保值率預測 (analyze 的 retention, 資料不足時為 None)"""
+        retention = None
+        if market['regression'] is not None:
+            retention = dict(market['regression'])
+            retention.update(price_now=None, price_5y=None, retention_5y=None, extrapolated=None)
+            slope, intercept = retention['slope'], retention['intercept']
+            if intercept > 0:
+                price_now = slope * watch_age + intercept
+                price_5y = slope * (watch_age + 5) + intercept
+                retention['price_now'] = price_now
+                retention['price_5y'] = price_5y
+                retention['retention_5y'] = self._retention_rate(price_now, price_5y)
+                retention['extrapolated'] = retention['max_age'] < watch_age + 5
+
+            # 有最佳折舊模型 (非線性迴歸) 時改用該模型預測
+            retention.update(model=None, model_cv_error=None)
+            if ref in self.depreciation.index:
+                best = self.depreciation.loc[ref]
+                retention['model'] = best['model']
+                retention['model_cv_error'] = best['cv_error']
+                if best['model'] != 'linear':
+                    price_now, price_5y = predict(best['model'], best['params'], [watch_age, watch_age + 5])
+                    retention['price_now'] = price_now
+                    retention['price_5y'] = price_5y
+                    retention['retention_5y'] = self._retention_rate(price_now, price_5y)
+                    retention['extrapolated'] = retention['max_age'] < watch_age + 5
+
+            # bootstrap 信賴區間 (有預先計算的重抽樣結果時; 沒有預測值的項目為 None)
+            retention['intervals'] = None
+            if ref in self.bootstrap:
+                intervals = bootstrap_intervals(self.bootstrap[ref], watch_age, retention['model'])
+                retention['intervals'] = {
+                    name: (float(lower), float(upper)) if np.isfinite(lower) else None
+                    for name, (lower, upper) in intervals.items()
+                }
+                if retention['price_5y'] is None:
+                    retention['intervals'].update(price_5y=None)
+                if retention['retention_5y'] is None:
+                    retention['intervals'].update(retention_5y=None)
+
+        return retention
+
+    @staticmethod
+    def _retention_rate(price_now, price_5y):
+        """5年保值率 (%): 目前與 5 年後的預測價格皆為正時才計算, 否則為 None (同 analyze_batch)"""
+        if price_now > 0 and price_5y > 0:
+            return (price_5y / price_now) * 100
+        return None
+
+
 # =====================================
-# Step 3: 篩選相同 Reference Number 的資料
+# 互動式報告
 # =====================================
-print("\nStep 3: 分析同款手錶市場資料")
-
-# 篩選相同 ref 的資料
-same_ref = df[df['reference number'] == target_ref].copy()
-
-if len(same_ref) == 0:
-    print(f"❌ 找不到 Reference Number: {target_ref} 的資料")
-    print("建議檢查輸入是否正確，或使用相近的型號")
-    
-    # 顯示可能的相似 ref
-    possible_refs = df['reference number'].value_counts().head(10)
-    print("\n最常見的 Reference Numbers:")
-    for ref, count in possible_refs.items():
-        print(f"  {ref}: {count} 筆資料")
-else:
-    print(f"✅ 找到 {len(same_ref)} 筆相同 Reference Number 的資料")
-    
+
+def print_report(result, market):
+    """
+    印出 Step 4 ~ Step 10 的分析報告
+
+    參數:
+        result: PriceAnalyzer.analyze 的結果
+        market: PriceAnalyzer.market 的結果
+    """
+    seller_price = result['seller_price']
+    price_stats = result['stats']
+
     # =====================================
     # Step 4: 基礎統計分析
     # =====================================
     print("\n"+"-"*40)
     print("Step 4: 價格統計分析")
     print("-"*40)
-    
-    # 價格統計
-    price_mean = same_ref['price'].mean()
-    price_median = same_ref['price'].median()
-    price_std = same_ref['price'].std()
-    price_min = same_ref['price'].min()
-    price_max = same_ref['price'].max()
-    price_q1 = same_ref['price'].quantile(0.25)
-    price_q3 = same_ref['price'].quantile(0.75)
-    
-    print(f"平均價格: ${price_mean:,.0f}")
-    print(f"中位數價格: ${price_median:,.0f}")
-    print(f"標準差: ${price_std:,.0f}")
-    print(f"最低價: ${price_min:,.0f}")
-    print(f"最高價: ${price_max:,.0f}")
-    print(f"第一四分位數 (25%): ${price_q1:,.0f}")
-    print(f"第三四分位數 (75%): ${price_q3:,.0f}")
-    
+
+    print(f"平均價格: ${price_stats['mean']:,.0f}")
+    print(f"中位數價格: ${price_stats['median']:,.0f}")
+    print(f"標準差: ${price_stats['std']:,.0f}")
+    print(f"最低價: ${price_stats['min']:,.0f}")
+    print(f"最高價: ${price_stats['max']:,.0f}")
+    print(f"第一四分位數 (25%): ${price_stats['q1']:,.0f}")
+    print(f"第三四分位數 (75%): ${price_stats['q3']:,.0f}")
+
     # =====================================
     # Step 5: 賣家價格評估
     # =====================================
     print("\n"+"-"*40)
     print("Step 5: 賣家價格評估")
     print("-"*40)
-    
-    # 計算賣家價格的位置
-    percentile = (same_ref['price'] < seller_price).mean() * 100
-    diff_from_mean = seller_price - price_mean
-    diff_from_median = seller_price - price_median
-    diff_pct_mean = (diff_from_mean / price_mean) * 100
-    diff_pct_median = (diff_from_median / price_median) * 100
-    
+
+    percentile = result['percentile']
     print(f"賣家報價: ${seller_price:,.0f}")
     print(f"市場百分位: {percentile:.1f}% (有 {percentile:.1f}% 的同款錶比這便宜)")
-    print(f"vs 平均價: {diff_from_mean:+,.0f} ({diff_pct_mean:+.1f}%)")
-    print(f"vs 中位數: {diff_from_median:+,.0f} ({diff_pct_median:+.1f}%)")
-    
-    # 評級系統
-    if seller_price < price_q1:
-        rating = "價格較低 (低於市場25%)"
-        advice = "相對市場行情，此價格屬於較低區間"
-        score = 90
-    elif seller_price < price_median:
-        rating = "價格偏低 (低於中位數)"
-        advice = "價格低於市場中位數，屬於相對合理的範圍"
-        score = 70
-    elif seller_price < price_q3:
-        rating = "市場中上水平"
-        advice = "價格略高於平均，屬於市場常見範圍"
-        score = 50
-    else:
-        rating = "價格較高 (高於市場75%)"
-        advice = "價格屬於市場較高區間，建議參考更多資料"
-        score = 30
-    
+    print(f"vs 平均價: {result['diff_from_mean']:+,.0f} ({result['diff_pct_mean']:+.1f}%)")
+    print(f"vs 中位數: {result['diff_from_median']:+,.0f} ({result['diff_pct_median']:+.1f}%)")
+
     print(f"\n📊 評估結果:")
-    print(f"評級: {rating}")
-    print(f"評分: {score}/100")
-    print(f"建議: {advice}")
-    
+    print(f"評級: {result['rating']}")
+    print(f"評分: {result['score']}/100")
+    print(f"建議: {result['advice']}")
+
     # =====================================
     # Step 6: 根據條件細分分析
     # =====================================
     print("\n"+"-"*40)
     print("Step 6: 條件細分分析")
     print("-"*40)
-    
+
     # 按條件分組
-    if 'condition' in same_ref.columns:
-        condition_analysis = same_ref.groupby('condition', observed=False)['price'].agg([
-            'count', 'mean', 'median', 'min', 'max'
-        ]).round(0)
+    if market['condition_analysis'] is not None:
         print("\n各條件價格分析:")
-        order = ['New', 'Unworn', 'Very good', 'Good', 'Fair', 'Poor', 'Incomplete']
-        condition_analysis = condition_analysis.reindex(order)
-        print(condition_analysis)
-    
+        print(market['condition_analysis'])
+
     # 按配件分組
-    if 'full_set' in same_ref.columns:
+    if market['full_set'] is not None:
         print("\n配件完整度影響:")
-        full_set_yes = same_ref[same_ref['full_set'] == 1]['price'].mean()
-        full_set_no = same_ref[same_ref['full_set'] == 0]['price'].mean()
-        
+        full_set_yes = market['full_set']['yes']
+        full_set_no = market['full_set']['no']
+
         if not pd.isna(full_set_yes) and not pd.isna(full_set_no):
             print(f"Full Set: ${full_set_yes:,.0f}")
             print(f"Not Full Set: ${full_set_no:,.0f}")
             print(f"差價: ${full_set_yes - full_set_no:,.0f}")
-    
+
     # 按年份分組
-    if 'age' in same_ref.columns:
+    if market['age_analysis'] is not None:
         print("\n不同年份價格趨勢:")
-        age_groups = pd.cut(same_ref['age'], bins=[0, 2, 5, 10, 20, 100], 
-                           labels=['<2年', '2-5年', '5-10年', '10-20年', '>20年'])
-        age_analysis = same_ref.groupby(age_groups, observed=False)['price'].agg(['mean', 'count'])
-        print(age_analysis.round(0))
-    
+        print(market['age_analysis'].round(0))
+
     # =====================================
     # Step 7: 找出最相似的5筆交易
     # =====================================
     print("\n"+"-"*40)
     print("Step 7: 最相似的交易記錄")
     print("-"*40)
-    
-    # 計算價格差異並排序
-    same_ref['price_diff'] = abs(same_ref['price'] - seller_price)
-    similar_trades = same_ref.nsmallest(5, 'price_diff')
-    
-    print("最接近賣家報價的5筆交易:")
-    for idx, (_, row) in enumerate(similar_trades.iterrows(), 1):
+
+    # 依價格與錶齡的加權距離排序 (ComparableIndex)
+    print("與賣家報價及錶齡最相似的5筆交易:")
+    for idx, row in enumerate(result['similar_trades'], 1):
         print(f"\n{idx}. 價格: ${row['price']:,.0f} (差異: ${row['price_diff']:,.0f})")
         print(f"   條件: {row['condition']}")
         print(f"   年份: {row['age']}年")
         print(f"   配件: Box={row['has_box']}, Papers={row['has_papers']}")
-    
+
     # =====================================
     # Step 8: 異常值檢測
     # =====================================
     print("\n"+"-"*40)
     print("Step 8: 異常值分析")
     print("-"*40)
-    
-    # 使用 IQR 方法檢測異常值
-    Q1 = price_q1
-    Q3 = price_q3
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    
-    outliers = same_ref[(same_ref['price'] < lower_bound) | (same_ref['price'] > upper_bound)]
-    
-    print(f"正常價格範圍: ${lower_bound:,.0f} - ${upper_bound:,.0f}")
-    print(f"發現 {len(outliers)} 筆異常價格")
-    
-    if seller_price < lower_bound:
+
+    outlier = result['outlier']
+    print(f"正常價格範圍: ${outlier['lower_bound']:,.0f} - ${outlier['upper_bound']:,.0f}")
+    print(f"發現 {outlier['outlier_count']} 筆異常價格")
+
+    if outlier['verdict'] == 'low':
         print(f"⚠️ 賣家價格低於正常範圍，可能是:")
         print("   1. 絕佳的交易機會")
         print("   2. 手錶可能有問題")
         print("   3. 需要特別注意真偽")
-    elif seller_price > upper_bound:
+    elif outlier['verdict'] == 'high':
         print(f"⚠️ 賣家價格高於正常範圍，建議謹慎考慮")
     else:
         print(f"✅ 賣家價格在正常範圍內")
 
     # =====================================
     # Step 9: 保值率檢測
-    # =====================================   
+    # =====================================
     print("\n"+"-"*40)
     print("Step 9: 保值率分析")
     print("-"*40)
 
-    if len(same_ref) >= 10:
-        valid_data = same_ref.copy()
-        # 計算線性回歸
-        slope, intercept, r_value, p_value, std_err = stats.linregress(
-            valid_data['age'], 
-            valid_data['price']
-        )
-        r_squared = r_value ** 2
-        annual_change = slope
-        annual_rate = (slope / intercept) * 100
-    
-        if p_value < 0.05:
+    retention = result['retention']
+    if retention is not None:
+        if retention['significant']:
             significance = "✅ 統計顯著"
-            r2= True
         else:
             significance = "⚠️ 趨勢不顯著（可能只是隨機波動）"
-            r2= False
 
-        print(f"\n基於 {len(valid_data)} 筆有年份資料的交易")
-        print(f"錶年範圍: {valid_data['age'].min():.1f} ~ {valid_data['age'].max():.1f} 年")
-        print(f"統計顯著性 (p-value): {p_value:.4f} {significance}")
+        print(f"\n基於 {retention['n']} 筆有年份資料的交易")
+        print(f"錶年範圍: {retention['min_age']:.1f} ~ {retention['max_age']:.1f} 年")
+        print(f"統計顯著性 (p-value): {retention['p_value']:.4f} {significance}")
         print("-"*60)
 
         # 模型品質評估
-        if r2:
+        r_squared = retention['r_squared']
+        if retention['significant']:
             print(f"\n模型準確度 (R²): {r_squared:.3f}")
-            if r_squared > 0.60:
-                print("✅ 模型品質: 優秀")
-                print(f"   年份能解釋 {r_squared*100:.1f}% 的價格變異")
-            elif r_squared > 0.40:
-                print("✅ 模型品質: 良好")
+            print(f"{'✅' if r_squared > 0.40 else '⚠️'} 模型品質: {retention['quality']}")
+            if r_squared > 0.40:
                 print(f"   年份能解釋 {r_squared*100:.1f}% 的價格變異")
             elif r_squared > 0.25:
-                print("⚠️ 模型品質: 一般")
                 print(f"   年份僅能解釋 {r_squared*100:.1f}% 的價格變異")
                 print("   其他因素（條件、配件等）可能更重要")
             else:
-                print("⚠️ 模型品質: 較弱")
                 print(f"   年份只能解釋 {r_squared*100:.1f}% 的價格變異")
-                print("   💡 此款錶的價格主要取決於其他因素")        
-                
-        if intercept > 0:
-                # 每年變化
-                if annual_change >= 0:
-                    print(f"📈 每年升值: ${abs(annual_change):,.0f}")
-                    print(f"年變化率: +{annual_rate:.2f}%")
-                else:
-                    print(f"📉 每年貶值: ${abs(annual_change):,.0f}")
-                    print(f"年變化率: {annual_rate:.2f}%")
-            
-            
-                # # 5年後預測
-                price_now = slope * watch_age + intercept
-                price_5y = slope * (watch_age + 5) + intercept
-                if  price_5y > 0:
-                    retention_5y = (price_5y / price_now)*  100
-                    print(f"\n5年後預測:")
-                    print(f"  • 價格: ${price_5y:,.0f}")
-                    print(f"  • 保值率: {retention_5y:.1f}%")
-        
-                # 在5年預測之後加上外推預測
-                max_age = valid_data['age'].max()
-                if max_age < watch_age + 5 :
-                    print(f"⚠️ 注意：目前資料只到錶齡 {max_age} 年，往後的預測屬於外插結果，可信度較低。")    
-        else:
-            print(f"⚠️ 警告: 模型在新錶價格的預測為 ${intercept:,.0f} (不合理)")
+                print("   💡 此款錶的價格主要取決於其他因素")
+
+        if retention['intercept'] > 0:
+            # 每年變化
+            annual_change = retention['slope']
+            if annual_change >= 0:
+                print(f"📈 每年升值: ${abs(annual_change):,.0f}")
+                print(f"年變化率: +{retention['annual_rate']:.2f}%")
+            else:
+                print(f"📉 每年貶值: ${abs(annual_change):,.0f}")
+                print(f"年變化率: {retention['annual_rate']:.2f}%")
+        elif retention.get('model') in (None, 'linear'):
+            # 最佳模型不是線性迴歸時, 5年預測改用該模型, 不受負截距影響
+            print(f"⚠️ 警告: 模型在新錶價格的預測為 ${retention['intercept']:,.0f} (不合理)")
             print(f"   這可能表示:")
             print(f"   1. 資料中缺乏新錶或年輕錶的樣本")
             print(f"   2. 線性模型不適合此錶款")
+
+        intervals = retention.get('intervals')
+        if intervals is not None and intervals['slope'] is not None:
+            lower, upper = intervals['slope']
+            print(f"   每年價格變化 {BOOTSTRAP_CONFIDENCE:.0%} 信賴區間: {lower:+,.0f} ~ {upper:+,.0f} USD")
+
+        # 交叉驗證誤差最小的折舊模型 (不是線性迴歸時, 5年預測改用此模型)
+        if retention.get('model') not in (None, 'linear'):
+            print(f"\n最佳折舊模型: {retention['model']} "
+                  f"(交叉驗證誤差約 {retention['model_cv_error']*100:.1f}%)")
+
+        # # 5年後預測
+        if retention['retention_5y'] is not None:
+            print(f"\n5年後預測:")
+            print(f"  • 價格: ${retention['price_5y']:,.0f}")
+            print(f"  • 保值率: {retention['retention_5y']:.1f}%")
+            if intervals is not None and intervals['price_5y'] is not None:
+                lower, upper = intervals['price_5y']
+                print(f"  • 價格 {BOOTSTRAP_CONFIDENCE:.0%} 信賴區間: ${lower:,.0f} ~ ${upper:,.0f}")
+            if intervals is not None and intervals['retention_5y'] is not None:
+                lower, upper = intervals['retention_5y']
+                print(f"  • 保值率 {BOOTSTRAP_CONFIDENCE:.0%} 信賴區間: {lower:.1f}% ~ {upper:.1f}%")
+
+        # 在5年預測之後加上外推預測
+        if retention['extrapolated']:
+            print(f"⚠️ 注意：目前資料只到錶齡 {retention['max_age']} 年，往後的預測屬於外插結果，可信度較低。")
     else:
         print("\n⚠️ 資料數小於10筆，不適合進行保值率分析")
 
 
-    # ====================================================    
+    # ====================================================
     # Step 10 額外提醒
-    # ====================================================  
+    # ====================================================
     print("\n 購買前檢查清單:")
     print("1. 確認手錶真偽（要求提供購買證明）")
     print("2. 檢查手錶實際狀況是否符合描述")
     print("3. 確認保固和售後服務")
     print("4. 要求更多實物照片")
     print("5. 考慮使用第三方驗證服務")
-    
+
     print("\n" + "="*60)
     print("分析完成！")
     print("="*60)
-    
-    
-    # =====================================
-    # Step 11 視覺化分析
-    # =====================================
-    
-    fig = plt.figure(figsize=(16, 10))
-    fig.suptitle(f'手錶價格分析報告 - Ref {target_ref}', 
-             fontsize=16, 
+
+
+def _draw_template(fig, ref, market):
+    """
+    畫出報告中與賣家報價無關的部分 (可重複使用)
+
+    參數:
+        fig: matplotlib Figure
+        ref: Reference Number
+        market: PriceAnalyzer.market 的結果
+
+    回傳:
+        dict, 含 axes、mean_line、median_line、trend_line 與 has_condition
+    """
+    price_mean = market['stats']['mean']
+    price_median = market['stats']['median']
+    same_ref = market['data']
+
+    fig.suptitle(f'手錶價格分析報告 - Ref {ref}',
+             fontsize=16,
              fontweight='bold',
              y=0.98)  # y參數控制標題位置，0.98表示靠近頂部
 
     # 1. 價格分布直方圖
-    ax1 = plt.subplot(2, 2, 1)
+    ax1 = fig.add_subplot(2, 2, 1)
     ax1.hist(same_ref['price'], bins=20, edgecolor='black', alpha=0.7, color='skyblue')
-    ax1.axvline(seller_price, color='red', linestyle='--', linewidth=2, label=f'賣家報價: ${seller_price:,.0f}')
-    ax1.axvline(price_mean, color='green', linestyle='--', linewidth=2, label=f'平均價: ${price_mean:,.0f}')
-    ax1.axvline(price_median, color='orange', linestyle='--', linewidth=2, label=f'中位數: ${price_median:,.0f}')
+    mean_line = ax1.axvline(price_mean, color='green', linestyle='--', linewidth=2, label=f'平均價: ${price_mean:,.0f}')
+    median_line = ax1.axvline(price_median, color='orange', linestyle='--', linewidth=2, label=f'中位數: ${price_median:,.0f}')
     ax1.set_xlabel('價格 (USD)')
     ax1.set_ylabel('數量')
-    ax1.set_title(f'Ref {target_ref} 價格分布')
-    ax1.legend()
+    ax1.set_title(f'Ref {ref} 價格分布')
     ax1.grid(True, alpha=0.3)
-    
+
     # 2. 箱型圖
-    ax2 = plt.subplot(2, 2, 2)
+    ax2 = fig.add_subplot(2, 2, 2)
     box_plot = ax2.boxplot(same_ref['price'], patch_artist=True)
     box_plot['boxes'][0].set_facecolor('lightblue')
-    ax2.plot(1, seller_price, 'r*', markersize=15, label='賣家報價')
     ax2.set_ylabel('價格 (USD)')
     ax2.set_title('價格箱型圖')
-    ax2.legend()
     ax2.grid(True, alpha=0.3)
 
-    ax2.text(0.98, 0.98, f'{score}分\n{rating}', 
-         transform=ax2.transAxes,
-         fontsize=14, fontweight='bold',
-         verticalalignment='top', horizontalalignment='right',
-         bbox=dict(boxstyle='round', alpha=0.8, edgecolor='black'))
-    
     # 3. 條件vs價格 (如果有條件欄位)
-    ax3 = plt.subplot(2, 2, 3)
-    if 'condition' in same_ref.columns and same_ref['condition'].notna().any():
-        condition_prices = same_ref.groupby('condition', observed=False)['price'].mean().sort_values()
+    ax3 = fig.add_subplot(2, 2, 3)
+    has_condition = 'condition' in same_ref.columns and same_ref['condition'].notna().any()
+    if has_condition:
+        condition_prices = same_ref.groupby('condition', observed=True)['price'].mean().sort_values()
         ax3.barh(range(len(condition_prices)), condition_prices.values)
         ax3.set_yticks(range(len(condition_prices)))
         ax3.set_yticklabels(condition_prices.index)
-        ax3.axvline(seller_price, color='red', linestyle='--', label='賣家報價')
         ax3.set_xlabel('平均價格 (USD)')
         ax3.set_title('各條件平均價格')
-        ax3.legend()
     else:
         ax3.text(0.5, 0.5, '無條件資料', ha='center', va='center')
         ax3.set_title('條件分析')
-    
-    # 4. 價格趨勢 (如果有年份資料)
-    ax4 = plt.subplot(2, 2, 4)
+
+    # 4. 價格趨勢 (如果有年份資料), 趨勢線直接使用 Step 9 的迴歸結果
+    ax4 = fig.add_subplot(2, 2, 4)
+    trend_line = None
     if 'age' in same_ref.columns and same_ref['age'].notna().any():
         ax4.scatter(same_ref['age'], same_ref['price'], alpha=0.5)
-        ax4.scatter(watch_age, [seller_price], 
-                   color='red', s=100, marker='*', label='賣家報價')
-        z = np.polyfit(same_ref['age'].dropna(), 
-                      same_ref.loc[same_ref['age'].notna(), 'price'], 1)
+        regression = market['regression']
+        if regression is not None:
+            z = (regression['slope'], regression['intercept'])
+        else:
+            z = np.polyfit(same_ref['age'].dropna(),
+                          same_ref.loc[same_ref['age'].notna(), 'price'], 1)
         p = np.poly1d(z)
-        ax4.plot(same_ref['age'].sort_values(), 
-                p(same_ref['age'].sort_values()), 
-                "r--", alpha=0.5, label='趨勢線')
+        ages = same_ref['age'].sort_values()
+        trend_line, = ax4.plot(ages, p(ages), "r--", alpha=0.5, label='趨勢線')
         ax4.set_xlabel('年份')
         ax4.set_ylabel('價格 (USD)')
         ax4.set_title('價格 vs 年份')
-        ax4.legend()
         ax4.grid(True, alpha=0.3)
     else:
         ax4.text(0.5, 0.5, '無年份資料', ha='center', va='center')
         ax4.set_title('年份分析')
 
-    plt.show()
\ No newline at end of file
+    axes = (ax1, ax2, ax3, ax4)
+    return {
+        'axes': axes,
+        # 底圖的資料範圍 (移除標記後還原, 座標軸範圍才不會受上一筆報價影響)
+        'data_limits': [ax.dataLim.frozen() for ax in axes],
+        'mean_line': mean_line,
+        'median_line': median_line,
+        'trend_line': trend_line,
+        'has_condition': has_condition,
+        'markers': [],
+    }
+
+
+def _draw_markers(template, result):
+    """
+    畫出賣家報價相關的標記 (先移除上一次的標記)
+
+    參數:
+        template: _draw_template 的結果
+        result: PriceAnalyzer.analyze 的結果
+    """
+    if template['markers']:
+        for artist in template['markers']:
+            artist.remove()
+        for ax, limits in zip(template['axes'], template['data_limits']):
+            ax.dataLim.set(limits.frozen())  # set 會共用陣列, 先複製
+            ax.autoscale_view()
+
+    seller_price = result['seller_price']
+    ax1, ax2, ax3, ax4 = template['axes']
+
+    seller_line = ax1.axvline(seller_price, color='red', linestyle='--', linewidth=2, label=f'賣家報價: ${seller_price:,.0f}')
+    ax1.legend(handles=[seller_line, template['mean_line'], template['median_line']])
+
+    seller_star, = ax2.plot(1, seller_price, 'r*', markersize=15, label='賣家報價')
+    ax2.legend(handles=[seller_star])
+    score_text = ax2.text(0.98, 0.98, f"{result['score']}分\n{result['rating']}",
+         transform=ax2.transAxes,
+         fontsize=14, fontweight='bold',
+         verticalalignment='top', horizontalalignment='right',
+         bbox=dict(boxstyle='round', alpha=0.8, edgecolor='black'))
+    markers = [seller_line, seller_star, score_text]
+
+    if template['has_condition']:
+        condition_line = ax3.axvline(seller_price, color='red', linestyle='--', label='賣家報價')
+        ax3.legend(handles=[condition_line])
+        markers.append(condition_line)
+
+    if template['trend_line'] is not None:
+        age_star = ax4.scatter(result['watch_age'], [seller_price],
+                   color='red', s=100, marker='*', label='賣家報價')
+        ax4.legend(handles=[age_star, template['trend_line']])
+        markers.append(age_star)
+
+    template['markers'] = markers
+
+
+def _set_fonts(matplotlib):
+    """設定中文字體"""
+    matplotlib.rcParams['font.sans-serif'] = ['Microsoft JhengHei']  # 繁體中文字體
+    matplotlib.rcParams['axes.unicode_minus'] = False  # 解決負號顯示問題
+
+
+def plot_report(result, market):
+    """
+    Step 11: 視覺化分析 (以視窗顯示)
+
+    參數:
+        result: PriceAnalyzer.analyze 的結果
+        market: PriceAnalyzer.market 的結果
+    """
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    _set_fonts(matplotlib)
+    fig = plt.figure(figsize=(16, 10))
+    template = _draw_template(fig, result['ref'], market)
+    _draw_markers(template, result)
+    plt.show()
+
+
+class ReportRenderer:
+    """不需顯示器的報告輸出 (Agg), 同型號的圖表底圖會快取, 每次只重畫賣家報價標記"""
+
+    def __init__(self, max_templates=32, dpi=100):
+        """
+        初始化輸出器
+
+        參數:
+            max_templates: 最多快取的型號底圖數 (超過時移除最久未使用的)
+            dpi: 輸出解析度
+        """
+        import matplotlib
+
+        _set_fonts(matplotlib)
+        self.max_templates = max_templates
+        self.dpi = dpi
+        self._templates = OrderedDict()
+
+    def _template(self, ref, market):
+        """取得型號的底圖 (第一次使用時建立)"""
+        template = self._templates.get(ref)
+        if template is None:
+            # 直接建立 Figure (不經過 pyplot), 存檔時使用 Agg / SVG 後端
+            from matplotlib.figure import Figure
+
+            template = _draw_template(Figure(figsize=(16, 10)), ref, market)
+            template['figure'] = template['axes'][0].figure
+            self._templates[ref] = template
+            if len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        else:
+            self._templates.move_to_end(ref)
+        return template
+
+    def render(self, result, market, path):
+        """
+        輸出一份報告圖檔
+
+        參數:
+            result: PriceAnalyzer.analyze 的結果
+            market: PriceAnalyzer.market 的結果
+            path: 輸出路徑 (副檔名 .png 或 .svg)
+
+        回傳:
+            輸出路徑
+        """
+        template = self._template(result['ref'], market)
+        _draw_markers(template, result)
+        template['figure'].savefig(path, dpi=self.dpi)
+        return path
+
+
+def report_filename(index, ref, fmt="png"):
+    """批次報告的檔名 (序號_型號.副檔名, 型號中的特殊字元改為 _)"""
+    safe_ref = re.sub(r'[^0-9A-Za-z]+', '_', str(ref))
+    return f"{index:06d}_{safe_ref}.{fmt}"
+
+
+def _render_reports_task(args):
+    """平行處理用: 輸出一組型號的所有報告"""
+    db_path, offers, output_dir, fmt = args
+    analyzer = PriceAnalyzer.from_database(db_path, refs=offers['reference number'].unique())
+    renderer = ReportRenderer()
+
+    paths = []
+    for index, ref, seller_price, year in offers[['reference number', 'seller_price', 'year']].itertuples():
+        if ref not in analyzer or pd.isna(seller_price) or pd.isna(year):
+            continue
+        result = analyzer.analyze(ref, seller_price, year)
+        path = os.path.join(output_dir, report_filename(index, ref, fmt))
+        paths.append(renderer.render(result, analyzer.market(ref), path))
+    return paths
+
+
+def render_reports(offers, output_dir="plot/report", fmt="png", n_jobs=1, db_path=DB_PATH):
+    """
+    批次輸出報價報告圖檔 (依型號分配給多個程序, 同型號的報告在同一程序內共用底圖)
+
+    參數:
+        offers: 含 OFFER_COLUMNS 的 DataFrame
+        output_dir: 輸出資料夾
+        fmt: 'png' 或 'svg'
+        n_jobs: 平行處理的程序數 (預設 1 表示不平行)
+        db_path: SQLite 檔案路徑
+
+    回傳:
+        輸出的檔案路徑列表 (找不到型號的報價不輸出)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    offers = offers.reset_index(drop=True)
+
+    # 依型號分組, 再依報價數把型號平均分給各程序
+    codes, refs = pd.factorize(offers['reference number'])
+    n_chunks = max(1, min(n_jobs, len(refs)))
+    counts = np.bincount(codes[codes >= 0], minlength=len(refs))
+    chunk_of_ref = np.zeros(len(refs), dtype=int)
+    loads = np.zeros(n_chunks)
+    for code in np.argsort(-counts, kind='stable'):
+        chunk_of_ref[code] = np.argmin(loads)
+        loads[chunk_of_ref[code]] += counts[code]
+
+    tasks = []
+    for chunk in range(n_chunks):
+        mask = (codes >= 0) & (chunk_of_ref[codes] == chunk)
+        tasks.append((db_path, offers[mask], output_dir, fmt))
+
+    if n_chunks == 1:
+        parts = [_render_reports_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_chunks) as pool:
+            parts = list(pool.map(_render_reports_task, tasks))
+    return [path for part in parts for path in part]
+
+
+def load_reference_index(db_path=DB_PATH, path=REFERENCE_INDEX_PATH):
+    """載入型號建議索引 (沒有儲存的索引檔時由資料庫建立)"""
+    if os.path.exists(path):
+        return ReferenceIndex.load(path)
+    return ReferenceIndex.from_database(db_path)
+
+
+def main(db_path=DB_PATH, plot=True, report_path=None):
+    """
+    互動式價格分析 (輸入型號、賣家報價與年份)
+
+    參數:
+        db_path: SQLite 檔案路徑
+        plot: 是否顯示 Step 11 的圖表 (False 時只輸出文字報告, 不載入 matplotlib)
+        report_path: 指定時將 Step 11 的圖表存成檔案 (.png / .svg), 不開啟視窗
+    """
+    # =====================================
+    # Step 1: 載入資料
+    # =====================================
+    print("="*60)
+    print("Rolex Reference Number 價格分析系統")
+    print("="*60)
+
+    print("\nStep 1: 載入資料")
+    connection=sqlite3.connect(db_path)
+    # 只查詢筆數, 實際資料在輸入型號後才依型號讀取
+    total_count, ref_count = connection.execute("""
+    SELECT COUNT(*), COUNT(DISTINCT [reference number]) FROM price_analysis
+                    """).fetchone()
+
+    print(f"總資料筆數: {total_count}")
+    print(f"不重複的 Reference Number: {ref_count}")
+
+    # =====================================
+    # Step 2: 輸入要查詢的 Reference Number
+    # =====================================
+    print("\nStep 2: 輸入查詢資訊")
+
+    # 使用者輸入
+    target_ref = input("請輸入 Reference Number (例如: 116610LN): ").upper()
+    seller_price = float(input("請輸入賣家報價 (USD): "))
+    year = int(input("請輸入手錶年分: "))
+    print(f"\n查詢 Ref: {target_ref}")
+    print(f"賣家報價: ${seller_price:,.0f}")
+    print(f"手錶年齡:{CURRENT_YEAR - year}")
+    # =====================================
+    # Step 3: 篩選相同 Reference Number 的資料
+    # =====================================
+    print("\nStep 3: 分析同款手錶市場資料")
+
+    # 只載入相同 ref 的資料 (以 idx_rolex_ref 索引查詢)
+    analyzer = PriceAnalyzer.from_database(db_path, refs=[target_ref])
+
+    if target_ref not in analyzer:
+        print(f"❌ 找不到 Reference Number: {target_ref} 的資料")
+        print("建議檢查輸入是否正確，或使用相近的型號")
+
+        # 輸入為型號前綴時列出同前綴的型號, 否則列出拼字相近的型號
+        reference_index = load_reference_index(db_path)
+        variants = reference_index.with_prefix(target_ref, limit=20)
+        suggestions = reference_index.suggest(target_ref)
+        if variants:
+            print(f"\n以 {target_ref} 開頭的 Reference Numbers:")
+            for ref, count in variants:
+                print(f"  {ref}: {count} 筆資料")
+        elif suggestions:
+            print("\n相近的 Reference Numbers:")
+            for ref, distance, count in suggestions:
+                print(f"  {ref}: {count} 筆資料 (差異 {distance} 個字元)")
+        else:
+            # 顯示可能的相似 ref
+            possible_refs = connection.execute("""
+            SELECT [reference number], COUNT(*) AS count FROM price_analysis
+            GROUP BY [reference number]
+            ORDER BY count DESC
+            LIMIT 10
+                        """).fetchall()
+            print("\n最常見的 Reference Numbers:")
+            for ref, count in possible_refs:
+                print(f"  {ref}: {count} 筆資料")
+        connection.close()
+        return
+
+    connection.close()
+    result = analyzer.analyze(target_ref, seller_price, year)
+    market = analyzer.market(target_ref)
+    print(f"✅ 找到 {result['count']} 筆相同 Reference Number 的資料")
+
+    print_report(result, market)
+    if report_path:
+        ReportRenderer().render(result, market, report_path)
+        print(f"報告已儲存至 {report_path}")
+    elif plot:
+        plot_report(result, market)
+
+
+def run_batch(offers_path, output_path="data/offer_valuation.csv", db_path=DB_PATH):
+    """
+    批次評估報價檔並儲存結果
+
+    參數:
+        offers_path: 報價檔 (CSV 或 Parquet, 欄位為 OFFER_COLUMNS)
+        output_path: 結果檔案路徑
+        db_path: SQLite 檔案路徑
+
+    回傳:
+        評估結果 DataFrame
+    """
+    offers = load_table(offers_path, columns=OFFER_COLUMNS)
+    offers['reference number'] = offers['reference number'].astype(str).str.strip().str.upper()
+
+    # 只載入報價中出現的型號
+    analyzer = PriceAnalyzer.from_database(db_path, refs=offers['reference number'].unique())
+    result = analyzer.analyze_batch(offers)
+
+    save_table(result, output_path)
+    print(f"評估 {len(result)} 筆報價 ({(~result['found']).sum()} 筆找不到型號)")
+    print(f"資料已儲存至 {output_path}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolex Reference Number 價格分析")
+    parser.add_argument("--offers", help="批次評估的報價檔 (欄位: reference number, seller_price, year)")
+    parser.add_argument("--output", default="data/offer_valuation.csv", help="批次評估結果檔案")
+    parser.add_argument("--no-plot", action="store_true", help="只輸出文字報告, 不顯示圖表")
+    parser.add_argument("--report", help="將圖表存成檔案 (.png / .svg), 不開啟視窗")
+    parser.add_argument("--report-dir", help="批次評估時, 每筆報價輸出一份報告圖檔到此資料夾")
+    parser.add_argument("--format", default="png", choices=["png", "svg"], help="批次報告圖檔格式")
+    parser.add_argument("--jobs", type=int, default=1, help="批次報告的平行程序數")
+    args = parser.parse_args()
+
+    if args.offers:
+        result = run_batch(args.offers, args.output)
+        if args.report_dir:
+            paths = render_reports(result[OFFER_COLUMNS], args.report_dir, args.format, args.jobs)
+            print(f"輸出 {len(paths)} 份報告至 {args.report_dir}")
+    else:
+        main(plot=not args.no_plot, report_path=args.report)
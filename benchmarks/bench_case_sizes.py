@@ -0,0 +1,38 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _01_datacleaner import RolexDataCleaner
+
+# 模擬原始資料的尺寸字串 (重複率高)
+SAMPLE_SIZES = ["40 mm", "41 mm", "36 mm", "39,5 mm", "44 mm", "40 x 47 mm", "ca. 40 mm", "13 mm", None]
+
+
+def main(rows):
+    rng = np.random.default_rng(0)
+    series = pd.Series(rng.choice(np.array(SAMPLE_SIZES, dtype=object), size=rows))
+    cleaner = RolexDataCleaner(None)
+
+    start = time.perf_counter()
+    expected = series.apply(cleaner.clean_case_size).astype(float)
+    apply_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = cleaner.parse_case_sizes(series)
+    vectorized_seconds = time.perf_counter() - start
+
+    pd.testing.assert_series_equal(result, expected)
+    print(f"{rows:,} 筆: apply(clean_case_size) {apply_seconds:.2f} s, "
+          f"parse_case_sizes {vectorized_seconds:.2f} s ({apply_seconds / vectorized_seconds:.0f} 倍)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="錶殼尺寸解析: 逐筆 apply vs 向量化")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    main(parser.parse_args().rows)
@@ -0,0 +1,82 @@
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _03_create_database import create_lookup_index_sql, create_price_analysis_sql
+from _05_price_analysis import load_market_data
+
+
+def build(path, rows, refs, indexed):
+    """只建立 rolex 資料表與 price_analysis View (可選擇是否建立 rolex 的查詢索引)"""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'reference number': rng.integers(0, refs, rows).astype(str),
+        'price': rng.lognormal(10, 0.5, rows).round(),
+        'condition': rng.choice(['New', 'Unworn', 'Very good', 'Good'], rows),
+        'age': rng.integers(0, 40, rows),
+        'full_set': rng.integers(0, 2, rows),
+        'has_box': rng.integers(0, 2, rows),
+        'has_papers': rng.integers(0, 2, rows),
+    })
+    connection = sqlite3.connect(path)
+    df.to_sql('rolex', connection, index=False)
+    connection.execute(create_price_analysis_sql)
+    if indexed:
+        for statement in create_lookup_index_sql.split(';'):
+            if 'ON rolex(' in statement:
+                connection.execute(statement)
+    connection.commit()
+    connection.close()
+
+
+def timed(function, repeat):
+    """執行 repeat 次, 回傳 (最後一次的結果, 平均秒數)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main(rows, refs, repeat):
+    ref = "7"
+    with tempfile.TemporaryDirectory() as directory:
+        plain = os.path.join(directory, "plain.db")
+        indexed = os.path.join(directory, "indexed.db")
+        build(plain, rows, refs, indexed=False)
+        build(indexed, rows, refs, indexed=True)
+
+        def full_view():
+            connection = sqlite3.connect(plain)
+            df = pd.read_sql("SELECT * FROM price_analysis", con=connection)
+            connection.close()
+            return df[df['reference number'] == ref]
+
+        results = {
+            "讀取整個 View 再篩選": timed(full_view, max(repeat // 10, 1)),
+            "WHERE 條件、無索引": timed(lambda: load_market_data(plain, refs=[ref]), repeat),
+            "WHERE 條件、有索引": timed(lambda: load_market_data(indexed, refs=[ref]), repeat),
+        }
+
+    expected = results["讀取整個 View 再篩選"][0].sort_values(['age', 'price']).reset_index(drop=True)
+    print(f"{rows:,} 筆 / {refs:,} 個型號, 單一型號 {len(expected):,} 筆:")
+    for label, (df, seconds) in results.items():
+        df = df.astype(expected.dtypes.to_dict()).sort_values(['age', 'price']).reset_index(drop=True)
+        pd.testing.assert_frame_equal(df, expected)
+        print(f"  {seconds * 1000:8.1f} ms  {label}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="單一型號查詢: 讀取整個 View vs WHERE 條件 (無索引 / 有索引)")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--refs", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.rows, args.refs, args.repeat)
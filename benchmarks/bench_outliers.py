@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _02_preprocess import DataPreprocessor
+
+
+def apply_remove_outliers(df, iqr_multiplier=1.5):
+    """原本逐型號 apply 的 remove_outliers"""
+    def filter_group(group):
+        Q1 = group['price'].quantile(0.25)
+        Q3 = group['price'].quantile(0.75)
+        IQR = Q3 - Q1
+        lower_bound = Q1 - iqr_multiplier * IQR
+        upper_bound = Q3 + iqr_multiplier * IQR
+        return group[(group['price'] >= lower_bound) & (group['price'] <= upper_bound)]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        return df.groupby(['reference number'], observed=True).apply(filter_group).reset_index(drop=True)
+
+
+def main(rows, refs):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'reference number': rng.integers(0, refs, rows).astype(str),
+        'price': rng.lognormal(10, 0.5, rows).round(),
+    })
+
+    start = time.perf_counter()
+    expected = apply_remove_outliers(df)
+    apply_seconds = time.perf_counter() - start
+
+    preprocessor = DataPreprocessor(None)
+    preprocessor.df = df
+    start = time.perf_counter()
+    result = preprocessor.remove_outliers().df
+    vectorized_seconds = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(result, expected)
+    print(f"{rows:,} 筆 / {refs:,} 個型號: groupby.apply {apply_seconds:.2f} s, "
+          f"remove_outliers {vectorized_seconds:.2f} s ({apply_seconds / vectorized_seconds:.0f} 倍)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="移除價格異常值: 逐型號 apply vs 排序一次計算分位數")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--refs", type=int, default=5_000)
+    args = parser.parse_args()
+    main(args.rows, args.refs)
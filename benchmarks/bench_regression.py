@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _00_stats import linregress_from_moments, reference_moments
+
+
+def loop_linregress(df):
+    """原本逐型號篩選資料再呼叫 scipy.stats.linregress 的寫法"""
+    fits = {}
+    for ref in df['reference number'].unique():
+        ref_data = df[df['reference number'] == ref]
+        if len(ref_data) > 10 and len(ref_data["age"].unique()) > 1:
+            fits[ref] = stats.linregress(ref_data['age'], ref_data['price'])
+    return fits
+
+
+def main(rows, refs):
+    rng = np.random.default_rng(0)
+    age = rng.integers(0, 30, rows).astype(float)
+    df = pd.DataFrame({
+        'reference number': rng.integers(0, refs, rows).astype(str),
+        'age': age,
+        'price': (rng.lognormal(10, 0.3, rows) * (1 - 0.01 * age)).round(),
+    })
+
+    start = time.perf_counter()
+    expected = loop_linregress(df)
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    moments = reference_moments(df)
+    fit = linregress_from_moments(moments)
+    batched_seconds = time.perf_counter() - start
+
+    eligible = fit[(moments["n"] > 10) & (moments["n_x"] > 1)]
+    assert sorted(eligible.index) == sorted(expected)
+    columns = ['slope', 'intercept', 'r_value', 'p_value', 'std_err']
+    expected = pd.DataFrame({ref: list(result)[:5] for ref, result in expected.items()}, index=columns).T
+    np.testing.assert_allclose(eligible[columns].to_numpy(), expected.loc[eligible.index].to_numpy(),
+                               rtol=1e-9, atol=1e-12)
+
+    print(f"{rows:,} 筆 / {refs:,} 個型號: 逐型號 linregress {loop_seconds:.2f} s, "
+          f"reference_moments + linregress_from_moments {batched_seconds:.2f} s "
+          f"({loop_seconds / batched_seconds:.0f} 倍)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="各型號錶齡-價格迴歸: 逐型號 linregress vs 充分統計量批次計算")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--refs", type=int, default=500)
+    args = parser.parse_args()
+    main(args.rows, args.refs)
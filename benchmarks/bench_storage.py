@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _00_schema import SCHEMA
+from _00_storage import load_table, save_table
+
+# 只讀部分欄位的測試 (_03 建立保值率時使用的欄位)
+PROJECTION = ["reference number", "age", "price"]
+
+
+def _timed(label, load):
+    """載入一次, 印出時間與 DataFrame 記憶體用量"""
+    start = time.perf_counter()
+    df = load()
+    seconds = time.perf_counter() - start
+    megabytes = df.memory_usage(deep=True).sum() / 1024 ** 2
+    print(f"{seconds:6.2f} s {megabytes:9,.0f} MB  {label}")
+    return df
+
+
+def main(path, rows):
+    df = load_table(path, index_col=0)
+    if rows is not None:
+        df = df.sample(n=rows, replace=True, random_state=0).reset_index(drop=True)
+    print(f"{len(df):,} 筆")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "data_clean.csv")
+        parquet_path = os.path.join(tmp, "data_clean.parquet")
+        save_table(df, csv_path, index=True)
+        save_table(df, parquet_path, index=True)
+
+        _timed("CSV", lambda: load_table(csv_path, index_col=0))
+        _timed("CSV + schema", lambda: load_table(csv_path, index_col=0, schema=SCHEMA))
+        _timed("Parquet", lambda: load_table(parquet_path, index_col=0))
+        _timed("CSV, 3 個欄位", lambda: load_table(csv_path, columns=PROJECTION))
+        _timed("Parquet, 3 個欄位", lambda: load_table(parquet_path, columns=PROJECTION))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="中間檔案 CSV vs Parquet 的載入時間與記憶體")
+    parser.add_argument("path", nargs="?", default="data/data_clean.csv", help="清理後的資料 (CSV 或 Parquet)")
+    parser.add_argument("--rows", type=int, help="重複抽樣成指定筆數 (例如 2000000)")
+    args = parser.parse_args()
+    main(args.path, args.rows)
@@ -0,0 +1,55 @@
+import os
+import sys
+
+# 測試直接匯入專案根目錄的模組 (_01_datacleaner 等)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 合成資料的型號 (最後一個型號的價格不隨錶齡變化)
+REFERENCES = ["116610LN", "126610LV", "124060", "116500LN", "228238", "15200"]
+
+
+def make_clean_data(rows_per_ref=60, seed=0):
+    """
+    與 data_clean.csv 欄位相同的合成預處理資料
+
+    參數:
+        rows_per_ref: 每個型號的筆數
+        seed: 亂數種子
+
+    回傳:
+        DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    n = rows_per_ref * len(REFERENCES)
+    refs = np.repeat(REFERENCES, rows_per_ref)
+    base = np.repeat(rng.uniform(8_000, 40_000, len(REFERENCES)), rows_per_ref)
+    slope = np.repeat(np.r_[rng.uniform(-0.04, 0.03, len(REFERENCES) - 1), 0.0], rows_per_ref)
+    age = rng.integers(0, 25, n)
+    price = np.round(base * (1 + slope * age) * rng.lognormal(0, 0.08, n))
+    has_box = rng.integers(0, 2, n)
+    has_papers = rng.integers(0, 2, n)
+    return pd.DataFrame({
+        "model": np.repeat([f"Model {i}" for i in range(len(REFERENCES))], rows_per_ref),
+        "reference number": refs,
+        "price": price.astype(int),
+        "aditional shipping price": 0,
+        "condition": rng.choice(["New", "Unworn", "Very good", "Good"], n),
+        "age": age,
+        "has_box": has_box,
+        "has_papers": has_papers,
+        "full_set": has_box & has_papers,
+    })
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    """以合成資料建立的資料庫路徑"""
+    from _03_create_database import build_database
+
+    path = tmp_path_factory.mktemp("db") / "rolex.db"
+    build_database(make_clean_data(), str(path))
+    return str(path)
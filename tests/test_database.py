@@ -0,0 +1,172 @@
+import builtins
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from conftest import make_clean_data
+
+
+def query_plan(connection, sql):
+    """EXPLAIN QUERY PLAN 的各步驟說明"""
+    return [row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    """記錄所有 SQLite 連線執行的 SQL (參數已代入)"""
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        connection = connect(*args, **kwargs)
+        connection.set_trace_callback(statements.append)
+        return connection
+
+    monkeypatch.setattr(sqlite3, "connect", traced_connect)
+    return statements
+
+
+def run_main(monkeypatch, database, answers):
+    """以指定的輸入執行 _05 的互動式分析 (只輸出文字報告)"""
+    from _05_price_analysis import main
+
+    answers = iter(answers)
+    monkeypatch.setattr(builtins, "input", lambda prompt="": next(answers))
+    main(database, plot=False)
+
+
+def test_analyzer_queries_use_reference_indexes(database, traced, monkeypatch, tmp_path, capsys):
+    # 沒有型號建議索引檔, 查無型號時由資料庫建立並列出最常見的型號
+    monkeypatch.chdir(tmp_path)
+    run_main(monkeypatch, database, ["116610LN", "12000", "2015"])
+    run_main(monkeypatch, database, ["ZZZZZZZZZZZZ", "12000", "2015"])
+    assert "找到 60 筆" in capsys.readouterr().out
+
+    connection = sqlite3.connect(database)
+    plans = {sql: query_plan(connection, sql) for sql in traced
+             if sql.lstrip().upper().startswith("SELECT") and "[reference number]" in sql}
+
+    lookups = [plan for sql, plan in plans.items() if "WHERE [reference number] IN" in sql]
+    counts = [plan for sql, plan in plans.items() if "COUNT(" in sql]
+    assert lookups and counts
+
+    # 單一型號查詢依型號、錶齡排序, 直接由 idx_rolex_ref_age 取得
+    for plan in lookups:
+        assert any(step.startswith("SEARCH rolex USING INDEX idx_rolex_ref_age") for step in plan)
+        assert not any("ORDER BY" in step for step in plan)
+
+    # 筆數與最常見型號只掃描較窄的 idx_rolex_ref
+    for plan in counts:
+        assert "SCAN rolex USING COVERING INDEX idx_rolex_ref" in plan
+
+    # 沒有任何查詢掃描整張 rolex
+    assert not any(step == "SCAN rolex" for plan in plans.values() for step in plan)
+
+
+def test_views_and_incremental_update_use_indexes(database, traced, tmp_path):
+    import shutil
+
+    from _03_create_database import update_database
+
+    path = str(tmp_path / "rolex.db")
+    shutil.copy(database, path)
+    df = make_clean_data()
+    df.loc[:9, "price"] += 500
+    update_database(df, path)
+
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TEMP TABLE changed_refs (ref TEXT PRIMARY KEY)")
+
+    # 增量更新時依型號刪除保值率
+    deletes = [sql for sql in traced if sql.startswith("DELETE FROM value_retention_rate")]
+    assert deletes
+    for sql in deletes:
+        assert "SEARCH value_retention_rate USING INDEX idx_retention_ref_slope (ref=?)" in query_plan(connection, sql)
+
+    # top10 Views 的 JOIN 以索引查詢內層的資料表 (哪一張表在內層由 SQLite 決定)
+    join_searches = ("SEARCH rolex USING INDEX idx_rolex_ref",
+                     "SEARCH value_retention_rate USING INDEX idx_retention_ref_slope")
+    for view in ("top10_depreciation_data", "top10_appreciation_data"):
+        assert any(step.startswith(join_searches) for step in query_plan(connection, f"SELECT * FROM {view}"))
+
+
+def test_dataset_version_covers_derived_tables(database, tmp_path, monkeypatch):
+    import shutil
+
+    import _03_create_database
+    from _00_cache import read_dataset_version
+    from _03_create_database import build_database, update_database
+
+    # 增量更新與以相同資料完整重建的版本相同 (各型號的雜湊只重新計算有變動的型號, 不重新讀取衍生資料表)
+    df = make_clean_data()
+    df = df[df["reference number"] != "124060"]
+    df.loc[df.index[:10], "price"] += 100
+    updated = str(tmp_path / "updated.db")
+    shutil.copy(database, updated)
+    with monkeypatch.context() as patch:
+        patch.setattr(_03_create_database, "derived_tables", None)
+        update_database(df, updated)
+    rebuilt = str(tmp_path / "rebuilt.db")
+    build_database(df, rebuilt)
+    assert read_dataset_version(updated) == read_dataset_version(rebuilt)
+    assert read_dataset_version(updated) != read_dataset_version(database)
+    pd.testing.assert_frame_equal(read_table(updated, "dataset_digest"), read_table(rebuilt, "dataset_digest"))
+
+    # 舊版資料庫沒有各型號的雜湊時讀取衍生資料表計算一次
+    legacy = str(tmp_path / "legacy.db")
+    shutil.copy(database, legacy)
+    connection = sqlite3.connect(legacy)
+    connection.execute("DROP TABLE dataset_digest")
+    connection.commit()
+    connection.close()
+    update_database(df, legacy)
+    assert read_dataset_version(legacy) == read_dataset_version(rebuilt)
+
+    # 資料相同但衍生資料表不同 (折舊模型只比較 log_linear) 時版本不同
+    fit_references = _03_create_database.fit_references
+    monkeypatch.setattr(_03_create_database, "fit_references",
+                        lambda df, **kwargs: fit_references(df, models=["log_linear"], **kwargs))
+    other = str(tmp_path / "other.db")
+    build_database(make_clean_data(), other)
+    assert read_dataset_version(other) != read_dataset_version(database)
+
+
+def read_table(path, table):
+    """讀取整張資料表 (依所有欄位排序, 與資料列的寫入順序無關)"""
+    connection = sqlite3.connect(path)
+    n_columns = len(connection.execute(f"PRAGMA table_info({table})").fetchall())
+    order = ", ".join(str(i) for i in range(1, n_columns + 1))
+    df = pd.read_sql(f"SELECT * FROM {table} ORDER BY {order}", connection)
+    connection.close()
+    return df
+
+
+def test_incremental_update_matches_rebuild(database, tmp_path):
+    import shutil
+
+    from _03_create_database import build_database, reference_tables, update_database
+
+    # 價格變更、刪除一個型號、新增資料 (含新型號) 與重複一筆完全相同的資料
+    df = make_clean_data()
+    df.loc[df.index[:15], "price"] += 250
+    df = df[df["reference number"] != "228238"]
+    added = make_clean_data(rows_per_ref=20, seed=1)
+    added = added[added["reference number"] != "228238"]
+    added.loc[added["reference number"] == "15200", "reference number"] = "326934"
+    df = pd.concat([df, added, df.iloc[[3]]], ignore_index=True)
+
+    updated = str(tmp_path / "updated.db")
+    shutil.copy(database, updated)
+    upserted, deleted, refreshed = update_database(df, updated)
+    rebuilt = str(tmp_path / "rebuilt.db")
+    build_database(df, rebuilt)
+
+    # listing_id 由內容雜湊產生, 價格變更的 15 筆視為刪除舊資料再新增:
+    # 新增 15 + 100 + 1 筆重複, 刪除 15 + 228238 的 60 筆; 326934 以外的 5 個型號加上新型號
+    assert (upserted, deleted, refreshed) == (116, 75, 6)
+    rolex = read_table(updated, "rolex")
+    assert len(rolex) == len(df) and rolex["listing_id"].is_unique
+    pd.testing.assert_frame_equal(rolex, read_table(rebuilt, "rolex"))
+    for table in ["value_retention_rate", *reference_tables()]:
+        pd.testing.assert_frame_equal(read_table(updated, table), read_table(rebuilt, table), obj=table)
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from _01_datacleaner import SCOPE_MAPPING, RolexDataCleaner
+
+# 代表性與邊界情況的原始尺寸字串
+CASE_SIZES = [
+    "40 mm", "40mm", " 36 mm ", "41", "39.5 mm", "39,5 mm", "40.", "40.5.3 mm",
+    "40 x 47 mm", "40x47", "44 mm / 48 mm", "ca. 40 mm", "mm 40", "x40", "",
+    "   ", "abc", "13 mm", "14 mm", "60 mm", "60.1 mm", "61", "0", "1000 mm",
+    "40 mm", " 40 mm", "４０ mm", "+40 mm", "-40 mm", ",5 mm", ".5",
+    40, 40.0, 13.9, 65, np.nan, None,
+]
+
+
+@pytest.fixture
+def cleaner():
+    return RolexDataCleaner(None)
+
+
+def test_parse_case_sizes_matches_clean_case_size(cleaner):
+    series = pd.Series(CASE_SIZES, dtype=object)
+    expected = series.apply(cleaner.clean_case_size).astype(float)
+    result = cleaner.parse_case_sizes(series)
+    pd.testing.assert_series_equal(result, expected, check_names=False)
+
+
+def test_parse_case_sizes_keeps_index(cleaner):
+    series = pd.Series(["40 mm", None, "39,5"], index=[10, 5, 7])
+    result = cleaner.parse_case_sizes(series)
+    assert result.index.tolist() == [10, 5, 7]
+    assert result.loc[10] == 40.0
+    assert np.isnan(result.loc[5])
+    assert result.loc[7] == 39.5
+
+
+def test_parse_case_sizes_all_missing(cleaner):
+    result = cleaner.parse_case_sizes(pd.Series([np.nan, None], dtype=object))
+    assert result.isna().all()
+
+
+def test_parse_case_sizes_random_strings(cleaner):
+    # 隨機組合數字、分隔符號與文字, 與逐筆結果比較
+    rng = np.random.default_rng(0)
+    parts = np.array(["4", "0", "1", "5", "9", ".", ",", " ", "x", "mm", "ca", "/", "-"])
+    values = ["".join(rng.choice(parts, size=rng.integers(0, 7))) for _ in range(2000)]
+    series = pd.Series(values, dtype=object)
+    expected = series.apply(cleaner.clean_case_size).astype(float)
+    pd.testing.assert_series_equal(cleaner.parse_case_sizes(series), expected, check_names=False)
+
+
+def make_raw_data(n=1000, seed=0):
+    """
+    與原始爬蟲資料欄位相同的合成資料
+
+    材質與國家的比例設計在 1% 門檻附近: Platinum 在運費過濾前為 1.0% (保留),
+    過濾後不到 1%; Japan 在過濾前不到 1%, 過濾後超過 1% (保留)。
+
+    參數:
+        n: 筆數
+        seed: 亂數種子
+
+    回傳:
+        DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    material = rng.choice(["Steel", "Gold/Steel", "Yellow gold"], n).astype(object)
+    material[:10] = "Platinum"
+    material[10:12] = "Titanium"
+    country = rng.choice(["United States", "Germany", "Italy"], n).astype(object)
+    country[20:29] = "Japan"
+    shipping = rng.choice([0.0, 25.0, 150.0], n)
+    shipping[-120:] = 15000.0
+    shipping[:2] = 15000.0
+    shipping[-1] = np.nan
+    # 前段為數字、後段為字串的尺寸 (各分塊推斷的型別不同)
+    diameter = np.r_[rng.choice([36, 40, 41], n // 2).astype(object),
+                     rng.choice(["40 mm", "39,5 mm", "ca. 44 mm", "100 mm"], n - n // 2)]
+    return pd.DataFrame({
+        "model": rng.choice(["Submariner", "Datejust"], n),
+        "reference number": rng.choice(["116610LN", "126300", "15200"], n),
+        "price": rng.integers(5_000, 40_000, n),
+        "aditional shipping price": shipping,
+        "case material": material,
+        "case diameter": diameter,
+        "year of production": rng.choice([1890.0, 1990.0, 2015.0, 2021.0, 2030.0, np.nan], n),
+        "scope of delivery": rng.choice(list(SCOPE_MAPPING), n),
+        "location": np.char.add(country.astype(str), ", City"),
+    })
+
+
+def test_clean_all_chunked_matches_clean_all(tmp_path):
+    raw_path = tmp_path / "raw.csv"
+    make_raw_data().to_csv(raw_path, index=False)
+
+    expected_path = tmp_path / "expected.csv"
+    RolexDataCleaner(str(raw_path)).clean_all().save_data(str(expected_path))
+    chunked_path = tmp_path / "chunked.csv"
+    RolexDataCleaner(str(raw_path)).clean_all(chunksize=150, output_path=str(chunked_path))
+
+    expected = pd.read_csv(expected_path)
+    result = pd.read_csv(chunked_path)
+    pd.testing.assert_frame_equal(result, expected)
+    assert "Platinum" in set(expected["material_group"])
+    assert "Japan" in set(expected["country"])
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from _02_preprocess import IMPUTE_KEYS, IMPUTE_SPEC, DataPreprocessor, ListingTransformer
+
+
+@pytest.fixture
+def transformer():
+    return ListingTransformer({
+        'data_year': 2023,
+        'max_shipping': 12000,
+        'vocabularies': {},
+        'outlier_bounds': {'116610LN': [10000.0, 15000.0]},
+        'impute_keys': [],
+        'impute_maps': {},
+        'condition_mode': 'Used',
+        'label_encoders': {'condition': ['New', 'Used']},
+    })
+
+
+def test_transform_converts_prices_to_int(transformer):
+    row = transformer.transform({'reference number': '116610LN', 'price': 12500.9,
+                                 'aditional shipping price': 50.0, 'year of production': 2015})
+    # 同 process_all: 先計算 ship_total 再轉為整數
+    assert (row['price'], row['aditional shipping price'], row['ship_total']) == (12500, 50, 12550)
+    assert all(type(row[col]) is int for col in ['price', 'aditional shipping price', 'ship_total'])
+    assert row['age'] == 8
+    assert row['condition_encoded'] == 1
+    assert not row['over_max_shipping'] and not row['is_outlier']
+
+
+def test_transform_flags_max_shipping(transformer):
+    over = transformer.transform({'reference number': '116610LN', 'price': 12500,
+                                  'aditional shipping price': 12001})
+    missing = transformer.transform({'reference number': '116610LN', 'price': 12500})
+    assert over['over_max_shipping'] and missing['over_max_shipping']
+    assert np.isnan(missing['ship_total'])
+
+
+def test_transform_missing_price(transformer):
+    row = transformer.transform({'reference number': '116610LN', 'price': None,
+                                 'aditional shipping price': 50})
+    assert row['price'] is None
+    assert np.isnan(row['ship_total'])
+    assert not row['is_outlier']
+
+
+def test_transform_batch_drop_excluded(transformer):
+    listings = [
+        {'reference number': '116610LN', 'price': 12500, 'aditional shipping price': 50},
+        {'reference number': '116610LN', 'price': 12500, 'aditional shipping price': 20000},
+        {'reference number': '116610LN', 'price': 30000, 'aditional shipping price': 0},
+        {'reference number': '116610LN', 'price': None, 'aditional shipping price': 0},
+        {'reference number': None, 'price': 12500, 'aditional shipping price': 0},
+    ]
+    assert len(transformer.transform_batch(listings)) == 5
+
+    kept = transformer.transform_batch(listings, drop_excluded=True)
+    assert kept['ship_total'].tolist() == [12550]
+    assert kept['price'].dtype.kind == 'i'
+
+
+def baseline_impute(df):
+    """原本逐欄位的補值方式 (reference number → model, 中位數 / agg(lambda x: x.mode()[0]))"""
+    df = df.copy()
+    for col, stat in IMPUTE_SPEC.items():
+        for key in IMPUTE_KEYS:
+            if not df[col].isna().any():
+                break
+            grouped = df[df[col].notna()].groupby([key], observed=True)[col]
+            value_map = grouped.median() if stat == 'median' else grouped.agg(lambda x: x.mode()[0])
+            df[col] = df[col].fillna(df[key].map(value_map))
+    return df
+
+
+def make_impute_data():
+    """含同次數眾數、整組缺失的型號與 model、缺失的分組鍵"""
+    return pd.DataFrame({
+        'reference number': ['A', 'A', 'A', 'A', 'A', 'B', 'B', 'B', 'C', 'C', 'D', 'D', None, 'E'],
+        'model': ['M1', 'M1', 'M1', 'M1', 'M1', 'M1', 'M1', 'M1', 'M2', 'M2', 'M2', 'M2', 'M2', None],
+        'age': [3, np.nan, 5, 8, np.nan, np.nan, np.nan, np.nan, 1, 2, 4, np.nan, np.nan, 6],
+        'case diameter': [40, 41, np.nan, 41, 40, np.nan, 36, np.nan, np.nan, np.nan, 39, 39.5, np.nan, np.nan],
+        # A 的機芯 Manual / Automatic 同次數 (取排序最小的 Automatic), B 整組缺失改用 M1 的眾數
+        'movement': ['Manual', 'Automatic', None, 'Manual', 'Automatic', None, None, None,
+                     'Quartz', None, 'Automatic', 'Quartz', None, None],
+        # C 整組缺失, M2 的 Steel / Gold 同次數
+        'material_group': ['Steel', None, 'Gold', 'Gold', 'Steel', 'Other', None, 'Gold',
+                           None, None, 'Steel', 'Gold', None, None],
+    })
+
+
+@pytest.mark.parametrize('categorical', [False, True])
+def test_impute_hierarchical_matches_per_column_impute(categorical):
+    df = make_impute_data()
+    if categorical:
+        # load_data 套用 SCHEMA 後類別欄位為 category
+        df = df.astype({'movement': 'category', 'material_group': 'category'})
+    expected = baseline_impute(df)
+
+    preprocessor = DataPreprocessor(None)
+    preprocessor.df = df.copy()
+    result = preprocessor.impute_hierarchical().df
+    pd.testing.assert_frame_equal(result, expected)
+    assert result.loc[1, 'movement'] == 'Automatic'
+    # M1 的中位數包含 A 已補上的錶齡 (3, 5, 5, 8, 5)
+    assert result.loc[5, 'age'] == 5
+    # 型號與 model 都沒有資料時維持缺失
+    assert pd.isna(result.loc[13, 'movement'])
@@ -0,0 +1,152 @@
+import numpy as np
+
+from conftest import make_clean_data
+from _05_price_analysis import PriceAnalyzer
+
+
+def test_constant_age_reference_has_no_regression():
+    data = make_clean_data()
+    data.loc[data['reference number'] == '124060', 'age'] = 7
+    analyzer = PriceAnalyzer(data)
+
+    # 錶齡全部相同時不做迴歸 (linregress 會拋出例外)
+    assert analyzer.market('124060')['regression'] is None
+    result = analyzer.analyze('124060', 12000, 2016)
+    assert result['count'] == 60
+
+    summary = analyzer.reference_summary()
+    assert np.isnan(summary.loc['124060', 'slope'])
+    assert np.isfinite(summary.loc['116610LN', 'slope'])
+    assert analyzer.market('116610LN')['regression'] is not None
+
+
+def test_analyze_reads_reference_stats(database, tmp_path):
+    import shutil
+    import sqlite3
+
+    from _05_price_analysis import load_market_data
+
+    # 從資料庫建立與由市場資料計算的統計量相同
+    from_db = PriceAnalyzer.from_database(database)
+    from_data = PriceAnalyzer(load_market_data(database))
+    for ref in from_db.references:
+        expected = from_data.analyze(ref, 15000, 2015)
+        result = from_db.analyze(ref, 15000, 2015)
+        for key in ['count', 'percentile', 'rating', 'outlier', 'similar_trades']:
+            assert result[key] == expected[key]
+        np.testing.assert_allclose(list(result['stats'].values()), list(expected['stats'].values()), rtol=1e-12)
+
+    # Step 4、5、8 的統計量與百分位直接取自 reference_stats 資料表
+    path = str(tmp_path / "rolex.db")
+    shutil.copy(database, path)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("UPDATE reference_stats SET mean = 1, q1 = 20000, median = 30000, q3 = 40000 "
+                           "WHERE ref = '116610LN'")
+        connection.execute("UPDATE reference_stats SET prices = ? WHERE ref = '116610LN'",
+                           (np.arange(60, dtype=np.float64).tobytes(),))
+    connection.close()
+    result = PriceAnalyzer.from_database(path).analyze('116610LN', 15000, 2015)
+    assert result['stats']['mean'] == 1
+    assert result['score'] == 90
+    assert result['percentile'] == 100
+
+
+def test_similar_trades_use_comparable_index():
+    data = make_clean_data()
+    analyzer = PriceAnalyzer(data)
+
+    # analyze 的相似交易與 comparables 相同 (依價格與錶齡排序)
+    result = analyzer.analyze('116610LN', 20000, 2015, condition='Very good', has_box=1)
+    expected = analyzer.comparables('116610LN', 20000, 2015, condition='Very good', has_box=1)
+    assert result['similar_trades'] == expected
+    assert analyzer.analyze('116610LN', 20000, 2015)['similar_trades'] != expected
+
+    # 只比較價格時與 nsmallest 的排序相同
+    same_ref = data[data['reference number'] == '116610LN'].reset_index(drop=True)
+    nearest = (same_ref['price'] - 20000).abs().nsmallest(5)
+    analyzer = PriceAnalyzer(data, comparable_weights={'age': 0})
+    trades = analyzer.analyze('116610LN', 20000, 2015)['similar_trades']
+    assert [trade['price_diff'] for trade in trades] == nearest.tolist()
+    assert [trade['price'] for trade in trades] == same_ref['price'][nearest.index].tolist()
+    assert trades == analyzer.comparables('116610LN', 20000, None)
+
+
+def test_negative_intercept_warning_only_for_linear_model(capsys):
+    from _05_price_analysis import print_report
+
+    analyzer = PriceAnalyzer(make_clean_data())
+    result = analyzer.analyze('116610LN', 20000, 2015)
+    market = analyzer.market('116610LN')
+    retention = dict(result['retention'], intercept=-1000.0, retention_5y=None, extrapolated=False)
+
+    # 線性迴歸 (或沒有折舊模型) 的截距為負時才警告
+    for model, warned in [(None, True), ('linear', True), ('log_linear', False)]:
+        report = dict(result, retention=dict(retention, model=model, model_cv_error=0.1))
+        print_report(report, market)
+        assert ("新錶價格的預測為" in capsys.readouterr().out) == warned
+
+
+def test_analyze_batch_matches_analyze(tmp_path):
+    import pandas as pd
+
+    from _03_create_database import build_database
+
+    # 含折舊模型與 bootstrap 的資料庫; 124060 的錶齡全部相同 (沒有迴歸)
+    data = make_clean_data()
+    data.loc[data['reference number'] == '124060', 'age'] = 7
+    path = str(tmp_path / "rolex.db")
+    build_database(data, path)
+    analyzer = PriceAnalyzer.from_database(path)
+
+    rng = np.random.default_rng(0)
+    refs = list(analyzer.references)
+    offers = pd.DataFrame({
+        'reference number': rng.choice(refs, 60).tolist() + ['999999', refs[0], refs[1], '124060'],
+        'seller_price': np.r_[rng.uniform(5_000, 45_000, 60), 15000, np.nan, 15000, 15000],
+        'year': np.r_[rng.integers(1995, 2024, 60), 2015, 2015, np.nan, 2010],
+    })
+    result = analyzer.analyze_batch(offers)
+
+    for i, offer in offers.iterrows():
+        row = result.loc[i]
+        ref, price, year = offer['reference number'], offer['seller_price'], offer['year']
+        if ref not in analyzer:
+            assert not row['found'] and row['rating'] is None and row['verdict'] is None
+            assert np.isnan(row['percentile']) and np.isnan(row['price_5y'])
+            continue
+        if np.isnan(price):
+            # 報價缺失時不評估百分位、評級與異常值
+            assert row['found'] and np.isnan(row['percentile']) and np.isnan(row['score'])
+            assert row['rating'] is None and row['verdict'] is None
+            continue
+
+        # 年份缺失時只有保值率預測為空
+        expected = analyzer.analyze(ref, price, 2015 if np.isnan(year) else year)
+        assert row['percentile'] == expected['percentile']
+        assert row['rating'] == expected['rating']
+        assert row['verdict'] == expected['outlier']['verdict']
+        retention = expected['retention'] or {}
+        for key in ['price_now', 'price_5y', 'retention_5y']:
+            value = retention.get(key)
+            value = np.nan if value is None or np.isnan(year) else value
+            np.testing.assert_allclose(row[key], value, rtol=1e-12, err_msg=f"{key} row {i}")
+    assert np.isnan(result.loc[63, 'price_5y'])
+
+
+def test_retention_requires_positive_prices():
+    import pandas as pd
+
+    analyzer = PriceAnalyzer(make_clean_data())
+    # 目前價格下溢為 0、5 年後的價格為正: 保值率不應為 inf
+    analyzer.depreciation = pd.DataFrame(
+        {'model': ['log_linear'], 'cv_error': [0.1], 'params': [{'intercept': -2000.0, 'slope': 200.0}]},
+        index=['116610LN'],
+    )
+    retention = analyzer.analyze('116610LN', 20000, 2020)['retention']
+    assert retention['price_now'] == 0 and retention['price_5y'] > 0
+    assert retention['retention_5y'] is None
+
+    offers = pd.DataFrame({'reference number': ['116610LN'], 'seller_price': [20000.0], 'year': [2020]})
+    result = analyzer.analyze_batch(offers)
+    assert result.loc[0, 'price_5y'] > 0 and np.isnan(result.loc[0, 'retention_5y'])
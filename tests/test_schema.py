@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from _00_schema import apply_schema, widen_floats
+
+
+def test_integer_fallback_keeps_exact_values():
+    # 含缺失值或小數的整數欄位改用 float64, 大價格與小數價格不被改變
+    df = pd.DataFrame({
+        "price": [16_777_217.0, 12_500.5, np.nan],
+        "ship_total": [99_999_999.0, 123_456_789.0, np.nan],
+        "year of production": [2015.0, np.nan, 1990.0],
+        "case diameter": [39.7, 40.0, np.nan],
+    })
+    result = widen_floats(apply_schema(df))
+    assert result["price"].dtype == np.float64
+    pd.testing.assert_frame_equal(result, df)
+
+    # 只有 case diameter 為 float32, 沒有缺失值的整數欄位套用宣告的型別
+    compact = apply_schema(df.fillna(1))
+    assert compact["case diameter"].dtype == np.float32
+    assert compact["ship_total"].dtype == np.int32
+    assert compact["price"].dtype == np.float64
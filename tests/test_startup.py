@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 載入 _05_price_analysis 時不應載入的模組 (圖表只在 Step 11, scipy 只在 Step 9 的迴歸才使用)
+HEAVY_MODULES = ["matplotlib", "seaborn", "scipy.stats", "scipy.special"]
+
+# 文字報告 (含 Step 9 的迴歸) 也不應載入的模組
+PLOT_MODULES = ["matplotlib", "seaborn", "scipy.stats"]
+
+# _05_price_analysis 扣除 pandas / numpy 本身後的載入時間預算 (秒)
+# (pandas 與 numpy 的載入時間依機器而定, 只限制本專案增加的部分)
+IMPORT_OVERHEAD_BUDGET = 0.3
+
+
+def run_python(code, stdin=None, args=()):
+    """在新的 Python 程序中執行程式碼 (工作目錄為專案根目錄), 回傳 CompletedProcess"""
+    env = dict(os.environ, MPLBACKEND="Agg", PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, *args, "-c", code], input=stdin, cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def check_modules(modules):
+    """子程序結束前輸出已載入模組的程式碼"""
+    return f"print('loaded:' + ','.join(m for m in {modules!r} if m in sys.modules))"
+
+
+def loaded_modules(stdout):
+    """解析 check_modules 的輸出"""
+    line = [line for line in stdout.splitlines() if line.startswith("loaded:")][-1]
+    return [m for m in line[len("loaded:"):].split(",") if m]
+
+
+def import_rows(stderr):
+    """-X importtime 的輸出: (模組, 巢狀深度, 累計載入時間 (秒)) 的列表 (子模組排在上層模組之前)"""
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cumulative, name = line.split("|")
+            rows.append((name.strip(), len(name) - len(name.lstrip()), int(cumulative) / 1e6))
+    return rows
+
+
+def baseline_time(rows):
+    """pandas 與 numpy 的累計載入時間 (numpy 由 pandas 載入時已包含在 pandas 之中)"""
+    names = [name for name, _, _ in rows]
+    pandas, numpy = names.index("pandas"), names.index("numpy")
+    total = rows[pandas][2]
+    # 子模組排在上層模組之前, 且兩者之間的模組都比上層模組深
+    nested = numpy < pandas and all(depth > rows[pandas][1] for _, depth, _ in rows[numpy:pandas])
+    return total if nested else total + rows[numpy][2]
+
+
+def test_import_skips_heavy_modules():
+    # 取多次中最快的一次, 排除第一次讀檔 (磁碟快取) 的影響
+    overheads = []
+    for _ in range(3):
+        code = "import sys\nimport _05_price_analysis\n" + check_modules(HEAVY_MODULES)
+        result = run_python(code, args=("-X", "importtime"))
+        assert loaded_modules(result.stdout) == []
+
+        rows = import_rows(result.stderr)
+        assert rows[-1][0] == "_05_price_analysis"
+        overheads.append(rows[-1][2] - baseline_time(rows))
+    assert min(overheads) < IMPORT_OVERHEAD_BUDGET
+
+
+def test_text_report_skips_plot_modules(database):
+    import sqlite3
+
+    connection = sqlite3.connect(database)
+    ref = connection.execute("SELECT [reference number] FROM rolex LIMIT 1").fetchone()[0]
+    connection.close()
+
+    # 互動輸入型號、報價與年份, 以 --no-plot 輸出文字報告
+    code = (
+        "import sys\n"
+        "import _05_price_analysis\n"
+        f"_05_price_analysis.main(db_path={database!r}, plot=False)\n"
+        + check_modules(PLOT_MODULES)
+    )
+    result = run_python(code, stdin=f"{ref}\n15000\n2015\n")
+    assert "Step 7" in result.stdout
+    assert loaded_modules(result.stdout) == []
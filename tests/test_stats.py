@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from _00_stats import group_quantiles, linregress_from_moments, reference_moments
+from _02_preprocess import DataPreprocessor
+
+
+def make_prices(rows, n_refs, seed=0):
+    """合成的型號與價格 (同時包含整數與小數價格, 以及只有一筆資料的型號)"""
+    rng = np.random.default_rng(seed)
+    refs = rng.integers(0, n_refs, rows).astype(str)
+    prices = np.where(rng.random(rows) < 0.5,
+                      rng.integers(1_000, 90_000, rows),
+                      rng.lognormal(10, 0.5, rows))
+    df = pd.DataFrame({'reference number': refs, 'price': prices})
+    return pd.concat([df, pd.DataFrame({'reference number': ['single'], 'price': [12_345.5]})],
+                     ignore_index=True)
+
+
+def apply_remove_outliers(df, iqr_multiplier=1.5):
+    """原本逐型號 apply 的 remove_outliers"""
+    def filter_group(group):
+        Q1 = group['price'].quantile(0.25)
+        Q3 = group['price'].quantile(0.75)
+        IQR = Q3 - Q1
+        lower_bound = Q1 - iqr_multiplier * IQR
+        upper_bound = Q3 + iqr_multiplier * IQR
+        return group[(group['price'] >= lower_bound) & (group['price'] <= upper_bound)]
+
+    return df.groupby(['reference number'], observed=True).apply(filter_group).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("quantiles", [(0.25, 0.5, 0.75), (0.01, 0.1, 0.33, 0.9, 0.999)])
+def test_group_quantiles_matches_series_quantile(quantiles):
+    df = make_prices(5_000, 60)
+    codes, refs = pd.factorize(df['reference number'], sort=True)
+    result = group_quantiles(codes, df['price'].to_numpy(), len(refs), quantiles)
+
+    grouped = df.groupby('reference number')['price']
+    for q, values in zip(quantiles, result):
+        # 與逐群組的 Series.quantile 逐位元一致
+        expected = grouped.apply(lambda s: s.quantile(q)).reindex(refs).to_numpy()
+        np.testing.assert_array_equal(values, expected)
+        # groupby().quantile() 的內插寫法不同, 只差捨入誤差
+        np.testing.assert_allclose(values, grouped.quantile(q).reindex(refs).to_numpy(), rtol=1e-14)
+
+
+@pytest.mark.filterwarnings("ignore::FutureWarning")
+def test_remove_outliers_matches_apply():
+    df = make_prices(5_000, 60, seed=1)
+    expected = apply_remove_outliers(df)
+
+    preprocessor = DataPreprocessor(None)
+    preprocessor.df = df
+    result = preprocessor.remove_outliers().df
+    pd.testing.assert_frame_equal(result, expected)
+    assert len(result) < len(df)
+
+
+def make_listings(rows, n_refs, seed=0):
+    """合成的 (型號, 錶齡, 價格), 錶齡為整數年且含缺失值"""
+    rng = np.random.default_rng(seed)
+    age = rng.integers(0, 30, rows).astype(float)
+    price = rng.lognormal(10, 0.3, rows) * (1 - 0.01 * age)
+    age[rng.random(rows) < 0.02] = np.nan
+    return pd.DataFrame({
+        'reference number': rng.integers(0, n_refs, rows).astype(str),
+        'age': age,
+        'price': price,
+    })
+
+
+def test_linregress_from_moments_matches_scipy():
+    from scipy import stats
+
+    df = make_listings(5_000, 40).dropna(subset=['age'])
+    # 只有兩筆的型號 (linregress 的特例)
+    df = pd.concat([df, pd.DataFrame({'reference number': ['pair', 'pair'],
+                                      'age': [1.0, 4.0], 'price': [9_000.0, 8_000.0]})],
+                   ignore_index=True)
+    fit = linregress_from_moments(reference_moments(df))
+
+    for ref, group in df.groupby('reference number'):
+        expected = stats.linregress(group['age'], group['price'])
+        np.testing.assert_allclose(
+            fit.loc[ref, ['slope', 'intercept', 'r_value', 'p_value', 'std_err']].to_numpy(dtype=float),
+            [expected.slope, expected.intercept, expected.rvalue, expected.pvalue, expected.stderr],
+            rtol=1e-9, atol=1e-12,
+        )
+
+
+def test_reference_moments_counts_distinct_ages():
+    df = make_listings(5_000, 40, seed=2)
+    moments = reference_moments(df)
+
+    expected = df.groupby('reference number', sort=False)['age'].nunique()
+    pd.testing.assert_series_equal(moments['n_x'], expected.reindex(moments.index), check_names=False)
+
+    # 缺失的錶齡不計入前一個型號
+    df = pd.DataFrame({'reference number': ['a', 'a', 'b', 'b'],
+                       'age': [1.0, 2.0, np.nan, 3.0], 'price': [1.0, 2.0, 3.0, 4.0]})
+    assert reference_moments(df)['n_x'].tolist() == [2, 1]
+
+
+def test_stratified_sample_bins_continuous_values():
+    from _00_stats import quantile_bins, stratified_sample
+
+    # 連續的錶徑: 幾乎每筆資料的值都不同, 另有一段稀少的大錶徑
+    rng = np.random.default_rng(0)
+    x = np.r_[rng.normal(40, 2, 199_000), rng.uniform(55, 60, 1_000)]
+    x[::1000] = np.nan
+    df = pd.DataFrame({'case diameter': x, 'price': rng.lognormal(10, 0.5, len(x))})
+
+    sample = stratified_sample(df, 10_000, 'case diameter')
+    assert abs(len(sample) - 10_000) < 500
+
+    # 每個分位數區間依比例抽出; 只有 200 筆的缺失值層至少保留 50 筆
+    codes = quantile_bins(df['case diameter'].to_numpy())
+    expected = np.maximum(50, np.bincount(codes) * 10_000 / len(df))
+    counts = np.bincount(codes[sample.index], minlength=len(expected))
+    assert len(expected) == 101
+    assert (counts > expected / 2).all() and (counts < expected * 2).all()
+    assert (sample['case diameter'] > 55).sum() > 25
+
+
+def test_stratified_sample_keeps_small_categories():
+    from _00_stats import stratified_sample
+
+    # 類別欄位每個值各成一層, 稀少的層至少保留 min_per_group 筆 (期望值)
+    df = pd.DataFrame({'condition': ['Used'] * 99_900 + ['New'] * 100})
+    sample = stratified_sample(df, 1_000, 'condition', min_per_group=50)
+    assert 40 <= (sample['condition'] == 'New').sum() <= 60
+    assert 900 <= len(sample) <= 1_150
+
+
+def test_bootstrap_linregress_matches_resampled_linregress():
+    from _00_stats import bootstrap_linregress, linregress
+
+    df = make_listings(2_000, 40, seed=3).dropna(subset=['age'])
+    group = df[df['reference number'] == '7']
+    x, y = group['age'].to_numpy(), group['price'].to_numpy()
+    log_y = np.log(np.maximum(y, 1.0))
+
+    # 分批抽樣 (block_elements 小於 B × n) 的索引矩陣與一次抽出相同
+    n_boot, seed = 300, 11
+    index = np.random.default_rng(seed).integers(0, len(x), size=(n_boot, len(x)))
+    slope, intercept = bootstrap_linregress(x, np.vstack([y, log_y]), n_boot, seed, block_elements=40 * len(x))
+
+    for k, values in enumerate([y, log_y]):
+        expected = np.array([linregress(x[idx], values[idx])[:2] for idx in index])
+        np.testing.assert_allclose(slope[k], expected[:, 0], rtol=1e-9)
+        np.testing.assert_allclose(intercept[k], expected[:, 1], rtol=1e-9)
+
+    # 單一應變數與共用索引的多個應變數結果相同 (只差矩陣乘法的捨入誤差)
+    single = bootstrap_linregress(x, y, n_boot, seed)
+    np.testing.assert_allclose(single[0], slope[0], rtol=1e-12)
+    np.testing.assert_allclose(single[1], intercept[0], rtol=1e-12)
+
+
+def test_percentile_interval_ignores_nan():
+    from _00_stats import percentile_interval
+
+    draws = np.random.default_rng(0).normal(size=(3, 200))
+    draws[1, :20] = np.nan
+    draws[2] = np.nan
+    lower, upper = percentile_interval(draws, 0.9)
+    np.testing.assert_allclose(lower[:2], np.nanpercentile(draws[:2], 5, axis=1))
+    np.testing.assert_allclose(upper[:2], np.nanpercentile(draws[:2], 95, axis=1))
+    assert np.isnan(lower[2]) and np.isnan(upper[2])
+
+
+def test_retention_bootstrap_update_matches_rebuild():
+    from _03_create_database import compute_retention_bootstrap
+
+    df = make_listings(3_000, 12, seed=4).dropna(subset=['age'])
+    full = compute_retention_bootstrap(df, n_boot=200).sort_values('ref', ignore_index=True)
+
+    # 亂數種子由型號名稱決定: 資料順序與其他型號不影響結果 (列順序同型號出現的順序)
+    shuffled = compute_retention_bootstrap(df.sample(frac=1, random_state=0), n_boot=200)
+    pd.testing.assert_frame_equal(shuffled.sort_values('ref', ignore_index=True), full)
+
+    # 增量更新: 只重新計算有變動的型號, 與完整重建相同
+    changed = df.copy()
+    changed.loc[changed['reference number'] == '3', 'price'] *= 1.1
+    partial = compute_retention_bootstrap(changed[changed['reference number'] == '3'], n_boot=200)
+    updated = pd.concat([full[full['ref'] != '3'], partial]).sort_values('ref', ignore_index=True)
+    rebuilt = compute_retention_bootstrap(changed, n_boot=200).sort_values('ref', ignore_index=True)
+    pd.testing.assert_frame_equal(updated, rebuilt)
+    assert not full.set_index('ref')['draws'].equals(rebuilt.set_index('ref')['draws'])
+
+
+def test_bootstrap_intervals_match_draws():
+    from _03_create_database import compute_retention_bootstrap
+    from _05_price_analysis import bootstrap_intervals
+
+    df = make_listings(1_000, 2, seed=5).dropna(subset=['age'])
+    row = compute_retention_bootstrap(df, n_boot=200).iloc[0]
+    draws = np.frombuffer(row['draws'], dtype=np.float32).reshape(4, 200).astype(float)
+    slope, intercept, log_slope, log_intercept = draws
+    ages = np.array([0.0, 5.0, 12.0])
+
+    # 線性迴歸: 逐一錶齡代入每組重抽樣
+    intervals = bootstrap_intervals(draws, ages, 'linear')
+    for i, age in enumerate(ages):
+        price_now, price_5y = intercept + slope * age, intercept + slope * (age + 5)
+        np.testing.assert_allclose([b[i] for b in intervals['price_5y']],
+                                   np.percentile(price_5y, [2.5, 97.5]))
+        np.testing.assert_allclose([b[i] for b in intervals['retention_5y']],
+                                   np.nanpercentile(np.where(price_now > 0, price_5y / price_now * 100, np.nan),
+                                                    [2.5, 97.5]))
+    np.testing.assert_allclose(intervals['slope'][0], row['slope_lower'])
+
+    # log_linear: 5年保值率與錶齡無關
+    intervals = bootstrap_intervals(draws, ages, 'log_linear')
+    lower, upper = intervals['retention_5y']
+    np.testing.assert_allclose(lower, np.percentile(np.exp(log_slope * 5) * 100, 2.5))
+    np.testing.assert_allclose(upper, np.percentile(np.exp(log_slope * 5) * 100, 97.5))
+    np.testing.assert_allclose(intervals['price_5y'][1],
+                               np.percentile(np.exp(log_intercept + log_slope * (ages[:, None] + 5)), 97.5, axis=1))